@@ -1,47 +1,89 @@
-from flask import Blueprint, jsonify, request
-from . import dabopration
-from passlib.context import CryptContext
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from . import admin_jobs, dabopration, db_engine, password_hasher, profile_store, response_cache, user_media
+from models import db, AdminJob
+import json
 import shutil
 
 admin_bp = Blueprint('admin_bp', __name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+CORE_COLUMNS = ['id', 'name', 'email', 'password']
+SORTABLE_COLUMNS = {'id', 'name', 'email'}
+TABLE_DEFAULT_LIMIT = 50
+TABLE_MAX_LIMIT = 500
+STREAM_BATCH_SIZE = 200
 
-def get_json_path(username):
-    return dabopration.USER_file / str(username) / 'extended_profile.json'
+
+def _merge_rows(mysql_users):
+    """一批 MySQL 用户 + 批量读取的扩展资料 -> 表格行"""
+    profiles = profile_store.get_profiles([user['name'] for user in mysql_users])
+    rows = []
+    for user in mysql_users:
+        extra_data = profiles.get(str(user['name']), {})
+        combined_user = {**user, **extra_data}
+        combined_user['password'] = user['password'][:15] + "..." if user['password'] else ""
+        rows.append(combined_user)
+    return rows
 
 
 @admin_bp.route('/admin/get-table', methods=['GET'])
 def get_table_data():
+    """
+    分页 + 服务端排序：?page=1&limit=50&sort=name&order=asc
+    ?format=ndjson 时流式输出：第一行是 {"columns": [...], "total": N}，之后每行一个用户。
+    扩展字段列名来自 profile_store 的列登记表，不再每次扫描全部资料。
+    """
+    page = max(1, request.args.get('page', 1, type=int))
+    limit = max(1, min(request.args.get('limit', TABLE_DEFAULT_LIMIT, type=int), TABLE_MAX_LIMIT))
+    sort = request.args.get('sort', 'id')
+    order = 'DESC' if request.args.get('order', 'asc').lower() == 'desc' else 'ASC'
+    output_format = request.args.get('format', 'json')
+
+    # 排序列只能是白名单里的 MySQL 字段 (拼进 SQL，必须防注入)
+    if sort not in SORTABLE_COLUMNS:
+        return jsonify({'success': False, 'message': f'不支持按 [{sort}] 排序'}), 400
+
+    columns = CORE_COLUMNS + [c for c in profile_store.get_columns() if c not in CORE_COLUMNS]
+    select_sql = f"SELECT * FROM users ORDER BY {sort} {order}, id {order}"
+
+    if output_format == 'ndjson':
+        def generate():
+            # 生成器在请求 teardown 之后才执行：连接在这里借，不登记到请求上，用完自己还
+            conn = dabopration.get_db_connection(request_scoped=False)
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT COUNT(*) AS total FROM users")
+                total = cursor.fetchone()['total']
+                yield json.dumps({'columns': columns, 'total': total}, ensure_ascii=False, default=str) + '\n'
+
+                cursor.execute(select_sql)
+                while True:
+                    batch = cursor.fetchmany(STREAM_BATCH_SIZE)
+                    if not batch:
+                        break
+                    for row in _merge_rows(batch):
+                        yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+            finally:
+                cursor.close()
+                conn.close()
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
     conn = dabopration.get_db_connection()
     cursor = conn.cursor(dictionary=True) # 让查询结果变成字典形式
-
     try:
-        cursor.execute("SELECT * FROM users")
-        mysql_users = cursor.fetchall()
-
-        final_list = []
-        all_keys = set(['id', 'name', 'email', 'password']) # 记录所有出现的列名
-
-        for user in mysql_users:
-            username = user['name']
-            json_path = get_json_path(username)
-
-            extra_data = dabopration.read_json_safe(json_path, default_content={})
-
-            for k in extra_data.keys():
-                all_keys.add(k)
+        cursor.execute("SELECT COUNT(*) AS total FROM users")
+        total = cursor.fetchone()['total']
 
-            combined_user = {**user, **extra_data}
-            final_list.append(combined_user)
-
-        for u in final_list:
-            u['password'] = u['password'][:15] + "..." if u['password'] else ""
+        cursor.execute(select_sql + " LIMIT %s OFFSET %s", (limit, (page - 1) * limit))
+        final_list = _merge_rows(cursor.fetchall())
 
         return jsonify({
             'success': True,
-            'columns': list(all_keys), # 发送给前端用于生成表头
-            'rows': final_list
+            'columns': columns, # 发送给前端用于生成表头
+            'rows': final_list,
+            'total': total,
+            'page': page,
+            'limit': limit
         })
 
     except Exception as e:
@@ -52,6 +94,34 @@ def get_table_data():
         conn.close()
 
 
+@admin_bp.route('/admin/db-pool-stats', methods=['GET'])
+def get_db_pool_stats():
+    """连接池指标：等待时间、借出数、新建数、回收数，用来调 pool_size"""
+    return jsonify({'success': True, 'stats': dabopration.get_pool_stats()})
+
+
+@admin_bp.route('/admin/db-engine-stats', methods=['GET'])
+def get_db_engine_stats():
+    """SQLAlchemy 读 / 写引擎的连接池状态"""
+    return jsonify({'success': True, 'stats': db_engine.engine_info(db)})
+
+
+@admin_bp.route('/admin/password-hasher-stats', methods=['GET'])
+def get_password_hasher_stats():
+    """密码哈希进程池：排队 / 拒绝次数，排队时间与总耗时分位数"""
+    return jsonify({'success': True, 'stats': password_hasher.stats()})
+
+
+@admin_bp.route('/admin/profile-cache-stats', methods=['GET'])
+def get_profile_cache_stats():
+    return jsonify({'success': True, 'stats': profile_store.cache_stats()})
+
+
+@admin_bp.route('/admin/response-cache-stats', methods=['GET'])
+def get_response_cache_stats():
+    return jsonify({'success': True, 'stats': response_cache.stats()})
+
+
 @admin_bp.route('/admin/save-row', methods=['POST'])
 def save_row():
     """
@@ -79,26 +149,24 @@ def save_row():
             db_password = res[0]
             final_password = db_password
             if password and "..." not in password:
-                final_password = pwd_context.hash(password)
+                final_password = password_hasher.hash_password(password)
 
             update_sql = "UPDATE users SET email=%s, password=%s WHERE id=%s"
             cursor.execute(update_sql, (email, final_password, user_id))
             conn.commit()
 
-        json_path = get_json_path(name)
-
         # 从提交的数据中剔除 MySQL 固有字段，剩下的就是 JSON 字段
         json_data_to_save = {}
-        exclude_keys = ['id', 'name', 'email', 'password']
-
         for k, v in data.items():
-            if k not in exclude_keys:
+            if k not in CORE_COLUMNS:
                 json_data_to_save[k] = v
 
-        dabopration.write_json_safe(json_path, json_data_to_save)
+        profile_store.save_profile(name, json_data_to_save)
 
         return jsonify({'success': True, 'message': '保存成功'})
 
+    except password_hasher.HasherBusy:
+        return password_hasher.busy_response()
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
     finally:
@@ -125,6 +193,10 @@ def delete_row():
         if user_folder.exists():
             shutil.rmtree(user_folder)
 
+        # 3. 扩展资料 (db 后端的行、缓存) 和头像索引
+        profile_store.delete_profile(name)
+        user_media.index.refresh(name)
+
         return jsonify({'success': True, 'message': '用户已彻底删除'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -137,6 +209,7 @@ def delete_row():
 def add_column():
     """
     全员追加一个新属性（相当于 Excel 增加一列）
+    用户多时一个请求跑不完，这里只建后台任务，进度查 /admin/jobs/<id>
     """
     new_key = request.json.get('key')
     default_val = request.json.get('value', "")
@@ -144,49 +217,56 @@ def add_column():
     if not new_key:
         return jsonify({'success': False, 'message': '列名不能为空'}), 400
 
-    if dabopration.USER_file.exists():
-        for user_dir in dabopration.USER_file.iterdir():
-            if user_dir.is_dir():
-                json_path = user_dir / 'extended_profile.json'
-                data = dabopration.read_json_safe(json_path, {})
+    job_id = admin_jobs.enqueue('add_column', {'key': new_key, 'value': default_val})
 
-                if new_key not in data:
-                    data[new_key] = default_val
-                    dabopration.write_json_safe(json_path, data)
-
-    return jsonify({'success': True, 'message': f'列 [{new_key}] 已追加到所有用户'})
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'message': f'列 [{new_key}] 正在追加到所有用户 (任务 #{job_id})'
+    }), 202
 
 
 @admin_bp.route('/admin/delete-column', methods=['POST'])
 def delete_column_globally():
     """
     全员删除一个扩展属性
-    注意：这是高危操作，会从所有用户的 extended_profile.json 中移除该字段
+    注意：这是高危操作，会从所有用户的扩展资料中移除该字段 (后台任务执行)
     """
     key_to_delete = request.json.get('key')
 
     if not key_to_delete:
         return jsonify({'success': False, 'message': 'Key不能为空'}), 400
 
-
-    protected_keys = ['id', 'name', 'email', 'password']
-    if key_to_delete in protected_keys:
+    if key_to_delete in CORE_COLUMNS:
         return jsonify({'success': False, 'message': f'禁止删除核心数据库字段 [{key_to_delete}]'}), 403
 
-    count = 0
-
-    if dabopration.USER_file.exists():
-        for user_dir in dabopration.USER_file.iterdir():
-            if user_dir.is_dir():
-                json_path = user_dir / 'extended_profile.json'
-
-                data = dabopration.read_json_safe(json_path, {})
-                if key_to_delete in data:
-                    del data[key_to_delete]
-                    dabopration.write_json_safe(json_path, data)
-                    count += 1
+    job_id = admin_jobs.enqueue('delete_column', {'key': key_to_delete})
 
     return jsonify({
         'success': True,
-        'message': f'已从 {count} 个用户中移除属性 [{key_to_delete}]，表格列已销毁。'
-    })
+        'job_id': job_id,
+        'message': f'正在从所有用户中移除属性 [{key_to_delete}] (任务 #{job_id})'
+    }), 202
+
+
+@admin_bp.route('/admin/jobs', methods=['GET'])
+def list_jobs():
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    jobs = AdminJob.query.order_by(AdminJob.id.desc()).limit(limit).all()
+    return jsonify({'success': True, 'jobs': [job.to_dict() for job in jobs]})
+
+
+@admin_bp.route('/admin/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = db.session.get(AdminJob, job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+# 手动接着跑中断的任务 (正常情况下服务启动时会自动恢复)
+# 用法: flask --app mainServer admin_bp resume-jobs
+@admin_bp.cli.command('resume-jobs')
+def resume_jobs():
+    for job_id in admin_jobs.pending_job_ids():
+        admin_jobs.run_job(job_id)
@@ -0,0 +1,206 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from blueprint import profile_store
+
+# --- 全员资料批量任务 ---
+# /admin/add-column、/admin/delete-column 只负责建一条 AdminJob 记录并立即返回，
+# 真正的遍历在后台线程里做：用户名按字典序分批，每批用线程池并行改资料，
+# 每批结束后把进度 (processed / cursor / failures) 落库。
+# 进程崩溃后，心跳超时的任务会被重新认领，从 cursor 之后继续；单个用户的操作是幂等的，
+# 所以崩溃前那一批就算重复执行也没关系。
+
+BATCH_SIZE = 200
+BATCH_WORKERS = 8
+STALE_AFTER = timedelta(minutes=2)
+MAX_FAILURES_KEPT = 500
+
+_app = None
+_running = set()
+_running_lock = threading.Lock()
+
+
+def init_app(app):
+    global _app
+    _app = app
+    # 启动时接着跑上次没跑完的任务
+    threading.Thread(target=resume_pending, name='admin-jobs-resume', daemon=True).start()
+
+
+# --- 具体操作：返回该用户资料是否发生了变化 ---
+
+def _add_column(username, params):
+    key, value = params['key'], params.get('value', "")
+    if key in profile_store.get_profile(username):
+        return False
+    ok, _ = profile_store.update_profile(username, lambda data: data if key in data else {**data, key: value})
+    if not ok:
+        raise RuntimeError('写入失败')
+    return True
+
+
+def _delete_column(username, params):
+    key = params['key']
+    if key not in profile_store.get_profile(username):
+        return False
+    ok, _ = profile_store.update_profile(username, lambda data: {k: v for k, v in data.items() if k != key})
+    if not ok:
+        raise RuntimeError('写入失败')
+    return True
+
+
+def _finish_delete_column(params):
+    profile_store.unregister_column(params['key'])
+
+
+OPERATIONS = {
+    'add_column': _add_column,
+    'delete_column': _delete_column,
+}
+
+FINALIZERS = {
+    'delete_column': _finish_delete_column,
+}
+
+
+# --- 提交与认领 ---
+
+def enqueue(kind, params):
+    """建任务并在后台开始执行，返回 job id"""
+    from models import db, AdminJob
+
+    if kind not in OPERATIONS:
+        raise ValueError(f'unknown job kind: {kind}')
+    job = AdminJob(kind=kind, params=params, status='queued', failures={})
+    db.session.add(job)
+    db.session.commit()
+    _start(job.id)
+    return job.id
+
+
+def _start(job_id):
+    with _running_lock:
+        if job_id in _running:
+            return
+        _running.add(job_id)
+    threading.Thread(target=_run_in_context, args=(job_id,), name=f'admin-job-{job_id}', daemon=True).start()
+
+
+def _claim(job_id):
+    """原子地把任务置为 running；别的进程正在跑 (心跳没超时) 则返回 False"""
+    from models import db, AdminJob
+
+    now = datetime.now()
+    claimed = AdminJob.query.filter(
+        AdminJob.id == job_id,
+        (AdminJob.status == 'queued') |
+        ((AdminJob.status == 'running') & ((AdminJob.heartbeat.is_(None)) | (AdminJob.heartbeat < now - STALE_AFTER)))
+    ).update({'status': 'running', 'heartbeat': now}, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def pending_job_ids():
+    """排队中、或执行者已失联的任务"""
+    from models import AdminJob
+
+    with _app.app_context():
+        try:
+            stale = datetime.now() - STALE_AFTER
+            jobs = AdminJob.query.filter(
+                (AdminJob.status == 'queued') |
+                ((AdminJob.status == 'running') & ((AdminJob.heartbeat.is_(None)) | (AdminJob.heartbeat < stale)))
+            ).with_entities(AdminJob.id).all()
+        except Exception as e:
+            # 表还没建好等情况，不影响启动
+            print(f"[ADMIN JOB] resume skipped: {e}")
+            return []
+    return [job_id for (job_id,) in jobs]
+
+
+def resume_pending():
+    """在后台线程里接着跑所有待恢复的任务"""
+    for job_id in pending_job_ids():
+        _start(job_id)
+
+
+# --- 执行 ---
+
+def run_job(job_id):
+    """在当前线程里同步执行 (命令行用)"""
+    with _running_lock:
+        if job_id in _running:
+            return
+        _running.add(job_id)
+    _run_in_context(job_id)
+
+
+def _run_in_context(job_id):
+    try:
+        with _app.app_context():
+            _run(job_id)
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+
+
+def _apply_one(operation, username, params):
+    with _app.app_context():
+        return operation(username, params)
+
+
+def _run(job_id):
+    from models import db, AdminJob
+
+    if not _claim(job_id):
+        return
+
+    job = db.session.get(AdminJob, job_id)
+    operation = OPERATIONS[job.kind]
+    params = dict(job.params)
+
+    usernames = sorted(profile_store.list_usernames())
+    job.total = len(usernames)
+    if job.cursor:
+        usernames = [u for u in usernames if u > job.cursor]
+    db.session.commit()
+    print(f"[ADMIN JOB] #{job_id} {job.kind} {params} start, {len(usernames)} users left")
+
+    try:
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix=f'admin-job-{job_id}') as pool:
+            for start in range(0, len(usernames), BATCH_SIZE):
+                batch = usernames[start:start + BATCH_SIZE]
+                futures = [(u, pool.submit(_apply_one, operation, u, params)) for u in batch]
+
+                changed = 0
+                failures = dict(job.failures or {})
+                for username, future in futures:
+                    try:
+                        if future.result():
+                            changed += 1
+                        failures.pop(username, None)
+                    except Exception as e:
+                        if len(failures) < MAX_FAILURES_KEPT:
+                            failures[username] = str(e)
+
+                job.processed = min(job.total, (job.processed or 0) + len(batch))
+                job.changed = (job.changed or 0) + changed
+                job.cursor = batch[-1]
+                job.failures = failures
+                job.heartbeat = datetime.now()
+                db.session.commit()
+
+        finalizer = FINALIZERS.get(job.kind)
+        if finalizer:
+            finalizer(params)
+        job.status = 'done'
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(AdminJob, job_id)
+        job.status = 'failed'
+        job.failures = {**(job.failures or {}), '_job': str(e)}
+        print(f"[ADMIN JOB] #{job_id} failed: {e}")
+
+    job.finished_at = datetime.now()
+    db.session.commit()
+    print(f"[ADMIN JOB] #{job_id} {job.status}: {job.processed}/{job.total}, changed {job.changed}")
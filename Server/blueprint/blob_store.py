@@ -0,0 +1,242 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from blueprint import image_opt
+
+# --- Markdown 图片的内容寻址存储 ---
+# 上传的图片按内容 sha256 命名，分两级目录存放：
+#   uploads/blob/ab/cd/abcd...(64位).jpg   兜底格式 (jpg / png / gif)，正文里引用的就是它
+#   uploads/blob/ab/cd/abcd...(64位).webp  (.avif) 同一张图的其他格式，访问时按 Accept 挑选
+# 哈希按客户端上传的原始字节计算，存下来的是经过 image_opt 压缩、去元数据后的结果。
+# 同一张图粘贴到多篇草稿里只存一份，URL 也相同，浏览器缓存可以复用；
+# 文件名就是内容，写入后永不改变，可以按 immutable 长期缓存。
+#
+# 引用计数：保存文章时从 content_md 里提取 /uploads/... 图片路径写入 image_ref 表，
+#           删除文章时删掉对应行；某张图被几篇文章引用 = image_ref 里的行数。
+# 垃圾回收：flask --app mainServer mdpicture gc-images
+#           正文 (content_md 扫描 + image_ref 表) 和修订历史里都没有引用、且超过宽限期的图片才删；
+#           image_ref 只由保存文章维护，回收时只读不改，不会和并发的保存互相覆盖
+#           (修订历史里的图留着，恢复旧修订时才不会变成坏链；宽限期保护“刚上传、文章还没保存”的图)。
+#           老的 YYYY/MM/DD 图片同样参与回收。
+
+BLOB_DIRNAME = 'blob'
+TMP_DIRNAME = '.tmp'
+CHUNK_SIZE = 64 * 1024
+DEFAULT_GRACE_SECONDS = 24 * 3600
+
+# 正文里指向本站上传图片的链接，取 /uploads/ 之后的相对路径
+IMAGE_REF_RE = re.compile(r'/uploads/([\w./-]+?\.(?:png|jpe?g|gif|webp|avif))\b', re.IGNORECASE)
+
+
+def _shard_dir(root, digest):
+    return os.path.join(root, BLOB_DIRNAME, digest[:2], digest[2:4])
+
+
+def _find_existing(root, digest):
+    """同一内容之前传过就复用 (返回兜底格式的文件)"""
+    shard = _shard_dir(root, digest)
+    for ext in image_opt.FALLBACK_EXTENSIONS:
+        path = os.path.join(shard, f"{digest}.{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _new_tmp(root):
+    tmp_dir = os.path.join(root, BLOB_DIRNAME, TMP_DIRNAME)
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tempfile.mkstemp(dir=tmp_dir)
+
+
+def store(root, stream):
+    """
+    把上传流写入内容寻址存储，返回 (兜底文件相对 root 的路径, 是否新文件)。
+    边读边算 sha256，写到临时文件，不会把整张图读进内存；新图片经过 image_opt 处理后原子改名就位。
+    不是图片时抛 PIL.UnidentifiedImageError。
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = _new_tmp(root)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return _place(root, tmp_path, digest.hexdigest())
+
+
+def store_file(root, path):
+    """
+    和 store 一样，但内容已经是磁盘上的文件 (分片上传拼好的)，path 会被移走。
+    哈希按块读文件计算。
+    """
+    fd, tmp_path = _new_tmp(root)
+    os.close(fd)
+    shutil.move(path, tmp_path)
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return _place(root, tmp_path, digest.hexdigest())
+
+
+def _place(root, tmp_path, hexdigest):
+    """把临时目录里已算好哈希的上传文件放到最终位置 (或复用已有的)，tmp_path 最后总会被删掉"""
+    try:
+        existing = _find_existing(root, hexdigest)
+        if existing:
+            os.remove(tmp_path)
+            # 刷新 mtime (兜底文件和 webp / avif 都要)，避免正在跑的垃圾回收把它们当成过期的无引用图片删掉
+            os.utime(existing)
+            base = existing.rsplit('.', 1)[0]
+            for fmt, _ in image_opt.VARIANT_FORMATS:
+                try:
+                    os.utime(f"{base}.{fmt}")
+                except FileNotFoundError:
+                    pass   # 这张图没生成这种格式
+            return os.path.relpath(existing, root).replace(os.sep, '/'), False
+
+        # 各格式先在临时目录里生成，再逐个改名；兜底文件最后就位，它存在就说明其他格式也齐了
+        out_base = tmp_path + '_out'
+        fallback_ext = image_opt.optimize_upload(tmp_path, out_base)
+        shard = _shard_dir(root, hexdigest)
+        os.makedirs(shard, exist_ok=True)
+        for fmt, _ in image_opt.VARIANT_FORMATS:
+            if os.path.exists(f"{out_base}.{fmt}"):
+                os.replace(f"{out_base}.{fmt}", os.path.join(shard, f"{hexdigest}.{fmt}"))
+        target = os.path.join(shard, f"{hexdigest}.{fallback_ext}")
+        os.replace(f"{out_base}.{fallback_ext}", target)
+        return os.path.relpath(target, root).replace(os.sep, '/'), True
+    finally:
+        for leftover in [tmp_path] + [f"{tmp_path}_out.{e}" for e in ('jpg', 'png', 'gif', 'webp', 'avif')]:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def extract_refs(markdown):
+    """正文里引用的上传图片 (相对 uploads/ 的路径集合)"""
+    refs = set()
+    for path in IMAGE_REF_RE.findall(markdown or ''):
+        if '..' not in path.split('/'):
+            refs.add(path)
+    return refs
+
+
+def sync_refs(article_id, markdown):
+    """按正文重写某篇文章的引用 (调用方负责 commit)"""
+    from models import db, ImageRef
+
+    refs = extract_refs(markdown)
+    ImageRef.query.filter_by(article_id=article_id).delete(synchronize_session=False)
+    db.session.add_all(ImageRef(article_id=article_id, path=path) for path in refs)
+
+
+def revision_refs():
+    """修订历史里引用过的图片 (删除文章时修订一起删，这些图之后才能回收)"""
+    from blueprint import revisions
+
+    refs = set()
+    for _, text in revisions.iter_texts():
+        refs |= extract_refs(text)
+    return refs
+
+
+def missing_files(root, refs):
+    """refs 里磁盘上已经不存在的图片 (按字母序)"""
+    return sorted(path for path in refs if not os.path.exists(os.path.join(root, path)))
+
+
+def drop_refs(article_id):
+    """删除文章时调用 (调用方负责 commit)"""
+    from models import ImageRef
+    ImageRef.query.filter_by(article_id=article_id).delete(synchronize_session=False)
+
+
+def scan_refs(batch_size=200):
+    """扫描所有文章正文，返回引用到的图片路径集合 (不写 image_ref 表)"""
+    from models import db, Article
+
+    refs = set()
+    for (markdown,) in db.session.query(Article.content_md).yield_per(batch_size):
+        refs |= extract_refs(markdown)
+    return refs
+
+
+def _table_refs():
+    from models import db, ImageRef
+    return {path for (path,) in db.session.query(ImageRef.path).distinct()}
+
+
+def _stems(paths):
+    # 按去掉扩展名比较：引用了 x.jpg，同名的 x.webp / x.avif 也算被引用
+    return {path.rsplit('.', 1)[0] for path in paths}
+
+
+def _iter_files(root):
+    """uploads 下所有图片文件 (相对路径, 绝对路径)，跳过临时目录"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != TMP_DIRNAME]
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            yield os.path.relpath(full, root).replace(os.sep, '/'), full
+
+
+def collect_garbage(root, grace_seconds=DEFAULT_GRACE_SECONDS, dry_run=False):
+    """
+    删除没有被任何文章 (包括修订历史) 引用、且修改时间早于宽限期的图片。
+    返回 (删除的相对路径列表, 释放的字节数)。
+    """
+    from models import db
+
+    referenced = _stems(scan_refs() | _table_refs() | revision_refs())
+
+    cutoff = time.time() - grace_seconds
+    candidates = []
+    for rel, full in _iter_files(root):
+        if rel.rsplit('.', 1)[0] in referenced:
+            continue
+        try:
+            st = os.stat(full)
+        except FileNotFoundError:
+            continue
+        if st.st_mtime > cutoff:
+            continue
+        candidates.append((rel, full, st.st_size))
+
+    # 扫描期间可能有文章保存时引用了老图：删之前再读一次 image_ref，把刚加的引用排除掉
+    # (先结束当前读事务，否则 WAL 下读到的还是扫描开始时的快照)
+    db.session.rollback()
+    referenced = _stems(_table_refs())
+    removed, freed = [], 0
+    for rel, full, size in candidates:
+        if rel.rsplit('.', 1)[0] in referenced:
+            continue
+        if not dry_run:
+            try:
+                os.remove(full)
+            except FileNotFoundError:
+                continue
+        removed.append(rel)
+        freed += size
+
+    # 上传中断留下的临时文件
+    tmp_dir = os.path.join(root, BLOB_DIRNAME, TMP_DIRNAME)
+    if not dry_run and os.path.isdir(tmp_dir):
+        for name in os.listdir(tmp_dir):
+            full = os.path.join(tmp_dir, name)
+            if os.stat(full).st_mtime <= cutoff:
+                os.remove(full)
+
+    return removed, freed
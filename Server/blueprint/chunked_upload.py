@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from flask import current_app
+
+try:
+    import fcntl  # 仅 POSIX；没有时 (Windows 单进程开发) 不加进程间锁
+except ImportError:
+    fcntl = None
+
+# --- 分片 / 断点续传上传 ---
+# 整个文件放在一个 multipart 请求里传：Werkzeug 要先把请求体整个落盘，worker 一直被占着；
+# 手机网络一断就得从头再来。分片上传分三步 (路由见 upload_bp.py)：
+#   1. POST /upload-sessions                 建会话，返回 upload_id、chunk_size
+#   2. PUT  /upload-sessions/<id>?offset=N   请求体是原始字节，从第 N 字节开始，不超过 chunk_size；
+#                                            断线后 GET /upload-sessions/<id> 查 received，从那里接着传
+#   3. POST /upload-sessions/<id>/complete   收齐后放进正式存储
+# 会话放在本地磁盘 (默认 instance/upload_sessions/<id>/ 下的 meta.json 和 data)，
+# 已收到的字节数就是 data 的大小：进程重启、请求落到别的 worker 都能续传。
+#
+# 配置 (mainServer.py)：
+#   MAX_CONTENT_LENGTH     单个请求体上限 (Flask 自带，超过直接 413)，分片大小不会超过它
+#   UPLOAD_CHUNK_SIZE      分片大小
+#   UPLOAD_MAX_FILE_SIZE   分片上传的单个文件上限
+#   UPLOAD_SESSION_TTL     会话多少秒没有新数据就作废 (新建会话时顺手清理)
+#   UPLOAD_SESSION_DIR     会话目录，不填用 instance/upload_sessions
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_MAX_FILE_SIZE = 100 * 1024 * 1024
+DEFAULT_SESSION_TTL = 24 * 3600
+READ_SIZE = 64 * 1024
+
+META_FILENAME = 'meta.json'
+DATA_FILENAME = 'data'
+LOCK_FILENAME = 'lock'
+
+_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(Exception):
+    """status 是要返回的 HTTP 状态码；received 是当前已收到的字节数 (offset 对不上时告诉客户端)"""
+
+    def __init__(self, message, status=400, received=None):
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+
+def chunk_size():
+    size = current_app.config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    limit = current_app.config.get('MAX_CONTENT_LENGTH')
+    return min(size, limit) if limit else size
+
+
+def max_file_size():
+    return current_app.config.get('UPLOAD_MAX_FILE_SIZE', DEFAULT_MAX_FILE_SIZE)
+
+
+def _root():
+    return current_app.config.get('UPLOAD_SESSION_DIR') or \
+        os.path.join(current_app.instance_path, 'upload_sessions')
+
+
+def _session_dir(upload_id):
+    if not isinstance(upload_id, str) or not _ID_RE.match(upload_id):
+        raise UploadError('上传会话不存在', 404)
+    return os.path.join(_root(), upload_id)
+
+
+def data_path(upload_id):
+    return os.path.join(_session_dir(upload_id), DATA_FILENAME)
+
+
+@contextmanager
+def _locked(upload_id):
+    """同一个会话的写分片 / 完成互斥 (客户端重试时可能同时发来两个请求)"""
+    path = os.path.join(_session_dir(upload_id), LOCK_FILENAME)
+    try:
+        lock_file = open(path, 'a')
+    except FileNotFoundError:
+        raise UploadError('上传会话不存在', 404)
+    with lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create(user, kind, ext, size, sha256=None, extra=None):
+    """建一个上传会话，返回 meta (含 upload_id、已收到字节数)"""
+    if type(size) is not int or size <= 0:
+        raise UploadError('size 必须是正整数')
+    if size > max_file_size():
+        raise UploadError(f'文件不能超过 {max_file_size() // (1024 * 1024)} MB', 413)
+    if sha256 is not None and (not isinstance(sha256, str) or not _SHA256_RE.match(sha256.lower())):
+        raise UploadError('sha256 格式不对')
+
+    purge_expired()
+
+    upload_id = uuid.uuid4().hex
+    session_dir = _session_dir(upload_id)
+    os.makedirs(session_dir)
+    meta = {
+        'upload_id': upload_id,
+        'user': user,
+        'kind': kind,
+        'ext': ext,
+        'size': size,
+        'sha256': sha256.lower() if sha256 else None,
+        'extra': extra or {},
+        'created_at': time.time(),
+    }
+    with open(os.path.join(session_dir, META_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    open(os.path.join(session_dir, DATA_FILENAME), 'wb').close()
+    return dict(meta, received=0)
+
+
+def load(upload_id, user):
+    """读会话 meta (带 received)；不存在或不是这个用户的都当不存在"""
+    session_dir = _session_dir(upload_id)
+    try:
+        with open(os.path.join(session_dir, META_FILENAME), encoding='utf-8') as f:
+            meta = json.load(f)
+        meta['received'] = os.path.getsize(os.path.join(session_dir, DATA_FILENAME))
+    except (FileNotFoundError, ValueError):
+        raise UploadError('上传会话不存在', 404)
+    if meta['user'] != user:
+        raise UploadError('上传会话不存在', 404)
+    return meta
+
+
+def write_chunk(upload_id, user, offset, stream, chunk_sha256=None):
+    """
+    把请求体追加到 data 的 offset 处，返回新的已收到字节数。
+    offset 必须等于已收到的字节数 (顺序上传)；分片超长、校验和不对、传到一半断开时，
+    这一片整个作废 (截回 offset)，客户端从 offset 重传即可。
+    """
+    with _locked(upload_id):
+        meta = load(upload_id, user)
+        received = meta['received']
+        if offset != received:
+            raise UploadError('offset 与服务器已收到的字节数不一致', 409, received)
+
+        limit = min(chunk_size(), meta['size'] - received)
+        digest = hashlib.sha256()
+        written = 0
+        with open(data_path(upload_id), 'r+b') as out:
+            out.seek(received)
+            try:
+                while True:
+                    block = stream.read(READ_SIZE)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > limit:
+                        raise UploadError('分片超过大小限制', 413, received)
+                    digest.update(block)
+                    out.write(block)
+                if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+                    raise UploadError('分片校验和不一致', 400, received)
+            except BaseException:
+                out.truncate(received)
+                raise
+        return received + written
+
+
+@contextmanager
+def finish(upload_id, user):
+    """
+    检查是否收齐 (以及整体 sha256)，产出 (meta, data 文件路径)，调用方在 with 里把文件移走。
+    整个过程持有会话锁，退出 with 时 (成功失败都一样) 在锁里删掉会话：
+    同一个会话并发 / 重试的 complete 会等锁，等到时会话已经没了，返回 404，不会处理两次。
+    没传完、校验和不对时不进 with，会话保留。
+    """
+    with _locked(upload_id):
+        meta = load(upload_id, user)
+        if meta['received'] != meta['size']:
+            raise UploadError('文件还没有传完', 409, meta['received'])
+        path = data_path(upload_id)
+        if meta['sha256']:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(READ_SIZE), b''):
+                    digest.update(block)
+            if digest.hexdigest() != meta['sha256']:
+                raise UploadError('文件校验和不一致，请重新上传', 400)
+        try:
+            yield meta, path
+        finally:
+            discard(upload_id)
+
+
+def abort(upload_id, user):
+    """放弃上传；和写分片 / complete 互斥，不会在别的请求用着 data 时删掉它"""
+    with _locked(upload_id):
+        load(upload_id, user)
+        discard(upload_id)
+
+
+def discard(upload_id):
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+
+
+def purge_expired():
+    """删除 UPLOAD_SESSION_TTL 内没有新数据的会话"""
+    root = _root()
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - current_app.config.get('UPLOAD_SESSION_TTL', DEFAULT_SESSION_TTL)
+    for name in os.listdir(root):
+        session_dir = os.path.join(root, name)
+        try:
+            mtime = os.path.getmtime(os.path.join(session_dir, DATA_FILENAME))
+        except OSError:
+            try:
+                mtime = os.path.getmtime(session_dir)   # 刚建好、data 还没写出来
+            except OSError:
+                continue
+        if mtime <= cutoff:
+            shutil.rmtree(session_dir, ignore_errors=True)
@@ -1,8 +1,18 @@
 from pathlib import Path
 import mysql.connector
+import hashlib
 import json
 import os
-from flask import current_app
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context
+
+try:
+    import fcntl  # 仅 POSIX；Windows 开发环境下退化为进程内锁
+except ImportError:
+    fcntl = None
 
 current_script_path = Path(__file__).resolve()
 script_dir = current_script_path.parent
@@ -23,18 +33,274 @@ def copy_file(src, dest):
     except FileNotFoundError:
         print(f"Error: Source file not found {src}")
 
+# --- 优化点 1: 数据库配置缓存 + 连接池 ---
+# db_config.json 里除了 mysql.connector.connect 的参数外，还可以加这些池参数：
+#   pool_size            池内最大连接数 (默认 5)
+#   pool_wait_timeout    池满时借连接最多等多少秒 (默认 10)
+#   pool_idle_timeout    空闲多少秒后被回收 (默认 300)
+#   pool_max_lifetime    一条连接最多复用多少秒 (默认 3600)
+POOL_OPTION_DEFAULTS = {
+    'pool_size': 5,
+    'pool_wait_timeout': 10,
+    'pool_idle_timeout': 300,
+    'pool_max_lifetime': 3600,
+}
+
+_config_lock = threading.Lock()
+_config_cache = {'mtime': None, 'config': None}
+
+
 def get_db_config():
-    with open(DB_CONFIG_PATH, 'r') as f:
-        return json.load(f)
+    """读取 db_config.json，只有文件 mtime 变化时才重新解析"""
+    mtime = os.path.getmtime(DB_CONFIG_PATH)
+    with _config_lock:
+        if _config_cache['config'] is None or _config_cache['mtime'] != mtime:
+            with open(DB_CONFIG_PATH, 'r') as f:
+                _config_cache['config'] = json.load(f)
+            _config_cache['mtime'] = mtime
+        return dict(_config_cache['config'])
+
+
+def split_pool_options(config):
+    """把池参数从连接参数里拆出来，返回 (connect_args, pool_options)"""
+    connect_args = dict(config)
+    pool_options = dict(POOL_OPTION_DEFAULTS)
+    for key in POOL_OPTION_DEFAULTS:
+        if key in connect_args:
+            pool_options[key] = connect_args.pop(key)
+    return connect_args, pool_options
+
+
+class PoolExhaustedError(Exception):
+    """池内连接全部被借出，并且等待超时"""
+
+
+class PooledConnection:
+    """
+    包一层真实连接：close() 不会断开，而是还回池里。
+    其他属性 (cursor/commit/rollback...) 直接转发给真实连接，老代码无需修改。
+    """
+
+    def __init__(self, pool, raw_conn):
+        self._pool = pool
+        self._raw = raw_conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    @property
+    def released(self):
+        return self._released
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._raw)
+
+
+class ConnectionPool:
+    def __init__(self, connect_args, size=5, wait_timeout=10, idle_timeout=300, max_lifetime=3600):
+        self.connect_args = connect_args
+        self.size = max(1, int(size))
+        self.wait_timeout = float(wait_timeout)
+        self.idle_timeout = float(idle_timeout)
+        self.max_lifetime = float(max_lifetime)
+
+        self._cond = threading.Condition()
+        self._idle = []        # [(raw_conn, created_at, last_used)]
+        self._born = {}        # id(raw_conn) -> created_at
+        self._in_use = 0
+        self._closed = False
+
+        self._stats = {
+            'created': 0,
+            'recycled': 0,
+            'checkouts': 0,
+            'timeouts': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        }
+
+    # --- 内部工具 ---
+    def _total(self):
+        return self._in_use + len(self._idle)
+
+    def _discard(self, raw_conn):
+        """彻底关闭一条连接，计入 recycled (调用方需持有锁或已把连接移出池)"""
+        self._born.pop(id(raw_conn), None)
+        self._stats['recycled'] += 1
+        try:
+            raw_conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, now):
+        """回收空闲太久或寿命到期的连接"""
+        keep = []
+        for raw_conn, created_at, last_used in self._idle:
+            if now - last_used > self.idle_timeout or now - created_at > self.max_lifetime:
+                self._discard(raw_conn)
+            else:
+                keep.append((raw_conn, created_at, last_used))
+        self._idle = keep
+
+    @staticmethod
+    def _is_healthy(raw_conn):
+        try:
+            raw_conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
 
-# --- 优化点 1: 数据库连接池/按需连接 ---
-def get_db_connection():
-    """每次请求调用此函数获取连接，避免全局连接超时"""
+    def _create(self):
+        raw_conn = mysql.connector.connect(**self.connect_args)
+        with self._cond:
+            self._born[id(raw_conn)] = time.monotonic()
+            self._stats['created'] += 1
+        return raw_conn
+
+    # --- 对外接口 ---
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.wait_timeout
+
+        while True:
+            candidate = None
+            with self._cond:
+                if self._closed:
+                    raise PoolExhaustedError('连接池已关闭')
+                self._evict_idle(time.monotonic())
+
+                while not self._idle and self._total() >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolExhaustedError(f'等待数据库连接超时 ({self.wait_timeout}s)')
+                    self._cond.wait(remaining)
+                    self._evict_idle(time.monotonic())
+
+                # 先占住名额，再在锁外做健康检查/建连，避免握手期间堵住其他线程
+                self._in_use += 1
+                if self._idle:
+                    candidate = self._idle.pop()[0]
+
+            try:
+                if candidate is not None and not self._is_healthy(candidate):
+                    with self._cond:
+                        self._discard(candidate)
+                    candidate = None
+                if candidate is None:
+                    candidate = self._create()
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._stats['checkouts'] += 1
+                self._stats['wait_total'] += waited
+                self._stats['wait_max'] = max(self._stats['wait_max'], waited)
+            return PooledConnection(self, candidate)
+
+    def release(self, raw_conn):
+        # 还回去之前清掉未提交的事务，防止下一个借用者看到脏状态
+        healthy = True
+        try:
+            raw_conn.rollback()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            now = time.monotonic()
+            created_at = self._born.get(id(raw_conn), now)
+            if self._closed or not healthy or now - created_at > self.max_lifetime:
+                self._discard(raw_conn)
+            else:
+                self._idle.append((raw_conn, created_at, now))
+            self._cond.notify()
+
+    def close(self):
+        """关闭空闲连接；已借出的连接在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            for raw_conn, _, _ in self._idle:
+                self._discard(raw_conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self._stats['created'],
+                'recycled': self._stats['recycled'],
+                'checkouts': checkouts,
+                'timeouts': self._stats['timeouts'],
+                'wait_avg_ms': round(self._stats['wait_total'] / checkouts * 1000, 3) if checkouts else 0.0,
+                'wait_max_ms': round(self._stats['wait_max'] * 1000, 3),
+            }
+
+
+_pool_lock = threading.Lock()
+_pool_state = {'pool': None, 'config': None}
+
+
+def get_pool():
+    """返回当前连接池；db_config.json 改动后自动用新配置重建"""
     config = get_db_config()
-    # 建议在 db_config.json 中添加 pool_name 等配置以启用连接池，这里使用基础连接
-    conn = mysql.connector.connect(**config)
+    with _pool_lock:
+        if _pool_state['pool'] is None or _pool_state['config'] != config:
+            old_pool = _pool_state['pool']
+            connect_args, options = split_pool_options(config)
+            _pool_state['pool'] = ConnectionPool(
+                connect_args,
+                size=options['pool_size'],
+                wait_timeout=options['pool_wait_timeout'],
+                idle_timeout=options['pool_idle_timeout'],
+                max_lifetime=options['pool_max_lifetime'],
+            )
+            _pool_state['config'] = config
+            if old_pool is not None:
+                old_pool.close()
+        return _pool_state['pool']
+
+
+def get_pool_stats():
+    pool = _pool_state['pool']
+    if pool is None:
+        return {}
+    return pool.stats()
+
+
+def get_db_connection(request_scoped=True):
+    """
+    从连接池借一条连接。调用方照旧 conn.close()，实际是还回池里。
+    在请求上下文里借出的连接会登记到 g，请求结束时 teardown 兜底归还，防止异常路径漏还。
+    流式响应的生成器在 teardown 之后才跑，要传 request_scoped=False，自己在 finally 里 close。
+    """
+    conn = get_pool().acquire()
+    if request_scoped and has_app_context():
+        g.setdefault('_db_connections', []).append(conn)
     return conn
 
+
+def release_request_connections(exc=None):
+    for conn in g.pop('_db_connections', []):
+        if not conn.released:
+            conn.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(release_request_connections)
+
 # --- 优化点 2: 健壮的 JSON 读写工具 (实现防报错的核心) ---
 
 def read_json_safe(file_path, default_content=None):
@@ -53,20 +319,169 @@ def read_json_safe(file_path, default_content=None):
     except (json.JSONDecodeError, IOError):
         return default_content
 
+# --- 优化点 3: 原子写入 + 文件锁 + CAS 更新 ---
+# 写入先落到同目录临时文件，fsync 后 os.replace 覆盖，读者永远看不到写了一半的文件。
+# 锁加在旁边的 <文件名>.lock 上 (目标文件会被 rename 替换，锁不能加在它身上)，
+# 用 fcntl.flock 跨进程互斥 (gunicorn 多 worker)，同进程内再配一把线程锁。
+# 锁只在“比对版本 + 写入”这一小段时间内持有，而且是按文件加锁，不会让整个进程排队。
+
+class JsonConflictError(Exception):
+    """CAS 更新重试多次仍然冲突"""
+
+
+_path_locks = {}   # path -> [线程锁, 持有或等待的线程数]；数到 0 就删掉，不会随文件数无限增长
+_path_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _thread_lock_for(path):
+    with _path_locks_guard:
+        entry = _path_locks.get(path)
+        if entry is None:
+            entry = _path_locks[path] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _path_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _path_locks[path]
+
+
+@contextmanager
+def json_file_lock(file_path):
+    """对单个 JSON 文件加排他锁 (进程内 + 进程间)"""
+    path = os.path.abspath(file_path)
+    with _thread_lock_for(path):
+        if fcntl is None:
+            yield
+            return
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _atomic_write(file_path, data):
+    """返回写入内容的版本号 (和 read_json_versioned 的算法一致)"""
+    path = os.path.abspath(file_path)
+    directory = os.path.dirname(path)
+    raw = json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # rename 本身也要落盘，否则断电后可能回到旧文件
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _read_raw(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def read_json_versioned(file_path, default_content=None):
+    """
+    读取 JSON 并返回 (data, version)。version 是文件内容的哈希，文件不存在时为 None。
+    配合 compare_and_swap_json 做乐观并发更新。
+    """
+    if default_content is None:
+        default_content = {}
+    raw = _read_raw(file_path)
+    if raw is None:
+        return default_content, None
+    version = hashlib.sha1(raw).hexdigest()
+    try:
+        return json.loads(raw.decode('utf-8')), version
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return default_content, version
+
+
+# 写入成功后的回调 (比如 profile_store 用来让缓存失效)
+_json_write_listeners = []
+
+
+def add_json_write_listener(callback):
+    """注册 callback(file_path)，每次 JSON 写入成功后调用"""
+    _json_write_listeners.append(callback)
+
+
+def _notify_written(file_path):
+    for callback in _json_write_listeners:
+        callback(file_path)
+
+
 def write_json_safe(file_path, data):
     """
-    安全写入 JSON。
+    安全写入 JSON (原子替换，加文件锁)。
     """
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        return True
+        with json_file_lock(file_path):
+            _atomic_write(file_path, data)
     except Exception as e:
         print(f"Write JSON Error: {e}")
         return False
 
+    _notify_written(file_path)
+    return True
+
+
+def compare_and_swap_json(file_path, expected_version, data):
+    """
+    只有文件当前版本仍是 expected_version 时才写入 (None 表示期望文件不存在)。
+    返回 (是否写入, 当前版本)：写入成功时是新内容的版本，可以直接拿来做下一次 CAS。
+    """
+    with json_file_lock(file_path):
+        raw = _read_raw(file_path)
+        current = hashlib.sha1(raw).hexdigest() if raw is not None else None
+        if current != expected_version:
+            return False, current
+        new_version = _atomic_write(file_path, data)
+    _notify_written(file_path)
+    return True, new_version
+
+
+def update_json(file_path, transform, retries=10):
+    """
+    读-改-写的安全版本：transform(旧数据) 返回新数据，冲突时重新读取再试。
+    transform 可能被调用多次，不要有副作用。
+    返回写入的新数据；重试耗尽抛 JsonConflictError。
+    """
+    for _ in range(retries):
+        data, version = read_json_versioned(file_path)
+        new_data = transform(data)
+        ok, _ = compare_and_swap_json(file_path, version, new_data)
+        if ok:
+            return new_data
+    raise JsonConflictError(f'JSON 更新冲突: {file_path}')
+
+
 def update_json_key(file_path, key, value):
     """更新单个键值，如果文件不存在会自动创建"""
-    data = read_json_safe(file_path)
-    data[key] = value
-    return write_json_safe(file_path, data)
+    try:
+        update_json(file_path, lambda data: {**data, key: value})
+        return True
+    except Exception as e:
+        print(f"Update JSON Error: {e}")
+        return False
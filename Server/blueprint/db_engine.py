@@ -0,0 +1,137 @@
+import sqlalchemy as sa
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# --- 数据库引擎配置：读写分离 + SQLite 调优 ---
+# 配置 (app.config，需在 db.init_app 之前调用 configure)：
+#   DATABASE_URL         写库，默认 sqlite:///blog.db (相对 instance 目录)；
+#                        也可以是 mysql+mysqlconnector://... / postgresql://...
+#   DATABASE_READ_URL    读库。不填时：SQLite 另开一个只读连接池指向同一个文件，
+#                        其他数据库不做读写分离；填了 (比如 MySQL 只读副本) 就用它
+#   DATABASE_READ_POOL_SIZE   读连接池大小，默认 8
+#   SQLITE_PRAGMAS       覆盖 / 追加下面的 SQLITE_PRAGMA_DEFAULTS
+#
+# SQLite 下：
+#   - 开 WAL：读不阻塞写、写不阻塞读 (/read-article 之类的写操作不再把列表查询卡住)
+#   - 写连接池只有 1 个连接：写操作在 Python 里排队，而不是在 SQLite 里抢锁报 "database is locked"
+#   - 读连接池多个连接，并设 query_only 防止误写
+#
+# 路由规则 (RoutingSession.get_bind)：
+#   普通 SELECT 走读库；INSERT/UPDATE/DELETE、flush、SELECT ... FOR UPDATE 走写库；
+#   一个事务里写过之后，直到 commit / rollback 前的读也都走写库 (读到自己刚写的数据)。
+
+READ_BIND_KEY = '__read__'
+WROTE_KEY = 'wrote'
+
+SQLITE_PRAGMA_DEFAULTS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',     # WAL 下 NORMAL 足够安全，断电最多丢最后几个事务
+    'cache_size': -64000,        # 负数单位是 KB，约 64MB 页缓存
+    'mmap_size': 268435456,      # 256MB 内存映射读
+    'busy_timeout': 5000,        # 毫秒，偶发锁冲突时等待而不是立即报错
+    'temp_store': 'MEMORY',
+}
+
+DEFAULT_READ_POOL_SIZE = 8
+WRITER_POOL_TIMEOUT = 30
+
+
+def _is_sqlite(url):
+    return url.startswith('sqlite')
+
+
+def configure(app):
+    """根据 DATABASE_URL / DATABASE_READ_URL 填好 Flask-SQLAlchemy 的配置"""
+    url = app.config.get('DATABASE_URL', 'sqlite:///blog.db')
+    read_url = app.config.get('DATABASE_READ_URL')
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if _is_sqlite(url):
+        # 单写连接，排队等待；超时说明有写事务卡住了
+        engine_options.setdefault('pool_size', 1)
+        engine_options.setdefault('max_overflow', 0)
+        engine_options.setdefault('pool_timeout', WRITER_POOL_TIMEOUT)
+        if read_url is None:
+            read_url = url
+    else:
+        engine_options.setdefault('pool_pre_ping', True)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
+    if read_url:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[READ_BIND_KEY] = {
+            'url': read_url,
+            'pool_size': app.config.get('DATABASE_READ_POOL_SIZE', DEFAULT_READ_POOL_SIZE),
+            'max_overflow': 0,
+            'pool_pre_ping': not _is_sqlite(read_url),
+        }
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def _pragma_listener(pragmas, read_only):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                if read_only and name == 'journal_mode':
+                    continue  # WAL 是写在文件里的，由写连接设置
+                cursor.execute(f"PRAGMA {name}={value}")
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+def init_app(app, db):
+    """db.init_app 之后调用：给 SQLite 连接挂上 PRAGMA"""
+    pragmas = {**SQLITE_PRAGMA_DEFAULTS, **(app.config.get('SQLITE_PRAGMAS') or {})}
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', _pragma_listener(pragmas, read_only=(key == READ_BIND_KEY)))
+
+
+def engine_info(db):
+    """各引擎的连接池状态，给管理接口看"""
+    result = {}
+    for key, engine in db.engines.items():
+        name = 'read' if key == READ_BIND_KEY else 'write'
+        result[name] = {'url': engine.url.render_as_string(hide_password=True), 'pool': engine.pool.status()}
+    return result
+
+
+class RoutingSession(Session):
+    """在 Flask-SQLAlchemy 的 Session 基础上把只读查询分到读库"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+        plain_read = isinstance(clause, sa.Select) and clause._for_update_arg is None
+        if plain_read and not self._flushing and not self.info.get(WROTE_KEY):
+            reader = self._db.engines.get(READ_BIND_KEY)
+            if reader is not None:
+                return reader
+        if not plain_read:
+            # 写操作、加锁读 (或 text() 等无法判断的语句)：本事务剩下的读也走写库
+            self.info[WROTE_KEY] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        try:
+            super().commit()
+        finally:
+            self.info.pop(WROTE_KEY, None)
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self.info.pop(WROTE_KEY, None)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.info.pop(WROTE_KEY, None)
@@ -1,7 +1,9 @@
 import code
 import os
-from flask import Blueprint, jsonify, make_response, request, session, send_file
-from blueprint import dabopration
+import tempfile
+from flask import Blueprint, jsonify, make_response, request, session
+from PIL import UnidentifiedImageError
+from blueprint import dabopration, http_cache, image_opt, media, profile_store, response_cache, user_media
 from models import db, BlogUser
 inf_bp = Blueprint('information', __name__)
 
@@ -33,22 +35,29 @@ def logout():
     response.set_cookie('username', '', expires=0, httponly=True, secure=True)
     return response
 
+def _avatar(username, size):
+    """优先用最接近 size 的预生成小图，没有 (老用户) 就用 person.jpg"""
+    if size:
+        picked = image_opt.pick_avatar_size(size)
+        if picked:
+            resolved = media.user_image(username, f"{image_opt.avatar_name(picked)}.jpg")
+            if resolved:
+                return resolved
+    return media.user_image(username, 'person.jpg')
+
+
 @inf_bp.route('/get-photo', methods=['GET'])
 def get_photo():
+    # 可选参数 ?size=48，返回对应尺寸的正方形头像
     try:
-        if 'user' not in session:
-             default_image = os.path.join(dabopration.DB_CONFIG_PATH.parent / 'person_img' , 'none.jpg')
-             return send_file(default_image, mimetype='image/jpeg')
-
-        username = session['user']
-        user_folder = dabopration.USER_file / str(username) /'img'
-        default_image = os.path.join(dabopration.DB_CONFIG_PATH.parent / 'person_img' , 'none.jpg')
-        user_image = os.path.join(user_folder, "person.jpg")
-
-        if os.path.exists(user_image):
-            return send_file(user_image, mimetype='image/jpeg')
-        else:
-            return send_file(default_image, mimetype='image/jpeg')
+        resolved = None
+        if 'user' in session:
+            resolved = _avatar(session['user'], request.args.get('size', type=int))
+        resolved = resolved or media.default_image('none.jpg')
+        if resolved is None:
+            return "Default image not found", 404
+        # 跟登录状态有关，只允许浏览器私有缓存
+        return media.send_negotiated(resolved, cache_control=media.CACHE_PRIVATE, sniff=True)
     except Exception as e:
         print(f"Error getting photo: {e}")
         return jsonify({'error': 'Internal Server Error'}), 500
@@ -56,24 +65,85 @@ def get_photo():
 @inf_bp.route('/get-author-avatar/<username>', methods=['GET'])
 def get_author_avatar(username):
     try:
-        # username = secure_filename(username)
-        user_folder = dabopration.USER_file / str(username) / 'img'
-        user_image = user_folder / "person.jpg"
-        default_image = dabopration.DB_CONFIG_PATH.parent / 'person_img' / 'none.jpg'
-
-        if user_image.exists():
-            return send_file(user_image, mimetype='image/jpeg')
-        else:
-            if os.path.exists(default_image):
-                return send_file(default_image, mimetype='image/jpeg')
-            else:
-                return "Default image not found", 404
+        resolved = _avatar(username, request.args.get('size', type=int)) or media.default_image('none.jpg')
+        if resolved is None:
+            return "Default image not found", 404
+        return media.send_negotiated(resolved, cache_control=media.CACHE_REVALIDATE, sniff=True)
 
     except Exception as e:
         print(f"Get avatar error: {e}")
         return jsonify({'error': 'Image Error'}), 500
 
 
+# --- 批量获取头像 / 背景 URL ---
+# 列表页一次性拿到所有卡片的图片地址，不用每张卡片各请求两次:
+#   GET  /user-media?usernames=alice,bob&size=48
+#   POST /user-media  {"usernames": ["alice", "bob"], "size": 48}
+# 返回的 URL 带内容哈希 (?v=...)，内容变了 URL 就变，可以长期缓存。
+USER_MEDIA_MAX_BATCH = 100
+
+
+@inf_bp.route('/user-media', methods=['GET', 'POST'])
+def get_user_media_batch():
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        usernames = data.get('usernames') or []
+        size = data.get('size')
+    else:
+        usernames = [u for u in request.args.get('usernames', '').split(',') if u]
+        size = request.args.get('size', type=int)
+
+    if not isinstance(usernames, list):
+        return jsonify({'status': 'error', 'message': 'usernames must be a list'}), 400
+    usernames = list(dict.fromkeys(str(u) for u in usernames))
+    if len(usernames) > USER_MEDIA_MAX_BATCH:
+        return jsonify({'status': 'error', 'message': f'At most {USER_MEDIA_MAX_BATCH} usernames'}), 400
+
+    size = size if isinstance(size, int) else None
+    return jsonify({
+        'status': 'success',
+        'media': {u: user_media.urls_for(u, size) for u in usernames}
+    })
+
+
+@inf_bp.route('/user-media/<username>/<filename>', methods=['GET'])
+def get_user_media_file(username, filename):
+    # ?v= 和当前文件的版本一致时内容固定，可以永久缓存；不带或对不上 (旧链接) 的按 ETag 验证
+    resolved = media.user_image(username, filename)
+    if resolved is None:
+        return "Not Found", 404
+    version = request.args.get('v')
+    current = user_media.index.current_version(username, filename) if version else None
+    cache_control = media.CACHE_IMMUTABLE if version and version == current else media.CACHE_REVALIDATE
+    return media.send_negotiated(resolved, cache_control=cache_control, sniff=True)
+
+
+@inf_bp.route('/default-media/<filename>', methods=['GET'])
+def get_default_media_file(filename):
+    resolved = media.default_image(filename)
+    if resolved is None:
+        return "Not Found", 404
+    version = request.args.get('v')
+    cache_control = media.CACHE_IMMUTABLE if version and version == user_media.default_version(filename) \
+        else media.CACHE_REVALIDATE
+    return media.send_negotiated(resolved, cache_control=cache_control, sniff=True)
+
+
+def _save_processed(file, folder, render):
+    """
+    上传的原图先落到临时目录，render(原图路径, 输出目录) 处理完后逐个改名覆盖旧文件，
+    读取的请求不会看到写了一半的图。不是图片时抛 UnidentifiedImageError。
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=folder) as tmp:
+        src = os.path.join(tmp, 'upload')
+        file.save(src)
+        out = os.path.join(tmp, 'out')
+        os.mkdir(out)
+        render(src, out)
+        for name in os.listdir(out):
+            os.replace(os.path.join(out, name), folder / name)
+
 
 @inf_bp.route('/push-photo', methods=['POST'])
 def upload_photo():
@@ -83,18 +153,24 @@ def upload_photo():
     if file.filename == '':
         return jsonify({'error': '未选择任何文件'}), 400
 
+    if 'user' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
     username = session['user']
     user_folder = dabopration.USER_file / str(username) /'img'
     if file:
         try:
-            filename = 'person.jpg'
-            save_path = os.path.join(user_folder, filename)
-            file.save(save_path)
+            # 统一转成 JPEG (封顶 512，去 EXIF)，另外生成各显示尺寸的小图和 WebP/AVIF
+            _save_processed(file, user_folder, image_opt.render_avatar)
+            user_media.index.refresh(username)
+            save_path = os.path.join(user_folder, 'person.jpg')
             print(f"图片已成功保存至: {save_path}")
             return jsonify({
                 'message': '图片上传成功并已保存',
                 'filepath': save_path
             }), 200
+        except UnidentifiedImageError:
+            return jsonify({'error': '无法识别的图片文件'}), 400
         except Exception as e:
             print(f"文件保存时出错: {e}")
             return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
@@ -115,23 +191,19 @@ def upload_background():
     username = session['user']
     user_img_folder = dabopration.USER_file / str(username) / 'img'
 
-    # 确保目录存在
-    if not user_img_folder.exists():
-        user_img_folder.mkdir(parents=True)
-
     if file:
         try:
-            # 保存文件，强制命名为 background.jpg 以便覆盖旧图
-            filename = 'background.jpg'
-            save_path = user_img_folder / filename
-
-            # file.save 接受 Path 对象或字符串
-            file.save(save_path)
+            # 统一转成 background.jpg (宽度封顶 1920，去 EXIF) + WebP/AVIF，覆盖旧图
+            _save_processed(file, user_img_folder, image_opt.render_background)
+            user_media.index.refresh(username)
+            save_path = user_img_folder / 'background.jpg'
 
             return jsonify({
                 'message': 'Background updated',
                 'filepath': str(save_path)
             }), 200
+        except UnidentifiedImageError:
+            return jsonify({'error': 'Unsupported image'}), 400
         except Exception as e:
             print(f"Error saving background: {e}")
             return jsonify({'error': str(e)}), 500
@@ -146,23 +218,14 @@ def get_background():
     3. 如果用户背景存在，返回用户背景
     4. 否则（未登录 或 用户没传过背景），返回全局默认背景
     """
-    global_default_bg = dabopration.USER_file / 'background.jpg'
-    target_bg = global_default_bg
+    resolved = None
     if 'user' in session:
-        username = session['user']
-        user_personal_bg = dabopration.USER_file / str(username) / 'img' / 'background.jpg'
-
-        if user_personal_bg.exists():
-            target_bg = user_personal_bg
+        resolved = media.user_image(session['user'], 'background.jpg')
+    resolved = resolved or media.resolve(dabopration.USER_file, 'background.jpg') or media.default_image('default_bg.jpg')
 
-    if target_bg.exists():
-        return send_file(target_bg, mimetype='image/jpeg')
-    else:
-        system_backup = dabopration.DB_CONFIG_PATH.parent / 'person_img' / 'default_bg.jpg'
-        if system_backup.exists():
-             return send_file(system_backup, mimetype='image/jpeg')
-        else:
-             return "Background Not Found", 404
+    if resolved is None:
+        return "Background Not Found", 404
+    return media.send_negotiated(resolved, cache_control=media.CACHE_PRIVATE, sniff=True)
 
 
 
@@ -172,10 +235,9 @@ def user_info_handler():
         return jsonify({'success': False, 'message': '未登录'}), 401
 
     username = session['user']
-    json_path = dabopration.USER_file / str(username) / 'extended_profile.json'
 
     if request.method == 'GET':
-        data = dabopration.read_json_safe(json_path, default_content={})
+        data = profile_store.get_profile(username)
         email_from_db = "Loading Error"
 
         conn = dabopration.get_db_connection()
@@ -214,7 +276,7 @@ def user_info_handler():
 
     if request.method == 'POST':
         req_data = request.json
-        current_data = dabopration.read_json_safe(json_path, default_content={})
+        changes = {} # 只收集改动的字段，最后一次性并发安全地合并进资料
 
         updated_fields = []
         if 'nickname' in req_data:
@@ -228,34 +290,38 @@ def user_info_handler():
 
                 blog_user.nickname = new_nickname
                 db.session.commit()
+                # 文章 / 照片列表和文章详情里都带 author_nickname
+                response_cache.invalidate(response_cache.TAG_ARTICLES, response_cache.TAG_PHOTOS)
+                http_cache.rendered_articles.clear()
                 print(f"[SYNC] Updated BlogUser nickname for {username} to {new_nickname}")
             except Exception as e:
                 db.session.rollback()
                 print(f"[SYNC ERROR] Failed to update BlogUser: {e}")
             # -------------------------------
 
-            current_data['nickname'] = new_nickname
+            changes['nickname'] = new_nickname
             updated_fields.append('nickname')
 
 
 
         if 'motto' in req_data:
-            current_data['MOTTO'] = req_data['motto']
+            changes['MOTTO'] = req_data['motto']
             updated_fields.append('MOTTO')
 
         if 'role' in req_data:
-            current_data['Role'] = req_data['role']
+            changes['Role'] = req_data['role']
             updated_fields.append('Role')
 
         #  处理 themeConfig 对象
         if 'themeConfig' in req_data:
-            current_data['themeConfig'] = req_data['themeConfig']
+            changes['themeConfig'] = req_data['themeConfig']
             updated_fields.append('themeConfig')
 
         if not updated_fields:
             return jsonify({'success': False, 'message': '未收到有效更新字段'}), 400
 
-        if dabopration.write_json_safe(json_path, current_data):
+        ok, current_data = profile_store.update_profile(username, changes)
+        if ok:
             return jsonify({
                 'success': True,
                 'message': f'成功更新: {", ".join(updated_fields)}',
@@ -267,3 +333,11 @@ def user_info_handler():
             })
         else:
             return jsonify({'success': False, 'message': '保存失败'}), 500
+
+
+# 把所有 extended_profile.json 导入 user_profile 表 (切换 PROFILE_BACKEND = 'db' 之前执行)
+# 用法: flask --app mainServer information import-profiles
+@inf_bp.cli.command('import-profiles')
+def import_profiles():
+    count = profile_store.import_files_to_db()
+    print(f"Imported {count} profiles")
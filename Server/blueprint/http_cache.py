@@ -0,0 +1,87 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import make_response, request
+
+# --- HTTP 缓存工具 ---
+# 文章详情：强 ETag = hash(id + updated_at + 格式)，客户端带 If-None-Match 命中时直接 304，
+#          连 content_md 都不用查；没命中时序列化结果放进进程内 LRU (按 id + 格式 + updated_at 取)，
+#          /save 和 /delete-article 时失效。Markdown 原文和渲染好的 HTML (?format=html) 分开缓存。
+# 列表接口：用 conditional 装饰器，按响应体算 ETag，内容没变就 304，省带宽。
+
+# 各类接口的 Cache-Control 策略
+CACHE_PUBLIC_REVALIDATE = 'public, no-cache'          # 公开文章：可以缓存，但每次都要拿 ETag 来验证
+CACHE_PRIVATE_REVALIDATE = 'private, no-cache'        # 可能是草稿 / 登录相关
+CACHE_PUBLIC_SHORT = 'public, max-age=30, must-revalidate'  # 公共列表：允许 30 秒内直接用
+
+RENDERED_CACHE_SIZE = 512
+
+
+def article_etag(article_id, updated_at, variant='md'):
+    """variant 区分同一篇文章的不同表示 (比如 'md:<渲染版本>' / 'html:<渲染版本>')"""
+    raw = f"article:{article_id}:{updated_at.isoformat() if updated_at else ''}:{variant}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def etag_matches(etag):
+    """请求头 If-None-Match 里是否包含这个 (强) ETag"""
+    return etag in request.if_none_match
+
+
+class RenderedCache:
+    """(article_id, variant) -> (updated_at, payload) 的 LRU；updated_at 对不上就当没命中"""
+
+    def __init__(self, max_size=RENDERED_CACHE_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, article_id, updated_at, variant='md'):
+        key = (article_id, variant)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != updated_at:
+                return None
+            self._data.move_to_end(key)
+            return dict(entry[1])
+
+    def put(self, article_id, updated_at, payload, variant='md'):
+        key = (article_id, variant)
+        with self._lock:
+            self._data[key] = (updated_at, dict(payload))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, article_id):
+        """删掉这篇文章所有格式的缓存"""
+        with self._lock:
+            for key in [key for key in self._data if key[0] == article_id]:
+                del self._data[key]
+
+    def clear(self):
+        """作者昵称之类跨文章的信息变了时用"""
+        with self._lock:
+            self._data.clear()
+
+
+rendered_articles = RenderedCache()
+
+
+def conditional(cache_control):
+    """
+    列表接口用：给 JSON 响应加上按内容计算的 ETag 和 Cache-Control，
+    If-None-Match 命中时返回空的 304。流式响应不处理。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            response.headers['Cache-Control'] = cache_control
+            response.add_etag()
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,120 @@
+import os
+from PIL import Image, ImageOps
+
+# --- 上传图片的服务端优化 ---
+# 客户端传什么就存什么的结果是：几 MB 的 PNG 截图、原尺寸头像、带 GPS 的 EXIF 全都原样发给访客。
+# 这里统一做：
+#   1. 按 EXIF 方向摆正后限制最大边长
+#   2. 重新编码，不带任何元数据 (EXIF / XMP / ICC 都不写)
+#   3. 兜底格式：有透明通道用 PNG，否则 JPEG；另外生成 WebP，Pillow 支持时再生成 AVIF
+#      同名不同扩展名放在一起，访问时按 Accept 头挑最好的 (见 media.send_negotiated)
+#   4. 头像额外按界面实际显示的尺寸预生成正方形小图
+# GIF 可能是动图，不做处理。
+
+MAX_DIMENSION = 2560          # 文章配图最大边长
+BACKGROUND_MAX_WIDTH = 1920   # 个人主页背景
+AVATAR_MAX_DIMENSION = 512    # 头像原图
+AVATAR_SIZES = (48, 96, 192)  # 卡片 / 评论 / 个人主页上显示的头像尺寸 (含 2x 屏)
+
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+
+Image.init()
+AVIF_SUPPORTED = 'AVIF' in Image.SAVE   # Pillow 11.2 起自带 AVIF 编码
+
+# 协商顺序：越靠前越优先
+VARIANT_FORMATS = (('avif', 'image/avif'), ('webp', 'image/webp'))
+FALLBACK_EXTENSIONS = ('jpg', 'png', 'gif')
+
+
+def _prepare(img, max_size):
+    img = ImageOps.exif_transpose(img)
+    if max_size:
+        img.thumbnail(max_size, Image.LANCZOS)
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+    return img, has_alpha
+
+
+def _save_all(img, has_alpha, base_path):
+    """保存兜底格式 + WebP (+ AVIF)，返回兜底文件的扩展名"""
+    fallback_ext = 'png' if has_alpha else 'jpg'
+    if has_alpha:
+        img.save(f"{base_path}.png", 'PNG', optimize=True)
+    else:
+        img.save(f"{base_path}.jpg", 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    img.save(f"{base_path}.webp", 'WEBP', quality=WEBP_QUALITY, method=4)
+    if AVIF_SUPPORTED:
+        img.save(f"{base_path}.avif", 'AVIF', quality=AVIF_QUALITY)
+    return fallback_ext
+
+
+def optimize_upload(src_path, base_path, max_dimension=MAX_DIMENSION):
+    """
+    文章配图：src_path 为上传的临时文件，结果写到 base_path.<ext>。
+    返回兜底文件的扩展名 ('jpg' / 'png' / 'gif')。
+    """
+    with Image.open(src_path) as img:
+        if img.format == 'GIF':
+            os.replace(src_path, f"{base_path}.gif")
+            return 'gif'
+        img, has_alpha = _prepare(img, (max_dimension, max_dimension))
+        return _save_all(img, has_alpha, base_path)
+
+
+def render_background(src_path, out_dir, name='background'):
+    """背景图：宽度封顶，写出 background.jpg (始终是真正的 JPEG) / .webp / .avif"""
+    with Image.open(src_path) as img:
+        img, _ = _prepare(img, (BACKGROUND_MAX_WIDTH, BACKGROUND_MAX_WIDTH * 4))
+        img = img.convert('RGB')
+        _save_all(img, False, os.path.join(out_dir, name))
+
+
+def avatar_name(size=None):
+    """person.jpg 或 person_96.jpg 这类文件名的主干"""
+    return f"person_{size}" if size else 'person'
+
+
+def render_avatar(src_path, out_dir):
+    """头像：person.jpg (封顶 512) 以及 AVATAR_SIZES 里每个尺寸的正方形小图，均带 WebP/AVIF"""
+    with Image.open(src_path) as img:
+        img, _ = _prepare(img, (AVATAR_MAX_DIMENSION, AVATAR_MAX_DIMENSION))
+        img = img.convert('RGB')
+        _save_all(img, False, os.path.join(out_dir, avatar_name()))
+        for size in AVATAR_SIZES:
+            square = ImageOps.fit(img, (size, size), Image.LANCZOS)
+            _save_all(square, False, os.path.join(out_dir, avatar_name(size)))
+
+
+def pick_avatar_size(requested):
+    """前端要 ?size=N 时，返回不小于 N 的最小预生成尺寸；比最大的还大就用原图 (None)"""
+    for size in AVATAR_SIZES:
+        if size >= requested:
+            return size
+    return None
+
+
+# 老文件的实际格式 (以前 person.jpg 里可能是 PNG / WebP)，按文件头判断
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def sniff_mimetype(path, default='image/jpeg'):
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(16)
+    except OSError:
+        return default
+    for signature, mimetype in _SIGNATURES:
+        if head.startswith(signature):
+            return mimetype
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'image/avif'
+    return default
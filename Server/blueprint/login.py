@@ -1,10 +1,8 @@
 from flask import Blueprint, json, jsonify, request, session
-from . import dabopration
-from passlib.context import CryptContext
+from . import dabopration, password_hasher, profile_store
 import os
 
 auth_bp = Blueprint('auth', __name__)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def json_init():
     default_data = {
@@ -39,8 +37,8 @@ def signup():
                 'conflict_value': name if conflicting_field == "Name" else email
             })
         else:
-            # 2. 加密并插入
-            hashed_password = pwd_context.hash(password)
+            # 2. 加密并插入 (bcrypt 在独立进程池里算，见 password_hasher)
+            hashed_password = password_hasher.hash_password(password)
             insert_query = "INSERT INTO users (name, email, password) VALUES (%s, %s, %s)"
             cursor.execute(insert_query, (name, email, hashed_password))
             conn.commit()
@@ -66,9 +64,9 @@ def signup():
             # 写入文章 json
             dabopration.write_json_safe(user_folder / 'article.json', {'name': name})
 
-            # 写入扩展数据 json (这就是 Admin 面板读取的文件)
+            # 写入扩展数据 (这就是 Admin 面板读取的资料)
             # 我们给一个默认空的 json 即可，管理员后续可以追加字段
-            dabopration.write_json_safe(user_folder / 'extended_profile.json', {})
+            profile_store.save_profile(name, {})
 
             # 复制头像
             img_folder = user_folder / 'img'
@@ -90,6 +88,8 @@ def signup():
 
             return response
 
+    except password_hasher.HasherBusy:
+        return password_hasher.busy_response()
     except Exception as e:
         print(f"Signup Error: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -116,8 +116,13 @@ def login():
             username = user_record[0]
             stored_hashed_password = user_record[1]
 
-            # 验证密码
-            if pwd_context.verify(password, stored_hashed_password):
+            # 验证密码 (bcrypt 在独立进程池里算，见 password_hasher)
+            matched, new_hash = password_hasher.verify_password(password, stored_hashed_password)
+            if matched:
+                if new_hash:
+                    # 哈希参数过时 (BCRYPT_ROUNDS 改过)，趁有明文时按新参数重新保存
+                    cursor.execute("UPDATE users SET password = %s WHERE name = %s", (new_hash, username))
+                    conn.commit()
                 session['user'] = username
                 session.permanent = True
                 response = jsonify({'success': True, 'username': username})
@@ -126,6 +131,8 @@ def login():
 
         return jsonify({'success': False, 'message': 'Invalid email or password'})
 
+    except password_hasher.HasherBusy:
+        return password_hasher.busy_response()
     except Exception as e:
         print(f"Login Error: {e}")
         return jsonify({'success': False, 'message': 'Server Error'}), 500
@@ -1,10 +1,12 @@
 from flask import Blueprint, jsonify, session, request
 from models import db, Article
+from blueprint import blob_store, http_cache, response_cache, revisions, search_index, tags
 
 manage_bp = Blueprint('manage', __name__)
 
 # 1. 获取当前登录用户的所有文章 (用于 Profile 和 Manage 页面)
 @manage_bp.route('/my-articles-list', methods=['GET'])
+@http_cache.conditional(http_cache.CACHE_PRIVATE_REVALIDATE)
 def get_my_articles():
     if 'user' not in session:
         return jsonify({'status': 'error', 'message': 'Authentication required'}), 401
@@ -12,7 +14,7 @@ def get_my_articles():
     username = session['user']
     
     try:
-        articles = Article.query.filter_by(user_id=username)\
+        articles = Article.summary_query().filter_by(user_id=username)\
                                 .order_by(Article.updated_at.desc())\
                                 .all()
         
@@ -46,8 +48,18 @@ def delete_article(article_id):
         if article.user_id != username:
             return jsonify({'status': 'error', 'message': 'Permission denied'}), 403
 
+        blob_store.drop_refs(article_id)
+        revisions.drop(article_id)
+        tags.adjust_counts([tag.id for tag in article.tags], article.status == 'published', [], False)
         db.session.delete(article)
         db.session.commit()
+        http_cache.rendered_articles.invalidate(article_id)
+        response_cache.invalidate(response_cache.TAG_ARTICLES)
+
+        try:
+            search_index.remove_article(article_id)
+        except Exception as e:
+            print(f"Search Index Error: {e}")
         
         return jsonify({'status': 'success', 'message': 'Article deleted'})
         
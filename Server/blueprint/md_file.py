@@ -1,17 +1,27 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, request, jsonify, make_response, session, stream_with_context
 from datetime import datetime
+import json
 import models
-import re
+import click
+from blueprint import blob_store, http_cache, md_picture, md_render, pagination, response_cache, revisions, search_index, tags, view_counter
 # 然后通过 models. 访问其中的内容
 db = models.db
 Article = models.Article
 Tag = models.Tag
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer, undefer_group
 from sqlalchemy.orm.exc import NoResultFound
 
 mdfile_bp = Blueprint('mdfile', __name__)
 
 @mdfile_bp.route('/save', methods=['POST'])
 def save_article():
+    """
+    保存文章。正文可以发完整的 markdown，也可以 (修改已有文章时) 发增量：
+      {'id': 1, 'base_hash': <上次返回的 content_hash>, 'patch': [[start, end, text], ...]}
+    格式见 blueprint/revisions.py；base_hash 对不上返回 409，客户端改发完整 markdown。
+    两个保存同时落到同一篇文章、撞上修订号时也返回 409，客户端重发即可。
+    """
     if 'user' not in session:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
 
@@ -22,11 +32,14 @@ def save_article():
     article_id = data.get('id') # 如果是修改，会有 ID
     title = data.get('title')
     markdown = data.get('markdown')
+    patch = data.get('patch')
     tags_list = data.get('tags', [])
     status = data.get('status', 'draft') # published 或 draft
     excerpt = data.get('excerpt', '')
     if not title:
         return jsonify({'status': 'error', 'message': '标题不能为空'}), 400
+    if patch is not None and not article_id:
+        return jsonify({'status': 'error', 'message': '新文章需要提交完整内容'}), 400
 
     try:
         # --- 1. 查找或新建文章 ---
@@ -34,100 +47,343 @@ def save_article():
             article = Article.query.filter_by(id=article_id, user_id=user_name).first()
             if not article:
                 return jsonify({'status': 'error', 'message': '文章不存在或无权修改'}), 404
+            old_tag_ids = [tag.id for tag in article.tags]
+            was_published = article.status == 'published'
         else:
             article = Article(user_id=user_name)
             db.session.add(article)
+            old_tag_ids, was_published = [], False
+
+        # 增量保存：在 base 正文上打补丁
+        if patch is not None:
+            if data.get('base_hash') != article.content_hash:
+                return _patch_conflict(article)
+            try:
+                markdown = revisions.apply_patch(article.content_md or '', patch)
+            except revisions.PatchError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+
+        # 什么都没改 (常见于自动保存 / 重复点保存)：不写库，不动 updated_at，缓存也不失效
+        if article_id and _unchanged(article, title, markdown, status, excerpt, tags_list):
+            return jsonify({
+                'status': 'success',
+                'message': '内容未变化',
+                'id': article.id,
+                'content_hash': article.content_hash,
+                'unchanged': True,
+                'redirect': False
+            })
+
+        # 增量保存：带条件地改写 content_hash，同时检查 base 没被别人改掉 (读到 base 之后、这里之前可能有并发保存)。
+        # 这一行在提交前一直锁着，另一个基于同一 base 的保存在这里更新不到行，返回 409 而不是把这次的修改覆盖掉
+        if patch is not None:
+            base_hash = article.content_hash
+            claimed = db.session.execute(
+                db.update(Article)
+                .where(Article.id == article.id,
+                       Article.content_hash.is_(None) if base_hash is None else Article.content_hash == base_hash)
+                .values(content_hash=md_render.content_hash(markdown))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not claimed:
+                db.session.rollback()
+                return _patch_conflict(article)
 
         # --- 2. 更新基础信息 ---
         article.title = title
-        article.content_md = markdown
         article.status = status
         article.summary = excerpt
         article.updated_at = datetime.now()
-        image_match = re.search(r'!\[.*?\]\(([^)\s]+)', markdown)
-        if image_match:
-            # 如果找到图片，将链接存入 cover_image 字段
-            article.cover_image = image_match.group(1)
-        else:
-            # 如果没有找到图片，将字段设为 None
-            article.cover_image = None
-        # --- 3. 处理标签 (核心逻辑：自动去重、自动创建) ---
-        # 先清空当前文章的标签关联
-        article.tags = []
-        for tag_name in tags_list:
-            tag_name = tag_name.strip()
-            if not tag_name: continue
-
-            # 查找标签是否存在，不存在则创建
-            tag = Tag.query.filter_by(name=tag_name).first()
-            if not tag:
-                tag = Tag(name=tag_name)
-                db.session.add(tag)
-
-            article.tags.append(tag)
-
-        # --- 4. 提交事务 ---
+        # --- 3. 处理标签 (标签没变就不动；缺的标签一条语句批量建出来，再一条 IN 查询取回) ---
+        if {tag.name for tag in article.tags} != set(tags.normalize(tags_list)):
+            article.tags = tags.upsert(tags_list)
+        tags.adjust_counts(old_tag_ids, was_published, [tag.id for tag in article.tags], status == 'published')
+
+        # --- 4. 正文变了才重新渲染、同步图片引用、记修订，然后提交事务 ---
+        db.session.flush()
+        revision = _set_content(article, markdown)
         db.session.commit()
+        _after_save(article)
 
         return jsonify({
             'status': 'success',
             'message': '保存成功',
             'id': article.id,
+            'content_hash': article.content_hash,
+            'revision': revision.seq if revision else None,
             'redirect': False
         })
 
+    except IntegrityError as e:
+        # 并发保存同时记修订，seq 撞了 uq_article_revision_seq
+        db.session.rollback()
+        print(f"Save Conflict: {e}")
+        return jsonify({'status': 'conflict', 'message': '文章正在别处保存，请重试'}), 409
     except Exception as e:
         db.session.rollback()
         print(f"Save Error: {e}")
         return jsonify({'status': 'error', 'message': '服务器保存失败'}), 500
 
-@mdfile_bp.route('/get-article/<int:article_id>', methods=['GET'])
-def get_article(article_id):
-    # 允许未登录用户查看已发布的，或者作者查看自己的草稿
-    article = Article.query.get(article_id)
 
-    if not article:
-        return jsonify({'status': 'error', 'message': '文章未找到'}), 404
+def _patch_conflict(article):
+    return jsonify({
+        'status': 'conflict',
+        'message': '文章已在别处修改，请提交完整内容',
+        'content_hash': article.content_hash
+    }), 409
+
+
+def _unchanged(article, title, markdown, status, excerpt, tags_list):
+    return (article.content_hash == md_render.content_hash(markdown)
+            and md_render.is_current(article)
+            and article.title == title
+            and article.status == status
+            and (article.summary or '') == (excerpt or '')
+            and {tag.name for tag in article.tags} == set(tags.normalize(tags_list)))
+
+
+def _set_content(article, markdown, coalesce=True):
+    """
+    写入新正文 (article 需已 flush 出 id，调用方负责 commit)：
+    渲染出 HTML、目录、预览、封面图、图片 / 链接列表、字数、正文哈希，
+    同步图片引用 (垃圾回收据此判断图片是否还有人用)，记一个修订。
+    正文没变返回 None (渲染版本过旧时仍会重新渲染)。
+    """
+    new_hash = md_render.content_hash(markdown)
+    if article.content_hash == new_hash:
+        if not md_render.is_current(article):
+            md_render.apply(article)
+        return None
+
+    old_content, old_hash = article.content_md, article.content_hash
+    article.content_md = markdown
+    md_render.apply(article)
+    blob_store.sync_refs(article.id, markdown)
+    return revisions.record(article.id, old_content, markdown or '', new_hash, old_hash, coalesce)
+
+
+def _after_save(article):
+    """提交之后：失效缓存，同步全文索引 (索引失败不影响保存结果，可用 rebuild-index 补)"""
+    http_cache.rendered_articles.invalidate(article.id)
+    response_cache.invalidate(response_cache.TAG_ARTICLES)
+    try:
+        search_index.index_article(article)
+    except Exception as e:
+        print(f"Search Index Error: {e}")
+
+
+# --- 修订历史 (只有作者能看) ---
+REVISION_LIST_LIMIT = 50
 
 
+def _own_article(article_id):
+    if 'user' not in session:
+        return None
+    return Article.query.filter_by(id=article_id, user_id=session['user']).first()
+
+
+@mdfile_bp.route('/article/<int:article_id>/revisions', methods=['GET'])
+def list_revisions(article_id):
+    article = _own_article(article_id)
+    if not article:
+        return jsonify({'status': 'error', 'message': '文章不存在或无权查看'}), 404
+    limit = min(request.args.get('limit', REVISION_LIST_LIMIT, type=int), REVISION_LIST_LIMIT)
     return jsonify({
         'status': 'success',
-        'article': article.to_dict()
+        'content_hash': article.content_hash,
+        'revisions': [r.to_dict() for r in revisions.history(article_id, limit)]
     })
 
+
+@mdfile_bp.route('/article/<int:article_id>/revisions/<int:seq>', methods=['GET'])
+def get_revision(article_id, seq):
+    article = _own_article(article_id)
+    revision = revisions.get(article_id, seq) if article else None
+    if not revision:
+        return jsonify({'status': 'error', 'message': '修订不存在'}), 404
+    payload = revision.to_dict()
+    payload['content'] = revisions.content_at(article_id, seq)
+    return jsonify({'status': 'success', 'revision': payload})
+
+
+@mdfile_bp.route('/article/<int:article_id>/revisions/<int:seq>/restore', methods=['POST'])
+def restore_revision(article_id, seq):
+    """
+    把正文恢复成某个修订 (撤销)；恢复本身也会记成一个新修订。
+    修订里的图片已经不在磁盘上 (比如修订机制之前就被回收了) 时返回 409 和 missing_images，
+    确认要恢复就带 {'force': true} 再发一次。
+    """
+    article = _own_article(article_id)
+    content = revisions.content_at(article_id, seq) if article else None
+    if content is None:
+        return jsonify({'status': 'error', 'message': '修订不存在'}), 404
+
+    missing = blob_store.missing_files(md_picture.UPLOAD_FOLDER, blob_store.extract_refs(content))
+    if missing and not (request.get_json(silent=True) or {}).get('force'):
+        return jsonify({
+            'status': 'conflict',
+            'message': '该修订引用的部分图片已被删除',
+            'missing_images': missing
+        }), 409
+
+    try:
+        revision = _set_content(article, content, coalesce=False)
+        if revision is None:
+            return jsonify({'status': 'success', 'message': '内容未变化', 'unchanged': True,
+                            'content_hash': article.content_hash})
+        article.updated_at = datetime.now()
+        db.session.commit()
+        _after_save(article)
+        return jsonify({
+            'status': 'success',
+            'message': '已恢复',
+            'content_hash': article.content_hash,
+            'revision': revision.seq
+        })
+    except IntegrityError as e:
+        db.session.rollback()
+        print(f"Restore Conflict: {e}")
+        return jsonify({'status': 'conflict', 'message': '文章正在别处保存，请重试'}), 409
+    except Exception as e:
+        db.session.rollback()
+        print(f"Restore Error: {e}")
+        return jsonify({'status': 'error', 'message': '恢复失败'}), 500
+
+
+def _article_response(article_id, cache_control, count_view=False, as_html=False):
+    """
+    文章详情的公共流程：
+    1. 只查 updated_at / views / render_version 三列，算 ETag；If-None-Match 命中直接 304
+    2. 否则优先用进程内缓存的序列化结果，没有再整篇加载
+    3. views 每次都用最新值覆盖 (缓存里的不作数)
+    as_html=True 时返回保存时渲染好的 HTML / 目录 (不带 Markdown 原文)
+    """
+    meta = db.session.query(Article.updated_at, Article.views, Article.render_version)\
+        .filter(Article.id == article_id).first()
+    if not meta:
+        return None
+
+    if count_view:
+        view_counter.record(article_id)
+
+    # 文章的渲染版本进 ETag 和缓存键：rerender 命令在另一个进程里跑、不改 updated_at，
+    # 靠 render_version 变化让本进程缓存的旧 HTML / 封面图 / 预览失效，客户端也不会再拿到 304
+    variant = f"{'html' if as_html else 'md'}:{meta.render_version}"
+    etag = http_cache.article_etag(article_id, meta.updated_at, variant)
+    if http_cache.etag_matches(etag):
+        response = make_response('', 304)
+    else:
+        payload = http_cache.rendered_articles.get(article_id, meta.updated_at, variant)
+        if payload is None:
+            if as_html:
+                article = Article.list_query().options(defer(Article.content_md), undefer_group('rendered'))\
+                    .filter_by(id=article_id).first()
+                payload = article.to_rendered_dict()
+            else:
+                article = Article.list_query().filter_by(id=article_id).first()
+                payload = article.to_dict()
+            http_cache.rendered_articles.put(article_id, meta.updated_at, payload, variant)
+        payload['views'] = (meta.views or 0) + view_counter.pending(article_id)
+        response = jsonify({
+            'status': 'success',
+            'article': payload
+        })
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+@mdfile_bp.route('/get-article/<int:article_id>', methods=['GET'])
+def get_article(article_id):
+    # 允许未登录用户查看已发布的，或者作者查看自己的草稿
+    response = _article_response(article_id, http_cache.CACHE_PRIVATE_REVALIDATE)
+    if response is None:
+        return jsonify({'status': 'error', 'message': '文章未找到'}), 404
+    return response
+
 @mdfile_bp.route('/get-articles-list', methods=['GET'])
+@http_cache.conditional(http_cache.CACHE_PUBLIC_SHORT)
+@response_cache.cached(tags=(response_cache.TAG_ARTICLES,))
 def get_articles_list():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('limit', 6, type=int)
 
-    # 分页查询
-    pagination = Article.query.filter_by(status='published').order_by(Article.updated_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    # 分页查询 (列表只要摘要，不查 content_md)
+    # paginate 自带的计数会把整条查询 (含 content_md) 包成子查询，这里自己数 id
+    pagination = Article.summary_query().filter_by(status='published').order_by(Article.updated_at.desc()).paginate(page=page, per_page=per_page, error_out=False, count=False)
+    total = db.session.query(db.func.count(Article.id)).filter(Article.status == 'published').scalar()
 
-    articles_data = [a.to_dict() for a in pagination.items]
+    articles_data = [a.to_summary_dict() for a in pagination.items]
 
     return jsonify({
         'articles': articles_data,
-        'total': pagination.total,
-        'pages': pagination.pages,
+        'total': total,
+        'pages': -(-total // pagination.per_page),
         'current_page': page
     })
 
 
 
+PUBLIC_LIST_DEFAULT_LIMIT = 50
+PUBLIC_LIST_MAX_LIMIT = 100
+STREAM_BATCH_SIZE = 200
+
+
 @mdfile_bp.route('/get-all-public-articles', methods=['GET'])
+@http_cache.conditional(http_cache.CACHE_PUBLIC_SHORT)
 def get_all_public_articles():
+    """
+    已发布文章列表，按 (updated_at, id) 倒序做游标分页：
+      ?limit=50&cursor=<上一页返回的 next_cursor>
+    ?format=ndjson 时改为流式输出，每行一篇文章，从游标处一直读到末尾 (或 limit 条)。
+    不带任何分页参数时和以前一样返回全部 (Blog / Home 页面一次取完在前端筛选)。
+    列表只需要摘要，content_md 大字段不查。
+    """
+    cursor = request.args.get('cursor') or None
+    output_format = request.args.get('format', 'json')
+
     try:
-        # 查询所有状态为 'published' 的文章，按时间倒序
-        articles = Article.query.filter_by(status='published')\
-                                .order_by(Article.updated_at.desc())\
-                                .all()
+        base_query = Article.summary_query().filter_by(status='published')
+
+        if output_format == 'ndjson':
+            limit = request.args.get('limit', type=int)
+            query = pagination.apply_keyset(base_query, Article.updated_at, Article.id, cursor)
+            if limit:
+                query = query.limit(limit)
+
+            def generate():
+                # 生成器在请求 teardown (db.session.remove()) 之后才跑：另开一个会话，读完自己关，连接及时还回读库连接池
+                stream_session = db.session.session_factory()
+                try:
+                    rows = query.with_session(stream_session).yield_per(STREAM_BATCH_SIZE)  # 服务端游标，分批取
+                    for article in rows:
+                        yield json.dumps(article.to_summary_dict(), ensure_ascii=False) + '\n'
+                finally:
+                    stream_session.close()
+
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        if not any(request.args.get(k) for k in ('cursor', 'limit', 'offset', 'page')):
+            articles = pagination.apply_keyset(base_query, Article.updated_at, Article.id).all()
+            return jsonify({
+                'status': 'success',
+                'articles': [a.to_summary_dict() for a in articles],
+                'next_cursor': None,
+                'has_more': False
+            })
+
+        limit, cursor, offset = pagination.read_page_args(PUBLIC_LIST_DEFAULT_LIMIT, PUBLIC_LIST_MAX_LIMIT)
+        articles, next_cursor = pagination.fetch_page(base_query, Article.updated_at, Article.id, limit, cursor, offset)
 
-        # 转换为字典
-        articles_data = [a.to_summary_dict() for a in articles]
         return jsonify({
             'status': 'success',
-            'articles': articles_data
+            'articles': [a.to_summary_dict() for a in articles],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         })
+    except pagination.InvalidCursor as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         print(f"Error fetching articles: {e}")
         return jsonify({'status': 'error', 'message': 'Failed to fetch list'}), 500
@@ -135,22 +391,80 @@ def get_all_public_articles():
 
 @mdfile_bp.route('/read-article/<int:article_id>', methods=['GET'])
 def read_article(article_id):
+    """?format=html 返回服务端渲染好的 HTML + 目录 + 字数 / 阅读时长，默认返回 Markdown 原文"""
     try:
-        article = Article.query.get(article_id)
-        if not article:
+        #  阅读数自增：先记在内存 + 追加日志，后台定期批量原子写回 (views = views + n)
+        #  304 (客户端已有最新版本) 也算一次阅读
+        as_html = request.args.get('format') == 'html'
+        response = _article_response(article_id, http_cache.CACHE_PUBLIC_REVALIDATE, count_view=True, as_html=as_html)
+        if response is None:
             return jsonify({'status': 'error', 'message': 'DATA_NOT_FOUND'}), 404
-
-        #  阅读数自增 (原子操作)
-        article.views += 1
-        db.session.commit()
-
-
-        return jsonify({
-            'status': 'success',
-            'article': article.to_dict()
-        })
+        return response
 
     except Exception as e:
         db.session.rollback()
         print(f"Read Error: {e}")
         return jsonify({'status': 'error', 'message': 'SYSTEM_FAILURE'}), 500
+
+
+# --- 标签浏览 ---
+TAG_LIST_DEFAULT_LIMIT = 16
+
+
+@mdfile_bp.route('/tags', methods=['GET'])
+@http_cache.conditional(http_cache.CACHE_PUBLIC_SHORT)
+@response_cache.cached(tags=(response_cache.TAG_ARTICLES,))
+def get_tags():
+    """所有有已发布文章的标签及文章数 (计数是预先维护好的，不做 COUNT)，?limit=20 只取最热门的"""
+    limit = request.args.get('limit', type=int)
+    return jsonify({
+        'status': 'success',
+        'tags': [tag.to_dict() for tag in tags.popular(limit)]
+    })
+
+
+@mdfile_bp.route('/tags/<name>/articles', methods=['GET'])
+@http_cache.conditional(http_cache.CACHE_PUBLIC_SHORT)
+@response_cache.cached(tags=(response_cache.TAG_ARTICLES,))
+def get_tag_articles(name):
+    """某个标签下的已发布文章，按 (created_at, id) 倒序游标分页"""
+    tag = Tag.query.filter_by(name=name).first()
+    if not tag:
+        return jsonify({'status': 'error', 'message': 'Tag not found'}), 404
+
+    limit, cursor, offset = pagination.read_page_args(TAG_LIST_DEFAULT_LIMIT)
+    # 走 article_tags 的 (tag_id, article_id) 索引，不用 JOIN tag 表
+    query = Article.summary_query()\
+        .join(models.article_tags, models.article_tags.c.article_id == Article.id)\
+        .filter(models.article_tags.c.tag_id == tag.id, Article.status == 'published')
+
+    try:
+        articles, next_cursor = pagination.fetch_page(query, Article.created_at, Article.id, limit, cursor, offset)
+    except pagination.InvalidCursor as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    return jsonify({
+        'status': 'success',
+        'tag': tag.to_dict(),
+        'articles': [a.to_summary_dict() for a in articles],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+
+# 用法 (在 Server 目录下): flask --app mainServer mdfile recount-tags
+@mdfile_bp.cli.command('recount-tags')
+def recount_tags():
+    tags.recount()
+    print("[TAGS] article counts rebuilt")
+
+
+# 用法 (在 Server 目录下): flask --app mainServer mdfile rerender [--all]
+# 渲染规则升级 (md_render.RENDERER_VERSION 变了) 之后执行，不改 updated_at；
+# 运行中的服务按文章的 render_version 区分缓存，不用重启。
+# --all 不改 render_version，运行中的服务会继续用缓存的旧结果，执行后需要重启服务
+@mdfile_bp.cli.command('rerender')
+@click.option('--all', 'rerender_all', is_flag=True, help='不管版本，全部重新渲染')
+def rerender_articles(rerender_all):
+    count = md_render.rerender(rerender_all)
+    print(f"[RENDER] {count} articles rendered with v{md_render.RENDERER_VERSION}")
@@ -1,8 +1,8 @@
 import os
-import uuid
-from datetime import datetime
-from flask import Blueprint, request, jsonify, send_from_directory, make_response
-from werkzeug.utils import secure_filename
+import click
+from flask import Blueprint, abort, request, jsonify, make_response
+from PIL import UnidentifiedImageError
+from blueprint import blob_store, media
 
 # 定义蓝图
 mdpic_bp = Blueprint('mdpicture', __name__)
@@ -44,39 +44,22 @@ def upload_image():
 
     if f and allowed_file(f.filename):
         try:
-            # 3. 生成日期路径 (YYYY/MM/DD)
-            now = datetime.now()
-            year = now.strftime('%Y')
-            month = now.strftime('%m')
-            day = now.strftime('%d')
+            # 3. 按内容哈希存储 (uploads/blob/ab/cd/<sha256>.jpg|png|gif + .webp/.avif)，同一张图只存一份
+            #    新图片会被压缩尺寸、去掉 EXIF 并转出 WebP/AVIF (见 image_opt)
+            rel_path, created = blob_store.store(UPLOAD_FOLDER, f.stream)
 
-            # 物理存储路径: .../uploads/2023/10/27
-            file_dir = os.path.join(UPLOAD_FOLDER, year, month, day)
-            if not os.path.exists(file_dir):
-                os.makedirs(file_dir, exist_ok=True)
-
-            # 4. 生成安全且唯一的文件名
-            # 格式: HHMMSS_随机码.jpg (防止文件名冲突)
-            ext = f.filename.rsplit('.', 1)[1].lower()
-            original_safe = secure_filename(f.filename.rsplit('.', 1)[0])
-            unique_id = uuid.uuid4().hex[:6]
-            timestamp = now.strftime('%H%M%S')
-
-            new_filename = f"{timestamp}_{unique_id}.{ext}"
-
-            # 5. 保存文件
-            save_path = os.path.join(file_dir, new_filename)
-            f.save(save_path)
-
-            file_url = f"{BACKEND_DOMAIN}/uploads/{year}/{month}/{day}/{new_filename}"
-            print(f"[UPLOAD SUCCESS] Saved to: {save_path}")
+            file_url = f"{BACKEND_DOMAIN}/uploads/{rel_path}"
+            print(f"[UPLOAD SUCCESS] {'Saved' if created else 'Deduplicated'}: {rel_path}")
 
+            name = rel_path.rsplit('/', 1)[1]
             return jsonify({
                 "url": file_url,
-                "alt": new_filename,
-                "title": new_filename
+                "alt": name,
+                "title": name
             })
 
+        except UnidentifiedImageError:
+            return jsonify({'error': '无法识别的图片文件'}), 400
         except Exception as e:
             print(f"[UPLOAD ERROR] {e}")
             return jsonify({'error': '服务器内部保存失败'}), 500
@@ -85,12 +68,27 @@ def upload_image():
 
 
 # --- 图片访问接口 ---
-#TODO: 后期不使用这个，转到apache2挂载图片
+# 新图片在 uploads/blob/ab/cd/<sha256>.ext (正好也是四段路径)，老图片在 uploads/YYYY/MM/DD/；
+# 两种文件名写入后都不会再变，可以让浏览器 / CDN 长期缓存；
+# 配置 MEDIA_OFFLOAD 后由前端代理直接发文件 (见 blueprint/media.py)
 
 @mdpic_bp.route('/uploads/<year>/<month>/<day>/<filename>')
 def serve_uploaded_file(year, month, day, filename):
-    # 拼接完整的物理目录路径
-    directory = os.path.join(UPLOAD_FOLDER, year, month, day)
-    return send_from_directory(directory, filename)
-
-
+    resolved = media.resolve(UPLOAD_FOLDER, year, month, day, filename)
+    if resolved is None:
+        abort(404)
+    # 浏览器支持时返回同名的 .avif / .webp
+    return media.send_negotiated(resolved, cache_control=media.CACHE_IMMUTABLE)
+
+
+# --- 清理没有文章引用的图片 ---
+# 用法 (在 Server 目录下): flask --app mainServer mdpicture gc-images [--dry-run] [--grace-hours 24]
+@mdpic_bp.cli.command('gc-images')
+@click.option('--dry-run', is_flag=True, help='只列出将被删除的文件')
+@click.option('--grace-hours', default=24, show_default=True, help='这段时间内上传的图片不删 (文章可能还没保存)')
+def gc_images(dry_run, grace_hours):
+    removed, freed = blob_store.collect_garbage(UPLOAD_FOLDER, grace_seconds=grace_hours * 3600, dry_run=dry_run)
+    for rel in removed:
+        print(rel)
+    action = 'would remove' if dry_run else 'removed'
+    print(f"[GC] {action} {len(removed)} files, {freed / 1024 / 1024:.1f} MB")
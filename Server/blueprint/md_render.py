@@ -0,0 +1,197 @@
+import hashlib
+import html
+import json
+import math
+import re
+import threading
+import markdown
+import nh3
+from markdown.extensions.toc import slugify_unicode
+
+# --- Markdown 服务端渲染 + 派生字段 ---
+# 保存文章时把 content_md 渲染一遍，从同一份结果里算出所有派生字段存进 Article：
+#   content_html    过滤后的 HTML
+#   toc             标题目录 [{'level': 2, 'id': '...', 'title': '...'}]，id 和 HTML 里标题的 id 对应
+#   word_count      字数 (中日韩文字按字、其他按单词)
+#   reading_minutes 预计阅读分钟数
+#   content_preview 去掉 Markdown 语法 (和代码块) 的正文前 PREVIEW_LENGTH 字，列表用
+#   cover_image     第一张图片
+#   images / links  正文里所有图片地址、链接地址 (JSON，按出现顺序去重)
+#   content_hash    content_md 的 sha256，保存时据此判断正文有没有变
+# 列表接口只读这些列，不再碰 content_md；/read-article/<id>?format=html 直接返回渲染结果。
+#
+# 渲染规则 (扩展、白名单、字数算法、派生字段) 有变化时把 RENDERER_VERSION 加一，然后执行
+#   flask --app mainServer mdfile rerender
+# 重新渲染旧版本的文章；没来得及重渲染的文章在读取详情时按新规则临时渲染，不会返回旧结果。
+
+RENDERER_VERSION = 2
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'sane_lists', 'toc']
+TOC_DEPTH = '1-4'
+
+# Markdown 里允许写原始 HTML，渲染结果统一过一遍白名单 (去掉 script、事件属性、javascript: 链接等)
+ALLOWED_TAGS = nh3.ALLOWED_TAGS
+ALLOWED_ATTRIBUTES = {
+    **{tag: set(attrs) for tag, attrs in nh3.ALLOWED_ATTRIBUTES.items()},
+    **{f'h{level}': {'id'} for level in range(1, 7)},   # 目录锚点
+    'a': {'href', 'hreflang', 'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'code': {'class'},                                  # language-xxx，前端高亮用
+}
+
+PREVIEW_LENGTH = 150
+RERENDER_BATCH_SIZE = 100
+
+CJK_CHARS_PER_MINUTE = 400
+WORDS_PER_MINUTE = 200
+
+_CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+_WORD_RE = re.compile(r'[^\W_]+')
+# nh3 输出的属性统一是双引号，直接用正则取
+_IMG_SRC_RE = re.compile(r'<img\b[^>]*?\ssrc="([^"]*)"')
+_LINK_HREF_RE = re.compile(r'<a\b[^>]*?\shref="([^"]*)"')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def content_hash(markdown_text):
+    return hashlib.sha256((markdown_text or '').encode('utf-8')).hexdigest()
+
+
+def _unique_urls(pattern, text):
+    result = []
+    for url in pattern.findall(text):
+        url = html.unescape(url)
+        if url and url not in result:
+            result.append(url)
+    return result
+
+
+def _flatten_toc(tokens, result=None):
+    result = [] if result is None else result
+    for token in tokens:
+        result.append({
+            'level': token['level'],
+            'id': token['id'],
+            'title': html.unescape(token['name']),
+        })
+        _flatten_toc(token['children'], result)
+    return result
+
+
+def _count_words(text):
+    """返回 (中日韩字数, 其他单词数)"""
+    cjk = len(_CJK_RE.findall(text))
+    words = len(_WORD_RE.findall(_CJK_RE.sub(' ', text)))
+    return cjk, words
+
+
+def render(markdown_text):
+    """
+    渲染一篇文章，返回
+    {'html', 'toc', 'word_count', 'reading_minutes', 'preview', 'images', 'links'}
+    """
+    # Markdown 实例不是线程安全的，每次新建 (开销很小)
+    md = markdown.Markdown(
+        extensions=MARKDOWN_EXTENSIONS,
+        extension_configs={'toc': {'slugify': slugify_unicode, 'toc_depth': TOC_DEPTH}},
+    )
+    raw_html = md.convert(markdown_text or '')
+    safe_html = nh3.clean(raw_html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES)
+
+    plain_text = html.unescape(nh3.clean(safe_html, tags=set()))
+    cjk, words = _count_words(plain_text)
+    word_count = cjk + words
+    minutes = cjk / CJK_CHARS_PER_MINUTE + words / WORDS_PER_MINUTE
+
+    # 预览不要代码块
+    preview_text = html.unescape(nh3.clean(safe_html, tags=set(), clean_content_tags={'pre'}))
+    preview = _SPACE_RE.sub(' ', preview_text).strip()[:PREVIEW_LENGTH]
+    return {
+        'html': safe_html,
+        'toc': _flatten_toc(md.toc_tokens),
+        'word_count': word_count,
+        'reading_minutes': max(1, math.ceil(minutes)) if word_count else 0,
+        'preview': preview,
+        'images': _unique_urls(_IMG_SRC_RE, safe_html),
+        'links': _unique_urls(_LINK_HREF_RE, safe_html),
+    }
+
+
+def apply(article):
+    """按 article.content_md 渲染并写回 article 的各个派生字段 (调用方负责 commit)"""
+    result = render(article.content_md)
+    article.content_html = result['html']
+    article.toc = json.dumps(result['toc'], ensure_ascii=False)
+    article.word_count = result['word_count']
+    article.reading_minutes = result['reading_minutes']
+    article.content_preview = result['preview']
+    article.cover_image = result['images'][0] if result['images'] else None
+    article.images = json.dumps(result['images'], ensure_ascii=False)
+    article.links = json.dumps(result['links'], ensure_ascii=False)
+    article.content_hash = content_hash(article.content_md)
+    article.render_version = RENDERER_VERSION
+    return result
+
+
+def is_current(article):
+    return article.render_version == RENDERER_VERSION
+
+
+def rendered_fields(article):
+    """
+    读取时用：返回已存的渲染结果；版本过旧 (还没跑 rerender) 时临时按新规则渲染，不写回数据库。
+    """
+    if not is_current(article):
+        result = render(article.content_md)
+        del result['preview']
+    else:
+        result = {
+            'html': article.content_html or '',
+            'toc': json.loads(article.toc) if article.toc else [],
+            'word_count': article.word_count or 0,
+            'reading_minutes': article.reading_minutes or 0,
+            'images': json.loads(article.images) if article.images else [],
+            'links': json.loads(article.links) if article.links else [],
+        }
+    return result
+
+
+def rerender(rerender_all=False, batch_size=RERENDER_BATCH_SIZE):
+    """
+    重新渲染 render_version 不是当前版本的文章 (rerender_all=True 时全部)，不改 updated_at。
+    每批提交一次，返回处理的文章数。
+    """
+    from models import db, Article
+    from blueprint import http_cache
+
+    query = db.session.query(Article.id)
+    if not rerender_all:
+        query = query.filter(db.or_(Article.render_version.is_(None),
+                                    Article.render_version != RENDERER_VERSION))
+    ids = [row.id for row in query.order_by(Article.id)]
+
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        for article in Article.query.filter(Article.id.in_(batch)):
+            apply(article)
+        db.session.commit()
+        for article_id in batch:
+            http_cache.rendered_articles.invalidate(article_id)
+        print(f"[RENDER] {min(start + batch_size, len(ids))}/{len(ids)}")
+    return len(ids)
+
+
+def rerender_in_background(app):
+    """在后台线程里执行 rerender() (迁移用，不拖慢启动)；没渲染完之前详情照样按新规则临时渲染"""
+    def run():
+        with app.app_context():
+            try:
+                count = rerender()
+            except Exception as e:
+                print(f"[RENDER] background rerender failed: {e}，可以手动执行 mdfile rerender")
+                return
+            print(f"[RENDER] background rerender done: {count} article(s)")
+
+    thread = threading.Thread(target=run, name='md-rerender', daemon=True)
+    thread.start()
+    return thread
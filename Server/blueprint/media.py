@@ -0,0 +1,136 @@
+import hashlib
+import mimetypes
+import os
+from flask import current_app, make_response, request, send_file
+from werkzeug.security import safe_join
+from blueprint import dabopration, image_opt
+
+# --- 图片等媒体文件的统一出口 ---
+# 所有返回图片字节的接口都走 send_media：
+#   1. 路径用 resolve() 解析 (safe_join 防止 ../ 穿越)，只 stat 一次，代替原来的 exists() + send_file 两次探测
+#   2. ETag = hash(路径 + mtime + 大小)，支持 If-None-Match / If-Modified-Since 返回 304，
+#      Range 请求返回 206 (由 werkzeug 的 send_file(conditional=True) 处理)
+#   3. 按文件性质设置 Cache-Control：
+#        内容不会变的文件 (文件名唯一，如 uploads/2024/05/01/xxx.png) -> 一年 + immutable
+#        固定地址、内容会被覆盖的文件 (头像、背景)                      -> 每次用 ETag 验证
+#   4. 配置了前端代理时不在 Python 里读文件，而是交给 nginx / apache：
+#        app.config['MEDIA_OFFLOAD'] = 'x-accel'    (nginx)  需要同时配置 MEDIA_ACCEL_ROOTS
+#        app.config['MEDIA_OFFLOAD'] = 'x-sendfile' (apache mod_xsendfile)
+#      MEDIA_ACCEL_ROOTS = {本地目录: nginx internal location 前缀}，例如
+#        {'/srv/blog/Server/uploads': '/_media/uploads/'}
+#      nginx 对应配置:  location /_media/uploads/ { internal; alias /srv/blog/Server/uploads/; }
+
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDATE = 'public, no-cache'
+CACHE_PRIVATE = 'private, no-cache'
+
+
+def resolve(root, *parts):
+    """
+    在 root 下安全地拼出文件路径并 stat 一次。
+    返回 (path, stat_result)；越界、不存在或不是普通文件时返回 None。
+    """
+    path = safe_join(str(root), *[str(p) for p in parts])
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return path, st
+
+
+def user_image(username, filename):
+    """User_file/<username>/img/<filename>"""
+    return resolve(dabopration.USER_file, str(username), 'img', filename)
+
+
+def default_image(filename):
+    """系统自带的默认图 (Server/person_img/<filename>)"""
+    return resolve(dabopration.DB_CONFIG_PATH.parent / 'person_img', filename)
+
+
+def file_etag(path, st):
+    raw = f"{path}:{st.st_mtime_ns}:{st.st_size}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _accel_uri(path):
+    roots = current_app.config.get('MEDIA_ACCEL_ROOTS') or {}
+    for local_root, prefix in roots.items():
+        local_root = os.path.abspath(local_root)
+        if os.path.commonpath([local_root, path]) == local_root:
+            rel = os.path.relpath(path, local_root).replace(os.sep, '/')
+            return prefix.rstrip('/') + '/' + rel
+    return None
+
+
+def send_media(resolved, mimetype=None, cache_control=CACHE_REVALIDATE):
+    """
+    resolved 为 resolve() 的返回值。
+    mimetype 不传时按扩展名猜。
+    """
+    path, st = resolved
+    path = os.path.abspath(path)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    etag = file_etag(path, st)
+
+    offload = current_app.config.get('MEDIA_OFFLOAD')
+    accel_uri = _accel_uri(path) if offload == 'x-accel' else None
+    if accel_uri:
+        # nginx 负责读文件、Range 和条件请求；这里只回 304 或空响应 + 内部跳转头
+        response = make_response('', 200)
+        response.set_etag(etag)
+        response.last_modified = int(st.st_mtime)
+        response.make_conditional(request)
+        if response.status_code == 200:
+            response.headers['X-Accel-Redirect'] = accel_uri
+            response.headers.pop('Content-Length', None)
+        response.mimetype = mimetype
+    else:
+        # x-sendfile 模式下 werkzeug 会自动加 X-Sendfile 头 (USE_X_SENDFILE)，不读文件内容
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            conditional=True,
+            etag=etag,
+            last_modified=st.st_mtime,
+        )
+
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def negotiate(resolved):
+    """同目录下有同名 .avif / .webp 且浏览器在 Accept 里明确声明支持时换成它，返回 (resolved, mimetype)"""
+    path, _ = resolved
+    directory, name = os.path.split(path)
+    stem = name.rsplit('.', 1)[0]
+    accepted = set(request.accept_mimetypes.values())
+    for ext, mimetype in image_opt.VARIANT_FORMATS:
+        if mimetype in accepted:
+            variant = resolve(directory, f"{stem}.{ext}")
+            if variant:
+                return variant, mimetype
+    return resolved, None
+
+
+def send_negotiated(resolved, cache_control=CACHE_REVALIDATE, sniff=False):
+    """
+    按 Accept 挑格式后发送，并加上 Vary: Accept 让缓存按格式区分。
+    sniff=True 时兜底文件的类型按文件头判断 (老头像 person.jpg 里可能是 PNG)。
+    """
+    chosen, mimetype = negotiate(resolved)
+    if mimetype is None and sniff:
+        mimetype = image_opt.sniff_mimetype(chosen[0])
+    response = send_media(chosen, mimetype=mimetype, cache_control=cache_control)
+    response.vary.add('Accept')
+    return response
+
+
+def init_app(app):
+    if app.config.get('MEDIA_OFFLOAD') == 'x-sendfile':
+        app.config['USE_X_SENDFILE'] = True
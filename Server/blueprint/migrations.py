@@ -0,0 +1,236 @@
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+import click
+from sqlalchemy import inspect, text
+
+try:
+    import fcntl  # 仅 POSIX；没有时 (Windows 单进程开发) 不加进程间锁
+except ImportError:
+    fcntl = None
+
+# --- 数据库结构迁移 ---
+# db.create_all() 只会建不存在的表，已有的表不会加列、加索引。
+# 这里按顺序登记每一次结构变更，已执行过的记录在 schema_migration 表里；
+# 启动时 (AUTO_MIGRATE=True) 或手动执行:
+#   flask --app mainServer migrate upgrade     执行所有未执行的迁移
+#   flask --app mainServer migrate status      查看执行情况
+#   flask --app mainServer migrate check-plans 检查列表查询是否退化成全表扫描 (仅 SQLite)
+# 每个迁移都写成幂等的 (列 / 索引已存在就跳过)，新库 create_all 之后再跑一遍也没关系。
+
+LOCK_FILENAME = 'migrations.lock'
+
+_app = None
+
+
+@contextmanager
+def _migration_lock():
+    """多个 worker 同时启动时只让一个执行迁移"""
+    os.makedirs(_app.instance_path, exist_ok=True)
+    with open(os.path.join(_app.instance_path, LOCK_FILENAME), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# --- 幂等的结构操作 ---
+
+def _column_names(table):
+    from models import db
+    return {col['name'] for col in inspect(db.engine).get_columns(table)}
+
+
+def add_column(table, name, ddl):
+    """ALTER TABLE ... ADD COLUMN，列已存在则跳过"""
+    from models import db
+    if name in _column_names(table):
+        return
+    db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    db.session.commit()
+    print(f"[MIGRATE]   + column {table}.{name}")
+
+
+def create_indexes(table, names=None):
+    """建 models 里为这张表声明的索引 (names 为空则全部)，已存在则跳过"""
+    from models import db
+    existing = {idx['name'] for idx in inspect(db.engine).get_indexes(table.name)}
+    for index in table.indexes:
+        if (names and index.name not in names) or index.name in existing:
+            continue
+        index.create(bind=db.engine)
+        print(f"[MIGRATE]   + index {index.name}")
+
+
+# --- 迁移列表 (只能往后追加，不要改已发布的) ---
+
+def _0001_photo_derivatives():
+    # 老照片保持 NULL，Photo.to_dict 当作 'ready'
+    add_column('photo', 'status', 'VARCHAR(20)')
+    add_column('photo', 'derivatives', 'TEXT')
+
+
+def _0002_tag_counts():
+    from models import article_tags
+    from blueprint import tags
+    add_column('tag', 'article_count', 'INTEGER NOT NULL DEFAULT 0')
+    create_indexes(article_tags)
+    tags.recount()
+
+
+def _0003_list_indexes():
+    from models import Article, Photo
+    create_indexes(Article.__table__)
+    create_indexes(Photo.__table__)
+
+
+def _0004_rendered_html():
+    # 老文章先留 NULL：读取时临时渲染，执行 mdfile rerender 后写入
+    add_column('article', 'content_html', 'TEXT')
+    add_column('article', 'toc', 'TEXT')
+    add_column('article', 'word_count', 'INTEGER')
+    add_column('article', 'reading_minutes', 'INTEGER')
+    add_column('article', 'render_version', 'INTEGER')
+
+
+def _0005_derived_fields():
+    from models import db
+    from blueprint import md_render
+    add_column('article', 'content_preview', 'VARCHAR(200)')
+    add_column('article', 'images', 'TEXT')
+    add_column('article', 'links', 'TEXT')
+    add_column('article', 'content_hash', 'VARCHAR(64)')
+    # 启动时不渲染：只把还没有派生字段的老文章标成旧版本 (详情读取时按新规则临时渲染)，
+    # 再起一个后台线程补齐；补齐之前这些文章在列表里暂时没有预览。
+    # 用 migrate upgrade 命令执行时进程很快退出，后台线程可能跑不完，之后执行 mdfile rerender 即可
+    stale = db.session.execute(text(
+        "UPDATE article SET render_version = NULL WHERE content_preview IS NULL")).rowcount
+    db.session.commit()
+    if stale:
+        print(f"[MIGRATE]   {stale} article(s) marked for rerender")
+        md_render.rerender_in_background(_app)
+
+
+MIGRATIONS = [
+    ('0001_photo_derivatives', '照片衍生图状态列', _0001_photo_derivatives),
+    ('0002_tag_counts', '标签文章数 + article_tags 反向索引', _0002_tag_counts),
+    ('0003_list_indexes', '文章 / 照片列表复合索引', _0003_list_indexes),
+    ('0004_rendered_html', '文章服务端渲染结果', _0004_rendered_html),
+    ('0005_derived_fields', '文章预览 / 图片 / 链接 / 正文哈希', _0005_derived_fields),
+]
+
+
+def applied_ids():
+    from models import SchemaMigration
+    return {row.id for row in SchemaMigration.query.all()}
+
+
+def upgrade():
+    """执行所有未执行的迁移，返回本次执行的 id 列表"""
+    from models import db, SchemaMigration
+
+    done = []
+    with _migration_lock():
+        SchemaMigration.__table__.create(bind=db.engine, checkfirst=True)
+        applied = applied_ids()
+        for migration_id, description, apply in MIGRATIONS:
+            if migration_id in applied:
+                continue
+            print(f"[MIGRATE] {migration_id}: {description}")
+            apply()
+            db.session.add(SchemaMigration(id=migration_id, applied_at=datetime.now()))
+            db.session.commit()
+            done.append(migration_id)
+    return done
+
+
+# --- 查询计划检查 ---
+# 对列表接口实际用到的查询跑 EXPLAIN QUERY PLAN：
+# 出现 "SCAN article" / "SCAN photo" (不带 USING INDEX) 说明是全表扫描；
+# 出现 "USE TEMP B-TREE FOR ORDER BY" 说明要把所有匹配行取出来排序，游标分页的 LIMIT 就失效了。
+
+_FULL_SCAN_RE = re.compile(r'^SCAN (article|photo)\b(?!.*USING (COVERING )?INDEX)')
+
+
+def _plan_queries():
+    from models import Article, Photo, article_tags
+    from blueprint import pagination
+
+    cursor = pagination.encode_cursor(datetime.now(), 1)
+    page = 51
+    # (名字, 查询, 是否允许额外排序)
+    return [
+        ('public articles', pagination.apply_keyset(
+            Article.summary_query().filter_by(status='published'), Article.updated_at, Article.id, cursor).limit(page), False),
+        ('articles list', Article.summary_query().filter_by(status='published')
+            .order_by(Article.updated_at.desc()).limit(page), False),
+        ('author articles', pagination.apply_keyset(
+            Article.summary_query().filter_by(user_id='u', status='published'), Article.created_at, Article.id, cursor).limit(page), False),
+        ('my articles', Article.summary_query().filter_by(user_id='u').order_by(Article.updated_at.desc()), False),
+        ('gallery', pagination.apply_keyset(Photo.list_query(), Photo.uploaded_at, Photo.id, cursor).limit(page), False),
+        ('my photos', pagination.apply_keyset(
+            Photo.list_query().filter_by(user_id='u'), Photo.uploaded_at, Photo.id, cursor).limit(page), False),
+        # 按标签列文章要跨表按 article.created_at 排序，排序不可避免，只要求不全表扫描
+        ('tag articles', pagination.apply_keyset(
+            Article.summary_query().join(article_tags, article_tags.c.article_id == Article.id)
+            .filter(article_tags.c.tag_id == 1, Article.status == 'published'),
+            Article.created_at, Article.id, cursor).limit(page), True),
+    ]
+
+
+def check_plans():
+    """返回 [(查询名, 问题描述, 完整计划)]，空列表表示全部通过"""
+    from models import db
+
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('check-plans 目前只支持 SQLite')
+
+    problems = []
+    for name, query, allow_sort in _plan_queries():
+        sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        plan = [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+        for detail in plan:
+            if _FULL_SCAN_RE.search(detail):
+                problems.append((name, f'full scan: {detail}', plan))
+            elif not allow_sort and 'TEMP B-TREE' in detail:
+                problems.append((name, f'sort: {detail}', plan))
+    return problems
+
+
+def init_app(app):
+    global _app
+    _app = app
+
+    @app.cli.group('migrate')
+    def migrate_cli():
+        """数据库结构迁移"""
+
+    @migrate_cli.command('upgrade')
+    def upgrade_command():
+        done = upgrade()
+        print(f"[MIGRATE] applied {len(done)} migration(s)" if done else "[MIGRATE] already up to date")
+
+    @migrate_cli.command('status')
+    def status_command():
+        applied = applied_ids()
+        for migration_id, description, _ in MIGRATIONS:
+            print(f"{'x' if migration_id in applied else ' '} {migration_id}  {description}")
+
+    @migrate_cli.command('check-plans')
+    def check_plans_command():
+        problems = check_plans()
+        for name, problem, plan in problems:
+            print(f"[PLAN] {name}: {problem}")
+            for detail in plan:
+                print(f"         {detail}")
+        if problems:
+            raise click.ClickException(f"{len(problems)} list query plan(s) regressed")
+        print("[PLAN] all list queries use indexes")
+
+    if app.config.get('AUTO_MIGRATE', True):
+        with app.app_context():
+            upgrade()
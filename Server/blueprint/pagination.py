@@ -0,0 +1,73 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+from sqlalchemy import and_, or_
+
+# --- 游标 (keyset) 分页工具 ---
+# 列表统一按 (时间列 DESC, id DESC) 排序，游标记住上一页最后一行的 (时间, id)，
+# 下一页直接 WHERE (时间, id) < 游标，走索引定位，不需要 OFFSET 逐行跳过。
+
+
+class InvalidCursor(ValueError):
+    """前端传来的游标无法解析"""
+
+
+def encode_cursor(sort_value, row_id):
+    """把 (datetime, id) 编成不透明的 URL 安全字符串"""
+    payload = json.dumps([sort_value.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_raw, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(sort_raw), int(row_id)
+    except Exception:
+        raise InvalidCursor(f'invalid cursor: {token!r}')
+
+
+def apply_keyset(query, sort_col, id_col, cursor=None):
+    """加上排序和游标条件；cursor 为 None 时从第一行开始"""
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            sort_col < sort_value,
+            and_(sort_col == sort_value, id_col < row_id)
+        ))
+    return query.order_by(sort_col.desc(), id_col.desc())
+
+
+def fetch_page(query, sort_col, id_col, limit, cursor=None, offset=0):
+    """
+    取一页数据，多取 1 行用来判断是否还有下一页 (代替 COUNT(*))。
+    有 cursor 走游标；没有则兼容老的 offset 写法。
+    返回 (items, next_cursor)，没有下一页时 next_cursor 为 None。
+    """
+    query = apply_keyset(query, sort_col, id_col, cursor)
+    if not cursor and offset:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and items:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), getattr(last, id_col.key))
+    return items, next_cursor
+
+
+def read_page_args(default_limit, max_limit=100):
+    """
+    统一解析分页参数，返回 (limit, cursor, offset)。
+    新接口用 ?cursor=；老的 ?offset= 和 ?page= (从 1 开始) 继续可用。
+    """
+    limit = request.args.get('limit', default_limit, type=int)
+    limit = max(1, min(limit, max_limit))
+    cursor = request.args.get('cursor') or None
+
+    offset = request.args.get('offset', 0, type=int)
+    page = request.args.get('page', type=int)
+    if page and page > 1 and not offset:
+        offset = (page - 1) * limit
+    return limit, cursor, max(0, offset)
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from flask import jsonify
+from passlib.context import CryptContext
+
+# --- 密码哈希服务 ---
+# bcrypt 每次 hash / verify 要吃 100~300ms CPU，以前直接在请求线程里算：
+# 一波登录就把 worker 全占住，文章列表、详情都得排队。现在统一交给独立的进程池：
+#   - 进程池大小 PASSWORD_WORKERS，认证最多用这么多核，和页面请求互不抢 GIL
+#   - 同时在排队 / 计算的任务不超过 PASSWORD_MAX_PENDING；满了最多等 PASSWORD_QUEUE_TIMEOUT 秒，
+#     还进不去就抛 HasherBusy，接口返回 503 + Retry-After，而不是无限堆积
+#   - BCRYPT_ROUNDS 调整后，老密码在下一次登录成功时自动按新参数重新哈希 (verify 返回 new_hash)
+#   - 各操作的排队时间 / 总耗时分位数见 /admin/password-hasher-stats
+# PASSWORD_WORKERS = 0 时在当前线程里算 (开发环境 / 没有多进程的平台)。
+
+DEFAULT_ROUNDS = 12
+DEFAULT_QUEUE_TIMEOUT = 2
+RESULT_TIMEOUT = 30
+RETRY_AFTER_SECONDS = 1
+LATENCY_WINDOW = 1000
+
+_app = None
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+_max_pending = 0
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+_rounds = DEFAULT_ROUNDS
+
+
+class HasherBusy(Exception):
+    """排队的哈希任务太多"""
+
+
+# --- 子进程里执行的部分 ---
+
+_contexts = {}
+
+
+def _context(rounds):
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return _contexts[rounds]
+
+
+def _hash_job(password, rounds):
+    return _context(rounds).hash(password)
+
+
+def _verify_job(password, hashed, rounds):
+    """返回 (是否匹配, 需要升级时的新哈希或 None)"""
+    return _context(rounds).verify_and_update(password, hashed)
+
+
+# --- 指标 ---
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def _op(self, name):
+        if name not in self._ops:
+            self._ops[name] = {'count': 0, 'errors': 0, 'rejected': 0,
+                               'wait': deque(maxlen=LATENCY_WINDOW), 'total': deque(maxlen=LATENCY_WINDOW)}
+        return self._ops[name]
+
+    def record(self, name, wait, total, error=False):
+        with self._lock:
+            op = self._op(name)
+            op['count'] += 1
+            op['errors'] += int(error)
+            op['wait'].append(wait)
+            op['total'].append(total)
+
+    def reject(self, name):
+        with self._lock:
+            self._op(name)['rejected'] += 1
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+        return {'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99),
+                'max_ms': round(ordered[-1] * 1000, 1)}
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {'count': op['count'], 'errors': op['errors'], 'rejected': op['rejected'],
+                           'queue_wait': self._summary(op['wait']), 'latency': self._summary(op['total'])}
+                    for name, op in self._ops.items()}
+
+
+metrics = _Metrics()
+
+
+# --- 主进程 ---
+
+def init_app(app):
+    global _app, _slots, _max_pending, _rounds
+    _app = app
+    _rounds = app.config.get('BCRYPT_ROUNDS', DEFAULT_ROUNDS)
+    _max_pending = app.config.get('PASSWORD_MAX_PENDING') or max(1, _workers()) * 4
+    _slots = threading.BoundedSemaphore(_max_pending)
+
+
+def _workers():
+    workers = _app.config.get('PASSWORD_WORKERS')
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 2) // 2)
+    return workers
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=_workers())
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _run(name, fn, *args):
+    """占一个名额，把 fn 交给进程池并等结果；名额等不到就抛 HasherBusy"""
+    global _in_flight
+    start = time.monotonic()
+    if not _slots.acquire(timeout=_app.config.get('PASSWORD_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT)):
+        metrics.reject(name)
+        raise HasherBusy()
+    wait = time.monotonic() - start
+    with _in_flight_lock:
+        _in_flight += 1
+    error = True
+    try:
+        if _workers() == 0:
+            result = fn(*args)
+        else:
+            try:
+                future = _get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                _reset_executor()
+                future = _get_executor().submit(fn, *args)
+            try:
+                result = future.result(timeout=RESULT_TIMEOUT)
+            except BrokenProcessPool:
+                _reset_executor()
+                raise
+            except FutureTimeout:
+                future.cancel()
+                raise
+        error = False
+        return result
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+        _slots.release()
+        metrics.record(name, wait, time.monotonic() - start, error)
+
+
+def hash_password(password):
+    return _run('hash', _hash_job, password, _rounds)
+
+
+def verify_password(password, hashed):
+    """
+    返回 (是否匹配, new_hash)。new_hash 不为 None 说明存的哈希参数过时 (比如 BCRYPT_ROUNDS 改了)，
+    调用方应该把它写回数据库。
+    """
+    return _run('verify', _verify_job, password, hashed, _rounds)
+
+
+def busy_response():
+    response = jsonify({'success': False, 'message': 'Server busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
+
+def stats():
+    return {'workers': _workers(), 'rounds': _rounds, 'max_pending': _max_pending,
+            'in_flight': _in_flight, 'ops': metrics.snapshot()}
@@ -1,10 +1,11 @@
 import os
 import uuid
+import click
 from datetime import datetime
 from flask import Blueprint, request, jsonify, session, current_app
 from werkzeug.utils import secure_filename
-from PIL import Image,ImageOps  # pip install Pillow
 from models import db, Photo, BlogUser
+from blueprint import pagination, photo_jobs, response_cache
 
 
 photo_bp = Blueprint('photo_bp', __name__)
@@ -15,23 +16,6 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# 辅助函数：生成缩略图
-def create_thumbnail(image_path, thumb_path, max_size=(600, 800)):
-    try:
-        with Image.open(image_path) as img:
-            img = ImageOps.exif_transpose(img)
-            # 转换为 RGB (防止 PNG 透明通道导致保存 JPG 报错)
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-
-            # 保持比例缩放 (thumbnail 方法是原地修改)
-            img.thumbnail(max_size)
-            img.save(thumb_path, "JPEG", quality=85)
-        return True
-    except Exception as e:
-        print(f"Thumbnail Error: {e}")
-        return False
-
 # --- 1. 上传图片 API ---
 @photo_bp.route('/share-upload', methods=['POST'])
 def upload_photo():
@@ -46,75 +30,84 @@ def upload_photo():
     user_id = session['user']
 
     if file and allowed_file(file.filename):
-        # 1. 基础上传目录
-        base_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'photos')
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        new_photo = create_photo(user_id, ext, description, file.save)
+        return jsonify({'status': 'success', 'message': 'Uploaded', 'data': new_photo.to_dict()})
 
-        # 2. [新增] 生成日期子目录
-        now = datetime.now()
-        date_folder = now.strftime('%Y/%m') # 使用 / 作为路径分隔符(兼容URL)
+    return jsonify({'status': 'error', 'message': 'Invalid file type'}), 400
 
-        save_folder = os.path.join(base_folder, *date_folder.split('/'))
 
-        # 如果目录不存在，创建它
-        os.makedirs(save_folder, exist_ok=True)
+def create_photo(user_id, ext, description, write):
+    """
+    把一张新照片放进按日期分目录的存储，建 Photo 记录并交给后台生成缩略图。
+    write(file_path) 负责把原图写到 file_path (普通上传是 file.save，分片上传是移动拼好的文件)。
+    """
+    # 1. 基础上传目录
+    base_folder = os.path.join(current_app.root_path, 'static', 'uploads', 'photos')
 
-        # 3. 生成文件名
-        ext = file.filename.rsplit('.', 1)[1].lower()
-        unique_id = uuid.uuid4().hex
-        name_only = f"{unique_id}.{ext}"
-        thumb_name_only = f"{unique_id}_thumb.jpg"
-
-        # 物理全路径
-        file_path = os.path.join(save_folder, name_only)
-        thumb_path = os.path.join(save_folder, thumb_name_only)
-
-        # 4. 保存文件
-        file.save(file_path)
-        create_thumbnail(file_path, thumb_path)
-
-        # 5. [关键] 存入数据库的相对路径
-        db_filename = f"{date_folder}/{name_only}"
-        db_thumb_filename = f"{date_folder}/{thumb_name_only}"
-
-        # 确保 User 存在
-        user = BlogUser.query.filter_by(username=user_id).first()
-        if not user:
-            user = BlogUser(username=user_id)
-            db.session.add(user)
-
-        new_photo = Photo(
-            user_id=user_id,
-            filename=db_filename,        # 存的是: 2024/05/uuid.jpg
-            thumb_filename=db_thumb_filename,
-            description=description
-        )
-        db.session.add(new_photo)
-        db.session.commit()
+    # 2. [新增] 生成日期子目录
+    now = datetime.now()
+    date_folder = now.strftime('%Y/%m') # 使用 / 作为路径分隔符(兼容URL)
 
-        return jsonify({'status': 'success', 'message': 'Uploaded', 'data': new_photo.to_dict()})
+    save_folder = os.path.join(base_folder, *date_folder.split('/'))
 
-    return jsonify({'status': 'error', 'message': 'Invalid file type'}), 400
+    # 如果目录不存在，创建它
+    os.makedirs(save_folder, exist_ok=True)
+
+    # 3. 生成文件名
+    unique_id = uuid.uuid4().hex
+    name_only = f"{unique_id}.{ext}"
+
+    # 物理全路径
+    file_path = os.path.join(save_folder, name_only)
+
+    # 4. 保存原图 (缩略图和多尺寸图交给后台进程池生成)
+    write(file_path)
+
+    # 5. [关键] 存入数据库的相对路径
+    db_filename = f"{date_folder}/{name_only}"
+
+    # 确保 User 存在
+    user = BlogUser.query.filter_by(username=user_id).first()
+    if not user:
+        user = BlogUser(username=user_id)
+        db.session.add(user)
+
+    new_photo = Photo(
+        user_id=user_id,
+        filename=db_filename,        # 存的是: 2024/05/uuid.jpg
+        description=description,
+        status='pending'
+    )
+    db.session.add(new_photo)
+    db.session.commit()
+    response_cache.invalidate(response_cache.TAG_PHOTOS)
+
+    photo_jobs.enqueue(new_photo)
+    return new_photo
 
 
 # --- 2. 获取图片列表 API (公共瀑布流) ---
-# 前端传参: ?page=1 (默认 1)
+# 前端传参: ?cursor=<上一页的 next_cursor>，老的 ?page=1 (默认 1) 仍然可用
 @photo_bp.route('/gallery-photos', methods=['GET'])
+@response_cache.cached(tags=(response_cache.TAG_PHOTOS,))
 def get_gallery():
     page = request.args.get('page', 1, type=int)
-    per_page = 9 # 一次给 9 张
+    limit, cursor, offset = pagination.read_page_args(9, max_limit=50) # 默认一次给 9 张
 
     # 按时间倒序查询
-    pagination = Photo.query.order_by(Photo.uploaded_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        items, next_cursor = pagination.fetch_page(Photo.list_query(), Photo.uploaded_at, Photo.id, limit, cursor, offset)
+    except pagination.InvalidCursor as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
 
-    photos = [p.to_dict() for p in pagination.items]
+    photos = [p.to_dict() for p in items]
 
     return jsonify({
         'status': 'success',
         'photos': photos,
-        'has_more': pagination.has_next, # 告诉前端还有没有下一页
-        'total': pagination.total,
+        'has_more': next_cursor is not None, # 告诉前端还有没有下一页
+        'next_cursor': next_cursor,
         'page': page
     })
 
@@ -129,23 +122,21 @@ def get_my_photos():
 
     user_id = session['user']
 
-    # [修改] 获取分页参数
-    limit = request.args.get('limit', 16, type=int) # 默认 16
-    offset = request.args.get('offset', 0, type=int)
-
-    # 查总数
-    total = Photo.query.filter_by(user_id=user_id).count()
+    # [修改] 获取分页参数 (默认 16)，支持 cursor / offset
+    limit, cursor, offset = pagination.read_page_args(16)
 
-    # 查分页数据
-    my_photos = Photo.query.filter_by(user_id=user_id)\
-                    .order_by(Photo.uploaded_at.desc())\
-                    .limit(limit).offset(offset).all()
+    # 查分页数据 (多取一行判断 has_more，不再单独查总数)
+    try:
+        my_photos, next_cursor = pagination.fetch_page(
+            Photo.list_query().filter_by(user_id=user_id), Photo.uploaded_at, Photo.id, limit, cursor, offset)
+    except pagination.InvalidCursor as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
 
     return jsonify({
         'status': 'success',
         'photos': [p.to_dict() for p in my_photos],
-        'total': total,
-        'has_more': (offset + limit) < total
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
     })
 
 @photo_bp.route('/delete-photo/<int:photo_id>', methods=['DELETE'])
@@ -174,8 +165,14 @@ def delete_photo(photo_id):
             if os.path.exists(thumb_full_path):
                 os.remove(thumb_full_path)
 
+        for rel_path in photo_jobs.derivative_files(photo):
+            derivative_path = os.path.join(base_folder, os.path.normpath(rel_path))
+            if os.path.exists(derivative_path):
+                os.remove(derivative_path)
+
         db.session.delete(photo)
         db.session.commit()
+        response_cache.invalidate(response_cache.TAG_PHOTOS)
 
         return jsonify({'status': 'success', 'message': 'Deleted'})
 
@@ -183,3 +180,32 @@ def delete_photo(photo_id):
         db.session.rollback()
         print(f"Delete Error: {e}")
         return jsonify({'status': 'error', 'message': 'Server Error'}), 500
+
+
+# --- 5. 补跑衍生图 (命令行) ---
+# 用法: flask --app mainServer photo_bp process-derivatives [--retry-failed] [--all]
+# 默认处理还没有衍生图的老照片和卡在 pending 的照片
+@photo_bp.cli.command('process-derivatives')
+@click.option('--retry-failed', is_flag=True, help='同时重试 status=failed 的照片')
+@click.option('--all', 'process_all', is_flag=True, help='全部重新生成')
+@click.option('--batch', default=100, help='每批处理的照片数')
+def process_derivatives(retry_failed, process_all, batch):
+    query = Photo.query
+    if not process_all:
+        query = query.filter(Photo.derivatives.is_(None))
+        if not retry_failed:
+            query = query.filter(Photo.status.is_(None) | (Photo.status != 'failed'))
+
+    ok = failed = 0
+    last_id = 0
+    while True:
+        photos = query.filter(Photo.id > last_id).order_by(Photo.id).limit(batch).all()
+        if not photos:
+            break
+        batch_ok, batch_failed = photo_jobs.process_sync(photos)
+        ok += batch_ok
+        failed += batch_failed
+        last_id = photos[-1].id
+        print(f"processed up to photo {last_id}: {ok} ok, {failed} failed")
+
+    print(f"Done: {ok} ok, {failed} failed")
@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageOps
+from blueprint import response_cache
+
+# --- 图片衍生图后台流水线 ---
+# 上传接口只负责把原图落盘、写库，然后把照片 id 丢进进程池；
+# 缩略图和多尺寸 (JPEG + WebP) 在子进程里生成，完成后回调里更新 Photo.status / derivatives。
+
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+THUMB_SIZE = (600, 800)
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+MAX_ATTEMPTS = 3
+
+_app = None
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def init_app(app):
+    global _app
+    _app = app
+
+
+def photo_root(app):
+    return os.path.join(app.root_path, 'static', 'uploads', 'photos')
+
+
+# --- 子进程里执行的部分 (只用到文件路径，不碰数据库) ---
+
+def render_derivatives(src_path, out_dir, stem, widths=DERIVATIVE_WIDTHS):
+    """
+    生成缩略图和各尺寸 JPEG/WebP，返回文件名 (相对 out_dir)：
+    {'thumb': ..., 'width': ..., 'height': ..., 'sizes': [{'w': 320, 'jpeg': ..., 'webp': ...}]}
+    """
+    with Image.open(src_path) as img:
+        img = ImageOps.exif_transpose(img)
+        # 转换为 RGB (防止 PNG 透明通道导致保存 JPG 报错)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        result = {'width': img.width, 'height': img.height, 'sizes': []}
+
+        thumb = img.copy()
+        thumb.thumbnail(THUMB_SIZE)
+        result['thumb'] = f"{stem}_thumb.jpg"
+        thumb.save(os.path.join(out_dir, result['thumb']), 'JPEG', quality=JPEG_QUALITY)
+
+        # 不放大：比原图宽的尺寸跳过，原图比最小尺寸还小时按原宽出一份
+        targets = [w for w in widths if w <= img.width] or [img.width]
+        for w in targets:
+            h = max(1, round(img.height * w / img.width))
+            resized = img if w == img.width else img.resize((w, h), Image.LANCZOS)
+            jpeg_name = f"{stem}_{w}.jpg"
+            webp_name = f"{stem}_{w}.webp"
+            resized.save(os.path.join(out_dir, jpeg_name), 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            resized.save(os.path.join(out_dir, webp_name), 'WEBP', quality=WEBP_QUALITY, method=4)
+            result['sizes'].append({'w': w, 'jpeg': jpeg_name, 'webp': webp_name})
+
+        return result
+
+
+# --- 主进程：任务提交与结果落库 ---
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=_app.config.get('PHOTO_WORKERS', 2))
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _job_args(photo):
+    """由 Photo.filename (如 2024/05/uuid.jpg) 算出原图路径、输出目录、文件名前缀、日期目录"""
+    date_folder, _, name_only = photo.filename.rpartition('/')
+    src_path = os.path.join(photo_root(_app), os.path.normpath(photo.filename))
+    stem = name_only.rsplit('.', 1)[0]
+    return src_path, os.path.dirname(src_path), stem, date_folder
+
+
+def apply_result(photo, result, date_folder):
+    """把衍生图文件名写回 Photo (调用方负责 commit)"""
+    prefix = f"{date_folder}/" if date_folder else ''
+    photo.thumb_filename = prefix + result['thumb']
+    photo.derivatives = json.dumps({
+        'width': result['width'],
+        'height': result['height'],
+        'sizes': [{'w': s['w'], 'jpeg': prefix + s['jpeg'], 'webp': prefix + s['webp']} for s in result['sizes']]
+    })
+    photo.status = 'ready'
+
+
+def _submit(photo_id, args, attempt):
+    src_path, out_dir, stem, date_folder = args
+    try:
+        future = _get_executor().submit(render_derivatives, src_path, out_dir, stem)
+    except BrokenProcessPool:
+        _reset_executor()
+        future = _get_executor().submit(render_derivatives, src_path, out_dir, stem)
+    future.add_done_callback(lambda f: _on_done(f, photo_id, args, attempt))
+
+
+def _on_done(future, photo_id, args, attempt):
+    from models import db, Photo
+
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"[PHOTO JOB] photo {photo_id} attempt {attempt} failed: {e}")
+        if isinstance(e, BrokenProcessPool):
+            _reset_executor()
+        if attempt < MAX_ATTEMPTS:
+            _submit(photo_id, args, attempt + 1)
+            return
+        result = None
+
+    with _app.app_context():
+        try:
+            photo = db.session.get(Photo, photo_id)
+            if not photo:
+                return  # 处理期间照片已被删除
+            if result:
+                apply_result(photo, result, args[3])
+            else:
+                photo.status = 'failed'
+            db.session.commit()
+            response_cache.invalidate(response_cache.TAG_PHOTOS)  # 画廊里的状态 / srcset 变了
+        except Exception as e:
+            db.session.rollback()
+            print(f"[PHOTO JOB] photo {photo_id} save failed: {e}")
+
+
+def enqueue(photo):
+    """上传成功 (已 commit) 后调用，立即返回"""
+    _submit(photo.id, _job_args(photo), 1)
+
+
+def process_sync(photos):
+    """
+    命令行补跑用：并行生成，等待全部完成后在当前 app context 里落库。
+    返回 (成功数, 失败数)。
+    """
+    from models import db
+
+    executor = _get_executor()
+    futures = {}
+    for photo in photos:
+        args = _job_args(photo)
+        futures[executor.submit(render_derivatives, *args[:3])] = (photo, args[3])
+
+    ok = failed = 0
+    for future in as_completed(futures):
+        photo, date_folder = futures[future]
+        try:
+            apply_result(photo, future.result(), date_folder)
+            ok += 1
+        except Exception as e:
+            print(f"[PHOTO JOB] photo {photo.id} failed: {e}")
+            photo.status = 'failed'
+            failed += 1
+    db.session.commit()
+    response_cache.invalidate(response_cache.TAG_PHOTOS)
+    return ok, failed
+
+
+def derivative_files(photo):
+    """照片的所有衍生图相对路径，删除照片时一并清理"""
+    files = []
+    if photo.derivatives:
+        for size in json.loads(photo.derivatives).get('sizes', []):
+            files.extend([size['jpeg'], size['webp']])
+    return files
@@ -0,0 +1,327 @@
+import copy
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from flask import current_app
+from blueprint import dabopration, response_cache
+
+# --- 用户扩展资料 (extended_profile) 存储 ---
+# 两种后端，由 app.config['PROFILE_BACKEND'] 选择：
+#   'file' (默认): 每个用户一个 USER_file/<username>/extended_profile.json，
+#                  读取走进程内 LRU 缓存，文件 mtime 变了或通过 write_json_safe 写过就失效。
+#   'db':          全部存进 user_profile 表的一个 JSON 列，批量读取只要一条 IN 查询。
+# 老数据迁到 db 后端: flask --app mainServer information import-profiles
+
+PROFILE_FILENAME = 'extended_profile.json'
+COLUMNS_FILENAME = 'profile_columns.json'
+DEFAULT_CACHE_SIZE = 1024
+
+# 批量读文件时的并行度；少量用户直接顺序读
+READ_WORKERS = 8
+PARALLEL_READ_THRESHOLD = 16
+
+
+def profile_path(username):
+    return dabopration.USER_file / str(username) / PROFILE_FILENAME
+
+
+class ProfileCache:
+    """username -> (mtime, data) 的 LRU，线程安全"""
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username, mtime):
+        with self._lock:
+            entry = self._data.get(username)
+            if entry is not None and entry[0] == mtime:
+                self._data.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, username, mtime, data):
+        with self._lock:
+            self._data[username] = (mtime, data)
+            self._data.move_to_end(username)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, username=None):
+        with self._lock:
+            if username is None:
+                self._data.clear()
+            else:
+                self._data.pop(str(username), None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = ProfileCache()
+
+
+def _on_json_written(file_path):
+    # 任何地方通过 write_json_safe 写了某个用户的 extended_profile.json，都让缓存失效
+    path = Path(file_path)
+    if path.name == PROFILE_FILENAME:
+        _cache.invalidate(path.parent.name)
+
+
+dabopration.add_json_write_listener(_on_json_written)
+
+
+def _backend():
+    return current_app.config.get('PROFILE_BACKEND', 'file')
+
+
+# --- file 后端 ---
+
+def _file_get(username):
+    path = profile_path(username)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+
+    data = _cache.get(str(username), mtime)
+    if data is None:
+        data = dabopration.read_json_safe(path, default_content={})
+        _cache.put(str(username), mtime, data)
+    return data
+
+
+# --- db 后端 ---
+
+def _db_get_many(usernames):
+    from models import UserProfile
+    rows = UserProfile.query.filter(UserProfile.username.in_(list(usernames))).all()
+    return {row.username: row.data or {} for row in rows}
+
+
+def _db_save(username, data):
+    from models import db, UserProfile
+    try:
+        row = db.session.get(UserProfile, str(username))
+        if row is None:
+            row = UserProfile(username=str(username))
+            db.session.add(row)
+        row.data = data
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"Profile Save Error: {e}")
+        return False
+
+
+# --- 对外接口 (返回的都是副本，调用方随便改) ---
+
+def get_profile(username):
+    if _backend() == 'db':
+        return copy.deepcopy(_db_get_many([username]).get(str(username), {}))
+    return copy.deepcopy(_file_get(username))
+
+
+def get_profiles(usernames):
+    """批量读取，返回 {username: data}，没有资料的用户给空字典"""
+    usernames = [str(u) for u in usernames]
+    if _backend() == 'db':
+        found = _db_get_many(usernames) if usernames else {}
+        return {u: copy.deepcopy(found.get(u, {})) for u in usernames}
+    if len(usernames) >= PARALLEL_READ_THRESHOLD:
+        results = _get_read_pool().map(_file_get, usernames)
+    else:
+        results = map(_file_get, usernames)
+    return {u: copy.deepcopy(data) for u, data in zip(usernames, results)}
+
+
+def save_profile(username, data):
+    """整份覆盖保存"""
+    if _backend() == 'db':
+        ok = _db_save(username, data)
+    else:
+        ok = dabopration.write_json_safe(profile_path(username), data)
+        _cache.invalidate(str(username))
+    if ok:
+        _after_write(data.keys())
+    return ok
+
+
+def update_profile(username, changes):
+    """
+    并发安全的局部更新，返回 (是否成功, 更新后的完整资料)。
+    changes 可以是 dict (合并进去)，也可以是 transform(旧资料) -> 新资料 的函数。
+    file 后端走 dabopration.update_json 的 CAS 重试，不会和别的请求互相覆盖。
+    """
+    transform = changes if callable(changes) else (lambda data: {**data, **changes})
+
+    if _backend() == 'db':
+        from models import db, UserProfile
+        try:
+            row = UserProfile.query.filter_by(username=str(username)).with_for_update().first()
+            if row is None:
+                row = UserProfile(username=str(username), data={})
+                db.session.add(row)
+            data = transform(copy.deepcopy(row.data or {}))
+            row.data = data
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Profile Update Error: {e}")
+            return False, get_profile(username)
+    else:
+        try:
+            data = dabopration.update_json(profile_path(username), transform)
+        except Exception as e:
+            print(f"Profile Update Error: {e}")
+            return False, get_profile(username)
+        _cache.invalidate(str(username))
+
+    _after_write(data.keys())
+    return True, data
+
+
+def delete_profile(username):
+    """删除用户时调用 (file 后端的目录由调用方删)：清掉 db 后端的行和缓存"""
+    if _backend() == 'db':
+        from models import db, UserProfile
+        try:
+            UserProfile.query.filter_by(username=str(username)).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Profile Delete Error: {e}")
+    _cache.invalidate(str(username))
+    response_cache.invalidate(response_cache.TAG_ARTICLES)
+
+
+def list_usernames():
+    """所有有资料的用户名"""
+    if _backend() == 'db':
+        from models import UserProfile
+        return [row.username for row in UserProfile.query.with_entities(UserProfile.username)]
+    if not dabopration.USER_file.exists():
+        return []
+    return [d.name for d in dabopration.USER_file.iterdir() if d.is_dir()]
+
+
+_read_pool = None
+_read_pool_lock = threading.Lock()
+
+
+def _get_read_pool():
+    global _read_pool
+    with _read_pool_lock:
+        if _read_pool is None:
+            _read_pool = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix='profile-read')
+        return _read_pool
+
+
+# --- 列登记表 ---
+# Admin 表头需要“所有用户资料里出现过的字段”。原来每次请求扫一遍全部资料，
+# 现在登记在 USER_file/profile_columns.json 里：保存资料时出现新字段就追加，
+# 全员删列时移除；文件不存在时扫描一次重建。
+
+_columns_lock = threading.Lock()
+_columns_cache = {'mtime': None, 'columns': None}
+
+
+def _columns_path():
+    return dabopration.USER_file / COLUMNS_FILENAME
+
+
+def _load_columns():
+    """调用方需持有 _columns_lock"""
+    path = _columns_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    if mtime is None:
+        columns = set()
+        for username in list_usernames():
+            columns.update(get_profile(username).keys())
+        dabopration.write_json_safe(path, sorted(columns))
+        return columns
+
+    if _columns_cache['mtime'] != mtime:
+        _columns_cache['columns'] = set(dabopration.read_json_safe(path, default_content=[]))
+        _columns_cache['mtime'] = mtime
+    return set(_columns_cache['columns'])
+
+
+def get_columns():
+    """所有扩展字段名 (已排序)"""
+    with _columns_lock:
+        return sorted(_load_columns())
+
+
+def register_columns(keys):
+    keys = set(keys)
+    if not keys:
+        return
+    with _columns_lock:
+        if keys <= _load_columns():
+            return
+        # 多进程可能同时登记，用 CAS 合并，谁也不覆盖谁
+        dabopration.update_json(_columns_path(), lambda cols: sorted(set(cols) | keys))
+
+
+def _after_write(keys):
+    _register_after_write(keys)
+    # /search 的作者结果里有昵称 / 签名 / 主题色，缓存在 TAG_ARTICLES 下
+    response_cache.invalidate(response_cache.TAG_ARTICLES)
+
+
+def _register_after_write(keys):
+    """
+    资料写成功之后登记列名。登记表只是 Admin 表头用的索引，登记失败 (CAS 重试耗尽等) 不算保存失败：
+    把登记表删掉，下次 get_columns 时全量扫描重建。
+    """
+    try:
+        register_columns(keys)
+    except Exception as e:
+        print(f"Profile Columns Error: {e}")
+        with _columns_lock:
+            try:
+                os.remove(_columns_path())
+            except OSError:
+                pass
+            _columns_cache['mtime'] = None
+
+
+def unregister_column(key):
+    with _columns_lock:
+        if key not in _load_columns():
+            return
+        dabopration.update_json(_columns_path(), lambda cols: sorted(set(cols) - {key}))
+
+
+def cache_stats():
+    return _cache.stats()
+
+
+def import_files_to_db():
+    """把所有 extended_profile.json 导入 user_profile 表，返回导入条数"""
+    from models import db, UserProfile
+    count = 0
+    if not dabopration.USER_file.exists():
+        return count
+    for user_dir in dabopration.USER_file.iterdir():
+        if not user_dir.is_dir():
+            continue
+        data = dabopration.read_json_safe(user_dir / PROFILE_FILENAME, default_content={})
+        db.session.merge(UserProfile(username=user_dir.name, data=data))
+        count += 1
+    db.session.commit()
+    return count
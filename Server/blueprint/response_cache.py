@@ -0,0 +1,225 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, make_response, request
+
+try:
+    import redis  # 可选依赖，只有 RESPONSE_CACHE_BACKEND='redis' 时才需要
+except ImportError:
+    redis = None
+
+# --- 公共接口响应缓存 ---
+# 匿名访客看到的列表页 (画廊、文章列表、作者主页、搜索) 对所有人都一样，
+# 用 @response_cache.cached(tags=...) 把整份响应体缓存起来，key = 路由 + 路径 + 排序后的查询参数。
+#
+# 失效按标签 (tag) 做：每个标签有一个版本号，缓存 key 里带上所属标签的当前版本；
+# invalidate('articles') 只是把版本号 +1，旧 key 自然不再命中，等 TTL / LRU 淘汰。
+# 这样内存和 Redis 两种后端用同一套逻辑，不需要记录“某标签下有哪些 key”。
+#
+# 配置 (app.config)：
+#   RESPONSE_CACHE_BACKEND  'memory' (默认，进程内 LRU + TTL) / 'redis' / 'none' (关闭)
+#   RESPONSE_CACHE_URL      redis 地址，如 redis://127.0.0.1:6379/0 (任何兼容 Redis 协议的服务都行)
+#   RESPONSE_CACHE_TTL      默认过期秒数，默认 30
+#   RESPONSE_CACHE_SIZE     内存后端最多条目数，默认 1024
+# 注意：memory 后端的失效只在本进程内生效，多进程部署请用 redis 后端。
+
+DEFAULT_TTL = 30
+DEFAULT_SIZE = 1024
+KEY_PREFIX = 'rc:'
+
+TAG_ARTICLES = 'articles'
+TAG_PHOTOS = 'photos'
+
+
+class MemoryBackend:
+    """key -> (过期时间, value) 的 LRU，线程安全"""
+
+    def __init__(self, max_size=DEFAULT_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_counters(self, names):
+        with self._lock:
+            return [self._counters.get(name, 0) for name in names]
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+
+    def size(self):
+        with self._lock:
+            return len(self._data)
+
+
+class RedisBackend:
+    """兼容 Redis 协议的后端，多进程 / 多机共享缓存和标签版本"""
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND='redis' 需要先 pip install redis")
+        self._client = redis.Redis.from_url(url)
+
+    # 存成 b"<status> <mimetype>\n<body>"，不用 pickle，缓存服务里的数据不可信也没关系
+    def get(self, key):
+        value = self._client.get(KEY_PREFIX + key)
+        if value is None:
+            return None
+        head, _, body = value.partition(b'\n')
+        status, _, mimetype = head.decode('utf-8').partition(' ')
+        return body, int(status), mimetype
+
+    def set(self, key, value, ttl):
+        body, status, mimetype = value
+        self._client.set(KEY_PREFIX + key, f"{status} {mimetype}\n".encode('utf-8') + body, ex=max(1, int(ttl)))
+
+    def get_counters(self, names):
+        if not names:
+            return []
+        return [int(v or 0) for v in self._client.mget([KEY_PREFIX + 'tag:' + n for n in names])]
+
+    def incr(self, name):
+        self._client.incr(KEY_PREFIX + 'tag:' + name)
+
+    def size(self):
+        return None
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def get_counters(self, names):
+        return [0] * len(names)
+
+    def incr(self, name):
+        pass
+
+    def size(self):
+        return 0
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0, 'errors': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _build_backend(config):
+    kind = config.get('RESPONSE_CACHE_BACKEND', 'memory')
+    if kind == 'none':
+        return NullBackend()
+    if kind == 'redis':
+        return RedisBackend(config.get('RESPONSE_CACHE_URL', 'redis://127.0.0.1:6379/0'))
+    return MemoryBackend(config.get('RESPONSE_CACHE_SIZE', DEFAULT_SIZE))
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _build_backend(current_app.config)
+        return _backend
+
+
+def _make_key(tags, versions):
+    args = sorted(request.args.items(multi=True))
+    raw = f"{request.endpoint}|{request.path}|{args}|{list(zip(tags, versions))}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def cached(tags=(), ttl=None):
+    """
+    缓存整份 200 响应；只能用在和登录状态无关的公共接口上。
+    流式响应、非 200 响应不缓存。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                backend = get_backend()
+                key = _make_key(tags, backend.get_counters(list(tags)))
+                entry = backend.get(key)
+            except Exception as e:
+                # 缓存服务挂了不影响接口本身
+                print(f"[RESPONSE CACHE] lookup failed: {e}")
+                _count('errors')
+                return view(*args, **kwargs)
+
+            if entry is not None:
+                _count('hits')
+                body, status, mimetype = entry
+                response = make_response(body, status)
+                response.mimetype = mimetype
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            _count('misses')
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                try:
+                    expires = ttl if ttl is not None else current_app.config.get('RESPONSE_CACHE_TTL', DEFAULT_TTL)
+                    backend.set(key, (response.get_data(), response.status_code, response.mimetype), expires)
+                    _count('stores')
+                except Exception as e:
+                    print(f"[RESPONSE CACHE] store failed: {e}")
+                    _count('errors')
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate(*tags):
+    """让带这些标签的缓存全部失效 (写操作 commit 之后调用)"""
+    try:
+        backend = get_backend()
+        for tag in tags:
+            backend.incr(tag)
+            _count('invalidations')
+    except Exception as e:
+        print(f"[RESPONSE CACHE] invalidate {tags} failed: {e}")
+        _count('errors')
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    lookups = result['hits'] + result['misses']
+    result['hit_rate'] = round(result['hits'] / lookups, 4) if lookups else None
+    backend = get_backend()
+    result['backend'] = type(backend).__name__
+    try:
+        result['size'] = backend.size()
+    except Exception:
+        result['size'] = None
+    return result
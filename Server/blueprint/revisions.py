@@ -0,0 +1,191 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+
+# --- 文章正文修订历史 + 增量保存 ---
+# 增量保存：编辑器不必每次都把整篇 markdown 发上来，可以发
+#   {'id': 1, 'base_hash': <上次保存返回的 content_hash>, 'patch': [[start, end, text], ...]}
+# 表示把 base 正文的 [start, end) 替换成 text。位置是 Unicode 字符 (code point) 下标，
+# 都相对于 base 正文，按 start 升序且互不重叠。base_hash 对不上 (别处改过) 时 /save 返回 409，
+# 客户端改发完整 markdown 即可。
+#
+# 修订历史：正文每变一次记一个修订 (ArticleRevision)，按 seq 递增。
+#   - 每 SNAPSHOT_INTERVAL 个修订存一次完整快照 (zlib 压缩)，其余只存与上一个修订的差异 (同样是上面的 patch 格式)；
+#     恢复任意修订最多从快照往后应用 SNAPSHOT_INTERVAL - 1 个差异
+#   - COALESCE_SECONDS 内的连续保存 (自动保存) 合并进最后一个修订，不会每隔几秒多一行
+#   - 改版前就有的文章第一次修改时，先把旧正文记成快照，这样也能撤销第一次修改
+
+SNAPSHOT_INTERVAL = 20
+COALESCE_SECONDS = 120
+MAX_PATCH_OPS = 1000
+
+
+class PatchError(ValueError):
+    """补丁格式不对或位置越界"""
+
+
+def apply_patch(text, ops):
+    """把 ops 应用到 text 上，返回新正文"""
+    if not isinstance(ops, list) or len(ops) > MAX_PATCH_OPS:
+        raise PatchError('patch 必须是不超过 %d 项的列表' % MAX_PATCH_OPS)
+    parts = []
+    pos = 0
+    for op in ops:
+        if not isinstance(op, list) or len(op) != 3:
+            raise PatchError('patch 的每一项应为 [start, end, text]')
+        start, end, replacement = op
+        if type(start) is not int or type(end) is not int or not isinstance(replacement, str):
+            raise PatchError('patch 的每一项应为 [start, end, text]')
+        if not pos <= start <= end <= len(text):
+            raise PatchError('patch 位置越界或重叠')
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+
+def make_patch(old, new):
+    """按行比较 old / new，生成 apply_patch 能用的 ops"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    offsets = [0]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line))
+
+    ops = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            ops.append([offsets[i1], offsets[i2], ''.join(new_lines[j1:j2])])
+    return ops
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+# --- 读 ---
+
+def latest(article_id):
+    from models import ArticleRevision
+    return ArticleRevision.query.filter_by(article_id=article_id)\
+        .order_by(ArticleRevision.seq.desc()).first()
+
+
+def get(article_id, seq):
+    from models import ArticleRevision
+    return ArticleRevision.query.filter_by(article_id=article_id, seq=seq).first()
+
+
+def history(article_id, limit=50):
+    """最近的修订，新的在前 (不含正文)"""
+    from models import ArticleRevision
+    return ArticleRevision.query.filter_by(article_id=article_id)\
+        .order_by(ArticleRevision.seq.desc()).limit(limit).all()
+
+
+def iter_texts(batch_size=200):
+    """
+    所有修订里出现过的文本 (article_id, text)：快照是全文，差异是替换进去的那几行。
+    差异按整行生成，所以任何一个修订的每一行都完整出现在某段文本里，不用逐个重建全文
+    (图片回收靠它找出旧修订还在用的图)。
+    """
+    from models import db, ArticleRevision
+
+    rows = db.session.query(ArticleRevision.article_id, ArticleRevision.is_snapshot, ArticleRevision.data)
+    for article_id, is_snapshot, data in rows.yield_per(batch_size):
+        value = _unpack(data)
+        if is_snapshot:
+            yield article_id, value
+        else:
+            for _, _, text in value:
+                yield article_id, text
+
+
+def content_at(article_id, seq):
+    """重建某个修订的完整正文；修订不存在返回 None"""
+    from models import db, ArticleRevision
+
+    snapshot_seq = db.session.query(db.func.max(ArticleRevision.seq)).filter(
+        ArticleRevision.article_id == article_id,
+        ArticleRevision.is_snapshot.is_(True),
+        ArticleRevision.seq <= seq).scalar()
+    if snapshot_seq is None:
+        return None
+    chain = ArticleRevision.query.filter(
+        ArticleRevision.article_id == article_id,
+        ArticleRevision.seq.between(snapshot_seq, seq)).order_by(ArticleRevision.seq).all()
+    if not chain or chain[-1].seq != seq:
+        return None
+
+    text = None
+    for revision in chain:
+        text = _unpack(revision.data) if revision.is_snapshot else apply_patch(text, _unpack(revision.data))
+    return text
+
+
+# --- 写 (调用方负责 commit) ---
+
+def _add(article_id, seq, old_content, new_content, content_hash, now):
+    from models import db, ArticleRevision
+
+    is_snapshot = old_content is None or (seq - 1) % SNAPSHOT_INTERVAL == 0
+    revision = ArticleRevision(
+        article_id=article_id,
+        seq=seq,
+        is_snapshot=is_snapshot,
+        data=_pack(new_content if is_snapshot else make_patch(old_content, new_content)),
+        content_hash=content_hash,
+        size=len(new_content),
+        saved_at=now,
+    )
+    db.session.add(revision)
+    return revision
+
+
+def record(article_id, old_content, new_content, content_hash, old_hash=None, coalesce=True):
+    """
+    正文从 old_content 变成 new_content 后调用 (新文章 old_content 为 None)，返回对应的修订。
+    old_hash 是 old_content 的哈希，用来确认它就是最后一个修订的内容。
+    coalesce=False 时总是新加一个修订 (比如恢复旧修订，要能再撤销回来)。
+    """
+    from blueprint import md_render
+
+    new_content = new_content or ''
+    now = datetime.now()
+    prev = latest(article_id)
+
+    if prev is None:
+        if old_content is not None:
+            # 老文章第一次修改：先把修改前的正文存成快照
+            prev = _add(article_id, 1, None, old_content, old_hash or md_render.content_hash(old_content), now)
+        else:
+            return _add(article_id, 1, None, new_content, content_hash, now)
+    elif coalesce and now - prev.saved_at < timedelta(seconds=COALESCE_SECONDS):
+        # 连续保存：改写最后一个修订，而不是再加一个
+        if prev.is_snapshot:
+            prev.data = _pack(new_content)
+        else:
+            parent = content_at(article_id, prev.seq - 1)
+            prev.data = _pack(make_patch(parent, new_content))
+        prev.content_hash = content_hash
+        prev.size = len(new_content)
+        prev.saved_at = now
+        return prev
+
+    # 最后一个修订和当前正文对不上 (比如直接改过数据库)，这一个存成快照
+    if old_content is None or prev.content_hash != (old_hash or md_render.content_hash(old_content)):
+        old_content = None
+    return _add(article_id, prev.seq + 1, old_content, new_content, content_hash, now)
+
+
+def drop(article_id):
+    """删除文章时调用"""
+    from models import ArticleRevision
+    ArticleRevision.query.filter_by(article_id=article_id).delete(synchronize_session=False)
@@ -1,17 +1,19 @@
 import os
-from flask import Blueprint, request, jsonify, send_file, current_app
-from blueprint import dabopration
+from flask import Blueprint, request, jsonify, current_app
+from blueprint import dabopration, http_cache, media, pagination, profile_store, response_cache, search_index
 from models import db, Article, BlogUser, Photo
 
 search_bp = Blueprint('search_bp', __name__)
 
 # --- 1. 核心搜索接口 ---
 @search_bp.route('/search', methods=['GET'])
+@response_cache.cached(tags=(response_cache.TAG_ARTICLES,))
 def search_global():
-    search_type = request.args.get('type', 'title') # 'title' or 'author'
+    search_type = request.args.get('type', 'title') # 'title', 'fulltext' or 'author'
     query = request.args.get('q', '').strip()
-    offset = request.args.get('offset', 0, type=int)
     limit = 10
+    cursor = request.args.get('cursor') or None
+    offset = request.args.get('offset', 0, type=int)
 
     if not query:
         return jsonify({'status': 'error', 'message': 'Query empty'}), 400
@@ -22,24 +24,59 @@ def search_global():
     if search_type == 'title':
         # 1. 数据库模糊查询 (仅限已发布文章)
         # ilike 是不区分大小写的匹配
-        articles_query = Article.query.filter(Article.title.ilike(f'%{query}%'))\
-                                      .filter_by(status='published')\
-                                      .order_by(Article.created_at.desc())
+        articles_query = Article.summary_query().filter(Article.title.ilike(f'%{query}%'))\
+                                      .filter_by(status='published')
 
-        # 2. 分页处理
-        total = articles_query.count()
-        articles = articles_query.offset(offset).limit(limit).all()
+        # 2. 分页处理 (游标优先，兼容 offset；多取一行判断 has_more，不再 COUNT)
+        try:
+            articles, next_cursor = pagination.fetch_page(
+                articles_query, Article.created_at, Article.id, limit, cursor, offset)
+        except pagination.InvalidCursor as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
 
         # 3. 返回摘要数据
         return jsonify({
             'status': 'success',
             'type': 'title',
             'results': [a.to_summary_dict() for a in articles],
-            'has_more': (offset + limit) < total
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        })
+
+    # ==========================
+    # 模式 B: 全文检索 (标题 + 摘要 + 正文 + 标签，BM25 排序)
+    # ==========================
+    elif search_type == 'fulltext':
+        try:
+            hits, has_more = search_index.search(query, limit=limit, offset=offset)
+        except search_index.SearchIndexError as e:
+            print(f"Search Index Error: {e}")
+            return jsonify({'status': 'error', 'message': 'Full-text search unavailable'}), 503
+
+        # 索引只存 id 和高亮片段，展示用的摘要数据仍从主库取 (一次 IN 查询)
+        ids = [hit['id'] for hit in hits]
+        articles = Article.summary_query().filter(Article.id.in_(ids), Article.status == 'published').all() if ids else []
+        article_map = {a.id: a for a in articles}
+
+        results = []
+        for hit in hits:
+            article = article_map.get(hit['id'])
+            if not article:
+                continue
+            item = article.to_summary_dict()
+            item['score'] = hit['score']
+            item['highlight'] = {'title': hit['title'], 'snippet': hit['snippet']}
+            results.append(item)
+
+        return jsonify({
+            'status': 'success',
+            'type': 'fulltext',
+            'results': results,
+            'has_more': has_more
         })
 
     # ==========================
-    # 模式 B: 搜索作者
+    # 模式 C: 搜索作者
     # ==========================
 
     elif search_type == 'author':
@@ -65,14 +102,16 @@ def search_global():
             'gradientStop': 50
         }
 
+        # 一次取出所有命中用户的扩展资料 (走缓存/批量查询)
+        profiles = profile_store.get_profiles([user.username for user in users])
+
         for user in users:
-            # 2. 核心逻辑：结合数据库与 JSON 文件
-            # 数据库负责检索，JSON 负责提供展示细节 (motto, themeConfig)
+            # 2. 核心逻辑：结合数据库与扩展资料
+            # 数据库负责检索，扩展资料负责提供展示细节 (motto, themeConfig)
             username = user.username
-            json_path = dabopration.USER_file / str(username) / 'extended_profile.json'
 
-            # 安全读取 JSON，如果文件不存在返回空字典
-            profile_data = dabopration.read_json_safe(json_path, default_content={})
+            # 没有资料的用户得到空字典
+            profile_data = profiles.get(username, {})
 
             # 3. 获取邮箱 (优先用数据库里的，没有则用 JSON 里的占位)
 
@@ -102,55 +141,63 @@ def search_global():
 # 前端 SearchResult 卡片需要加载这个
 @search_bp.route('/author-background/<username>')
 def get_public_author_background(username):
-    try:
-        # 构造路径：USER_file/username/img/background.jpg
-        target_bg = dabopration.USER_file / str(username) / 'img' / 'background.jpg'
-
-        if target_bg.exists():
-            return send_file(target_bg, mimetype='image/jpeg')
-
-    except Exception as e:
-        print(f"Error fetching public bg: {e}")
-
-    # 失败则返回系统默认图
-    system_backup = dabopration.DB_CONFIG_PATH.parent / 'person_img' / 'default_bg.jpg'
-    return send_file(system_backup, mimetype='image/jpeg')
+    # USER_file/username/img/background.jpg，没有则返回系统默认图
+    resolved = media.user_image(username, 'background.jpg') or media.default_image('default_bg.jpg')
+    if resolved is None:
+        return "Background Not Found", 404
+    return media.send_negotiated(resolved, cache_control=media.CACHE_REVALIDATE, sniff=True)
 
 
 # --- 3. 公开作者空间 - 获取文章列表 (只读) ---
 # 用于点击作者卡片后跳转的页面
 @search_bp.route('/public-author/<username>/articles')
+@http_cache.conditional(http_cache.CACHE_PUBLIC_SHORT)
+@response_cache.cached(tags=(response_cache.TAG_ARTICLES,))
 def get_public_articles(username):
-    limit = request.args.get('limit', 16, type=int)
-    offset = request.args.get('offset', 0, type=int)
+    limit, cursor, offset = pagination.read_page_args(16)
 
     # 强制只查 published
-    query = Article.query.filter_by(user_id=username, status='published').order_by(Article.created_at.desc())
+    query = Article.summary_query().filter_by(user_id=username, status='published')
 
-    total = query.count()
-    articles = query.offset(offset).limit(limit).all()
+    try:
+        articles, next_cursor = pagination.fetch_page(query, Article.created_at, Article.id, limit, cursor, offset)
+    except pagination.InvalidCursor as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
 
     return jsonify({
         'status': 'success',
         'articles': [a.to_summary_dict() for a in articles],
-        'has_more': (offset + limit) < total
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
     })
 
 
 # --- 4. 公开作者空间 - 获取图片列表 (只读) ---
 @search_bp.route('/public-author/<username>/photos')
+@response_cache.cached(tags=(response_cache.TAG_PHOTOS,))
 def get_public_photos(username):
-    limit = request.args.get('limit', 16, type=int)
-    offset = request.args.get('offset', 0, type=int)
+    limit, cursor, offset = pagination.read_page_args(16)
 
     # 查询该用户所有图片
-    query = Photo.query.filter_by(user_id=username).order_by(Photo.uploaded_at.desc())
+    query = Photo.list_query().filter_by(user_id=username)
 
-    total = query.count()
-    photos = query.offset(offset).limit(limit).all()
+    try:
+        photos, next_cursor = pagination.fetch_page(query, Photo.uploaded_at, Photo.id, limit, cursor, offset)
+    except pagination.InvalidCursor as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
 
     return jsonify({
         'status': 'success',
         'photos': [p.to_dict() for p in photos],
-        'has_more': (offset + limit) < total
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
     })
+
+
+# --- 5. 重建全文索引 ---
+# 用法 (在 Server 目录下): flask --app mainServer search_bp rebuild-index
+@search_bp.cli.command('rebuild-index')
+def rebuild_search_index():
+    articles = Article.list_query().filter_by(status='published').yield_per(200)
+    count = search_index.rebuild(articles)
+    print(f"Search index rebuilt: {count} articles")
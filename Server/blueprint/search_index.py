@@ -0,0 +1,241 @@
+import html
+import os
+import re
+import sqlite3
+import threading
+from flask import current_app
+
+# --- 文章全文索引 (SQLite FTS5) ---
+# 独立的 search_index.db，放在 Flask instance 目录下，和主库解耦。
+# FTS5 自带的 unicode61 分词会把一整段中文当成一个词，没法搜，
+# 所以入库前先自己分词：中日韩文字切成二元组 (bigram)，英文数字按单词小写，
+# 再用空格拼起来交给 FTS5。查询时用同样的规则切词，中文按短语匹配连续的二元组。
+
+INDEX_FILENAME = 'search_index.db'
+
+# bm25 列权重：title, summary, body, tags
+BM25_WEIGHTS = (10.0, 4.0, 1.0, 6.0)
+
+SNIPPET_RADIUS = 60
+
+_CJK_RE = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(rf'([{_CJK_RE}]+)|([^\W_]+)')
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+class SearchIndexError(Exception):
+    """索引不可用 (比如 sqlite 没编译 FTS5)"""
+
+
+# --- 分词 ---
+
+def _split_runs(text):
+    """返回 [(is_cjk, run)]"""
+    runs = []
+    for cjk, word in _TOKEN_RE.findall(text or ''):
+        if cjk:
+            runs.append((True, cjk))
+        else:
+            runs.append((False, word.lower()))
+    return runs
+
+
+def _cjk_tokens(run):
+    if len(run) == 1:
+        return [run]
+    # 二元组 + 末尾单字，这样单字查询用前缀匹配也能命中每个字
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def tokenize(text):
+    tokens = []
+    for is_cjk, run in _split_runs(text):
+        tokens.extend(_cjk_tokens(run) if is_cjk else [run])
+    return ' '.join(tokens)
+
+
+def build_match_query(query):
+    """把用户输入转成 FTS5 MATCH 表达式，各词之间是 AND"""
+    parts = []
+    for is_cjk, run in _split_runs(query):
+        if is_cjk and len(run) == 1:
+            parts.append(f'"{run}"*')
+        elif is_cjk:
+            bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+            parts.append('"' + ' '.join(bigrams) + '"')
+        else:
+            parts.append(f'"{run}"*')
+    return ' '.join(parts)
+
+
+# --- Markdown 转纯文本 (只为索引和摘要片段，不追求完美) ---
+
+_MD_PATTERNS = [
+    (re.compile(r'```.*?```', re.S), ' '),           # 代码块
+    (re.compile(r'!\[([^\]]*)\]\([^)]*\)'), r'\1'),  # 图片保留 alt
+    (re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'),   # 链接保留文字
+    (re.compile(r'<[^>]+>'), ' '),                  # HTML 标签
+    (re.compile(r'^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+', re.M), ''),  # 标题/引用/列表标记
+    (re.compile(r'[*_~`]+'), ''),                   # 强调、行内代码
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def markdown_to_text(markdown):
+    text = markdown or ''
+    for pattern, repl in _MD_PATTERNS:
+        text = pattern.sub(repl, text)
+    return text.strip()
+
+
+# --- 连接与表结构 ---
+
+def get_index_path():
+    return os.path.join(current_app.instance_path, INDEX_FILENAME)
+
+
+def _get_conn():
+    path = get_index_path()
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10)
+        conns[path] = conn
+    if path not in _schema_ready:
+        _ensure_schema(conn, path)
+    return conn
+
+
+def _ensure_schema(conn, path):
+    with _schema_lock:
+        if path in _schema_ready:
+            return
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS article_fts "
+                "USING fts5(title, summary, body, tags, tokenize='unicode61 remove_diacritics 2')"
+            )
+        except sqlite3.OperationalError as e:
+            raise SearchIndexError(f'FTS5 不可用: {e}')
+        # 原文 (纯文本) 单独存一份，用来生成高亮片段
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS article_doc ("
+            "id INTEGER PRIMARY KEY, title TEXT, summary TEXT, body TEXT, tags TEXT)"
+        )
+        conn.commit()
+        _schema_ready.add(path)
+
+
+# --- 增删改 ---
+
+def _doc_fields(article):
+    return (
+        article.title or '',
+        article.summary or '',
+        markdown_to_text(article.content_md),
+        ' '.join(tag.name for tag in article.tags),
+    )
+
+
+def _write(conn, article):
+    title, summary, body, tags = _doc_fields(article)
+    conn.execute("DELETE FROM article_fts WHERE rowid = ?", (article.id,))
+    conn.execute(
+        "INSERT INTO article_fts (rowid, title, summary, body, tags) VALUES (?, ?, ?, ?, ?)",
+        (article.id, tokenize(title), tokenize(summary), tokenize(body), tokenize(tags))
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO article_doc (id, title, summary, body, tags) VALUES (?, ?, ?, ?, ?)",
+        (article.id, title, summary, body, tags)
+    )
+
+
+def index_article(article):
+    """保存文章后调用：已发布的写入索引，草稿从索引里移除"""
+    if article.status != 'published':
+        remove_article(article.id)
+        return
+    conn = _get_conn()
+    with conn:
+        _write(conn, article)
+
+
+def remove_article(article_id):
+    conn = _get_conn()
+    with conn:
+        conn.execute("DELETE FROM article_fts WHERE rowid = ?", (article_id,))
+        conn.execute("DELETE FROM article_doc WHERE id = ?", (article_id,))
+
+
+def rebuild(articles):
+    """清空后重建；articles 是所有已发布文章的可迭代对象"""
+    conn = _get_conn()
+    count = 0
+    with conn:
+        conn.execute("DELETE FROM article_fts")
+        conn.execute("DELETE FROM article_doc")
+        for article in articles:
+            _write(conn, article)
+            count += 1
+    conn.execute("INSERT INTO article_fts (article_fts) VALUES ('optimize')")
+    conn.commit()
+    return count
+
+
+# --- 查询 ---
+
+def _highlight(text, terms, radius=None):
+    """截取第一个命中附近的片段 (radius 为 None 时整段)，HTML 转义后用 <mark> 包住命中词"""
+    if not text:
+        return ''
+    lowered = text.lower()
+    hits = [lowered.find(t) for t in terms if t and lowered.find(t) >= 0]
+
+    if radius is not None:
+        first = min(hits) if hits else 0
+        start = max(0, first - radius)
+        end = min(len(text), first + radius * 2)
+        text = ('...' if start > 0 else '') + text[start:end] + ('...' if end < len(text) else '')
+
+    escaped = html.escape(text)
+    marks = sorted({html.escape(t) for t in terms if t}, key=len, reverse=True)
+    if not marks:
+        return escaped
+    pattern = re.compile('|'.join(re.escape(m) for m in marks), re.I)
+    return pattern.sub(lambda m: f'<mark>{m.group(0)}</mark>', escaped)
+
+
+def search(query, limit=10, offset=0):
+    """
+    返回 ([{'id', 'score', 'title', 'snippet'}], has_more)，按 BM25 相关度排序。
+    """
+    match = build_match_query(query)
+    if not match:
+        return [], False
+
+    conn = _get_conn()
+    weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+    rows = conn.execute(
+        f"SELECT f.rowid, bm25(article_fts, {weights}) AS score, d.title, d.summary, d.body "
+        "FROM article_fts f JOIN article_doc d ON d.id = f.rowid "
+        "WHERE article_fts MATCH ? ORDER BY score LIMIT ? OFFSET ?",
+        (match, limit + 1, offset)
+    ).fetchall()
+
+    terms = [run for _, run in _split_runs(query)]
+    hits = []
+    for article_id, score, title, summary, body in rows[:limit]:
+        source = body if any(t in (body or '').lower() for t in terms) else (summary or body)
+        hits.append({
+            'id': article_id,
+            'score': round(-score, 6),
+            'title': _highlight(title, terms),
+            'snippet': _highlight(source, terms, SNIPPET_RADIUS),
+        })
+    return hits, len(rows) > limit
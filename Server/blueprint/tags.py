@@ -0,0 +1,98 @@
+from collections import Counter
+from sqlalchemy import bindparam, func
+
+# --- 标签 ---
+# 保存文章时：
+#   upsert(names)     一条 INSERT ... ON CONFLICT DO NOTHING (MySQL 为 INSERT IGNORE) 建出缺的标签，
+#                     再一条 IN 查询取回，不再每个标签查一次
+#   adjust_counts()   按“保存前 / 保存后”是否已发布、带哪些标签算出差值，一条批量 UPDATE 更新 Tag.article_count
+# 计数漂移时 (比如并发保存同一篇文章) 用 recount() 一次性按 article_tags 重算。
+
+MAX_TAG_LENGTH = 50
+MAX_TAGS_PER_ARTICLE = 20
+
+
+def normalize(names):
+    """去空白、去重 (保持顺序)、截断长度和个数"""
+    result = []
+    for name in names or []:
+        if not isinstance(name, str):
+            continue
+        name = name.strip()[:MAX_TAG_LENGTH]
+        if name and name not in result:
+            result.append(name)
+    return result[:MAX_TAGS_PER_ARTICLE]
+
+
+def _dialect():
+    from models import db
+    return db.session.get_bind().dialect.name
+
+
+def _insert_ignore(table):
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing(index_elements=['name'])
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing(index_elements=['name'])
+    return table.insert().prefix_with('IGNORE')
+
+
+def upsert(names):
+    """确保这些标签都存在，按 names 的顺序返回 Tag 对象 (调用方负责 commit)"""
+    from models import db, Tag
+
+    names = normalize(names)
+    if not names:
+        return []
+    db.session.execute(_insert_ignore(Tag.__table__), [{'name': n, 'article_count': 0} for n in names])
+    by_name = {tag.name: tag for tag in Tag.query.filter(Tag.name.in_(names))}
+    return [by_name[n] for n in names]
+
+
+def adjust_counts(old_tag_ids, was_published, new_tag_ids, is_published):
+    """保存 / 删除文章后更新已发布文章计数 (调用方负责 commit)"""
+    from models import db, Tag
+
+    delta = Counter()
+    if was_published:
+        delta.subtract(set(old_tag_ids))
+    if is_published:
+        delta.update(set(new_tag_ids))
+    changes = [{'tid': tag_id, 'd': d} for tag_id, d in delta.items() if d]
+    if not changes:
+        return
+    table = Tag.__table__
+    new_count = table.c.article_count + bindparam('d')
+    # 不减到负数 (SQLite 的两参数 max 相当于 GREATEST)
+    new_count = func.max(new_count, 0) if _dialect() == 'sqlite' else func.greatest(new_count, 0)
+    stmt = table.update().where(table.c.id == bindparam('tid')).values(article_count=new_count)
+    db.session.execute(stmt, changes)
+
+
+def recount():
+    """按 article_tags 重新计算所有标签的已发布文章数"""
+    from models import db, Article, Tag, article_tags
+
+    counts = db.session.query(article_tags.c.tag_id, func.count())\
+        .join(Article, Article.id == article_tags.c.article_id)\
+        .filter(Article.status == 'published')\
+        .group_by(article_tags.c.tag_id)\
+        .subquery()
+    Tag.query.update(
+        {Tag.article_count: func.coalesce(
+            db.select(counts.c[1]).where(counts.c.tag_id == Tag.id).scalar_subquery(), 0)},
+        synchronize_session=False)
+    db.session.commit()
+
+
+def popular(limit=None):
+    """已发布文章数 > 0 的标签，按文章数倒序"""
+    from models import Tag
+
+    query = Tag.query.filter(Tag.article_count > 0).order_by(Tag.article_count.desc(), Tag.name)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
@@ -0,0 +1,147 @@
+import shutil
+from flask import Blueprint, request, jsonify, session
+from PIL import UnidentifiedImageError
+from werkzeug.exceptions import RequestEntityTooLarge
+from blueprint import blob_store, chunked_upload, md_picture, photo_bp
+
+# --- 分片 / 断点续传上传的接口 (协议说明见 chunked_upload.py) ---
+# kind 决定收齐之后放到哪里：
+#   photo  照片墙，和 /share-upload 一样放进 static/uploads/photos/YYYY/MM/，建 Photo 记录
+#   image  文章配图，和 /uploads/image 一样按内容哈希放进 uploads/blob/
+
+upload_bp = Blueprint('upload_bp', __name__)
+
+KIND_EXTENSIONS = {
+    'photo': photo_bp.ALLOWED_EXTENSIONS,
+    'image': md_picture.ALLOWED_EXTENSIONS,
+}
+
+
+def _error(e):
+    body = {'status': 'error', 'message': str(e)}
+    if e.received is not None:
+        body['received'] = e.received
+    return jsonify(body), e.status
+
+
+def _session_info(meta):
+    return {
+        'upload_id': meta['upload_id'],
+        'kind': meta['kind'],
+        'size': meta['size'],
+        'received': meta['received'],
+        'chunk_size': chunked_upload.chunk_size(),
+    }
+
+
+@upload_bp.app_errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """请求体超过 MAX_CONTENT_LENGTH"""
+    return jsonify({'status': 'error', 'message': '上传内容过大，请使用分片上传',
+                    'chunk_size': chunked_upload.chunk_size()}), 413
+
+
+@upload_bp.route('/upload-sessions', methods=['POST'])
+def create_upload_session():
+    """
+    建会话：{'kind': 'photo' | 'image', 'filename': 'a.jpg', 'size': 字节数,
+             'sha256': 整个文件的哈希 (可选，完成时校验), 'description': 照片描述 (photo 用)}
+    """
+    if 'user' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    filename = data.get('filename') or ''
+    if kind not in KIND_EXTENSIONS:
+        return jsonify({'status': 'error', 'message': 'kind 只能是 photo 或 image'}), 400
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if ext not in KIND_EXTENSIONS[kind]:
+        return jsonify({'status': 'error', 'message': 'Invalid file type'}), 400
+
+    extra = {}
+    if kind == 'photo':
+        extra['description'] = data.get('description') or 'Share beauty with you.'
+    try:
+        meta = chunked_upload.create(session['user'], kind, ext, data.get('size'), data.get('sha256'), extra)
+    except chunked_upload.UploadError as e:
+        return _error(e)
+    return jsonify(dict(_session_info(meta), status='success'))
+
+
+@upload_bp.route('/upload-sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """断点续传：查询已收到多少字节"""
+    if 'user' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    try:
+        meta = chunked_upload.load(upload_id, session['user'])
+    except chunked_upload.UploadError as e:
+        return _error(e)
+    return jsonify(dict(_session_info(meta), status='success'))
+
+
+@upload_bp.route('/upload-sessions/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """
+    上传一个分片：?offset=<从第几个字节开始>，请求体是原始字节；
+    可带 X-Chunk-SHA256 头校验这一片。offset 不对返回 409 和服务器上的 received。
+    """
+    if 'user' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'status': 'error', 'message': '缺少 offset'}), 400
+
+    try:
+        received = chunked_upload.write_chunk(upload_id, session['user'], offset, request.stream,
+                                              request.headers.get('X-Chunk-SHA256'))
+    except chunked_upload.UploadError as e:
+        return _error(e)
+    return jsonify({'status': 'success', 'upload_id': upload_id, 'received': received})
+
+
+@upload_bp.route('/upload-sessions/<upload_id>', methods=['DELETE'])
+def abort_upload_session(upload_id):
+    if 'user' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    try:
+        chunked_upload.abort(upload_id, session['user'])
+    except chunked_upload.UploadError as e:
+        return _error(e)
+    return jsonify({'status': 'success'})
+
+
+@upload_bp.route('/upload-sessions/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """收齐后放进正式存储，返回值和对应的普通上传接口一致"""
+    if 'user' not in session:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    try:
+        with chunked_upload.finish(upload_id, session['user']) as (meta, path):
+            return _store_completed(meta, path)
+    except chunked_upload.UploadError as e:
+        return _error(e)
+
+
+def _store_completed(meta, path):
+    """把收齐的 data 文件放进正式存储 (在会话锁里调用，结束后会话由 finish 删除)"""
+    try:
+        if meta['kind'] == 'photo':
+            new_photo = photo_bp.create_photo(meta['user'], meta['ext'], meta['extra'].get('description'),
+                                              lambda file_path: shutil.move(path, file_path))
+            return jsonify({'status': 'success', 'message': 'Uploaded', 'data': new_photo.to_dict()})
+
+        rel_path, created = blob_store.store_file(md_picture.UPLOAD_FOLDER, path)
+        print(f"[UPLOAD SUCCESS] {'Saved' if created else 'Deduplicated'}: {rel_path}")
+        name = rel_path.rsplit('/', 1)[1]
+        return jsonify({
+            "url": f"{md_picture.BACKEND_DOMAIN}/uploads/{rel_path}",
+            "alt": name,
+            "title": name
+        })
+    except UnidentifiedImageError:
+        return jsonify({'error': '无法识别的图片文件'}), 400
+    except Exception as e:
+        print(f"[UPLOAD ERROR] {e}")
+        return jsonify({'error': '服务器内部保存失败'}), 500
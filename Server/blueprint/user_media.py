@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import time
+from urllib.parse import quote
+from werkzeug.security import safe_join
+from blueprint import dabopration, image_opt
+
+# --- 头像 / 背景图的内存索引 ---
+# 列表页每张卡片原来都要请求一次 /get-author-avatar/<username> 和 /author-background/<username>，
+# 每次都在 Python 里 exists() 探测文件。现在由 /user-media 批量返回带内容哈希的 URL：
+#   /user-media/<username>/person_96.jpg?v=<hash>
+#   /default-media/none.jpg?v=<hash>          (没有自定义图的用户)
+# URL 随内容变化，浏览器 / CDN 可以按 immutable 长期缓存，也可以让 nginx 直接发 (见 media.py)。
+#
+# 索引内容：username -> {文件名: (mtime_ns, 内容哈希)}，只记存在的文件 (person.jpg、各尺寸小图、background.jpg)。
+# 每个文件的 v 都是它自己的内容哈希 (WebP / AVIF 和同名 JPEG 同时生成，跟着 JPEG 的版本走)。
+# 发文件时 (/user-media/...) 只有 v 和当前文件的版本一致才给 immutable，否则只给可验证的短缓存，
+# 旧链接、伪造的 v 都不会把当前内容钉在缓存里一年。
+# 上传头像 / 背景时 refresh()；其他进程上传的，最多 INDEX_TTL 秒后重新 stat 发现 (mtime 没变不重算哈希)。
+# 用户名来自请求体，谁都能随便发，所以索引是最多 INDEX_MAX_SIZE 条的 LRU，不会无限增长。
+
+INDEX_TTL = 60
+INDEX_MAX_SIZE = 5000
+VERSION_LENGTH = 12
+
+AVATAR_FILE = 'person.jpg'
+BACKGROUND_FILE = 'background.jpg'
+DEFAULT_AVATAR = 'none.jpg'
+DEFAULT_BACKGROUND = 'default_bg.jpg'
+KNOWN_FILES = (AVATAR_FILE, BACKGROUND_FILE) + tuple(f"{image_opt.avatar_name(size)}.jpg" for size in image_opt.AVATAR_SIZES)
+
+
+def _file_version(path, previous=None):
+    """
+    返回 (mtime_ns, 内容哈希前 12 位)；文件不存在返回 None。
+    previous 是上次的结果，mtime 没变就直接复用。
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if previous and previous[0] == mtime:
+        return previous
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return mtime, digest.hexdigest()[:VERSION_LENGTH]
+
+
+class UserMediaIndex:
+    def __init__(self, max_size=INDEX_MAX_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()   # username -> (检查时间, {文件名: (mtime_ns, 哈希)})
+        self._lock = threading.Lock()
+
+    def _put(self, username, checked_at, entry):
+        with self._lock:
+            self._entries[username] = (checked_at, entry)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _img_dir(username):
+        img_dir = safe_join(str(dabopration.USER_file), str(username), 'img')
+        return Path(img_dir) if img_dir is not None else None
+
+    def _probe(self, username, previous=None):
+        img_dir = self._img_dir(username)
+        if img_dir is None:
+            return {}
+        previous = previous or {}
+        files = {}
+        for name in KNOWN_FILES:
+            version = _file_version(img_dir / name, previous.get(name))
+            if version:
+                files[name] = version
+        return files
+
+    def get(self, username):
+        username = str(username)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(username)
+            if cached:
+                self._entries.move_to_end(username)
+        if cached and now - cached[0] < INDEX_TTL:
+            return cached[1]
+        entry = self._probe(username, cached[1] if cached else None)
+        self._put(username, now, entry)
+        return entry
+
+    def refresh(self, username):
+        """上传头像 / 背景后调用"""
+        username = str(username)
+        self._put(username, time.monotonic(), self._probe(username))
+
+    def current_version(self, username, filename):
+        """文件现在的版本号 (每次都 stat，mtime 没变就不重算哈希)；不存在或不是索引管的文件返回 None"""
+        img_dir = self._img_dir(username)
+        if filename not in KNOWN_FILES or img_dir is None:
+            return None
+        version = _file_version(img_dir / filename, self.get(username).get(filename))
+        return version[1] if version else None
+
+
+index = UserMediaIndex()
+
+_default_versions = {}   # filename -> (检查时间, 版本)
+_default_lock = threading.Lock()
+
+
+def default_version(filename):
+    """默认图的当前版本号 (INDEX_TTL 内复用上次的结果)"""
+    path = dabopration.DB_CONFIG_PATH.parent / 'person_img' / filename
+    now = time.monotonic()
+    with _default_lock:
+        cached = _default_versions.get(filename)
+        if cached and now - cached[0] < INDEX_TTL:
+            version = cached[1]
+        else:
+            version = _file_version(path, cached[1] if cached else None)
+            _default_versions[filename] = (now, version)
+    return version[1] if version else None
+
+
+def _default_url(filename):
+    version = default_version(filename)
+    if version is None:
+        return None
+    return f"/default-media/{filename}?v={version}"
+
+
+def urls_for(username, avatar_size=None):
+    """某个用户的头像 / 背景 URL (每个文件带自己的版本号)"""
+    files = index.get(username)
+    result = {'username': str(username)}
+    user_path = quote(str(username), safe='')
+
+    if AVATAR_FILE in files:
+        name = AVATAR_FILE
+        if avatar_size:
+            picked = image_opt.pick_avatar_size(avatar_size)
+            sized = f"{image_opt.avatar_name(picked)}.jpg" if picked else None
+            if sized in files:
+                name = sized
+        result['avatar'] = f"/user-media/{user_path}/{name}?v={files[name][1]}"
+        result['custom_avatar'] = True
+    else:
+        result['avatar'] = _default_url(DEFAULT_AVATAR)
+        result['custom_avatar'] = False
+
+    if BACKGROUND_FILE in files:
+        result['background'] = f"/user-media/{user_path}/{BACKGROUND_FILE}?v={files[BACKGROUND_FILE][1]}"
+        result['custom_background'] = True
+    else:
+        result['background'] = _default_url(DEFAULT_BACKGROUND)
+        result['custom_background'] = False
+    return result
@@ -0,0 +1,173 @@
+import atexit
+import glob
+import os
+import threading
+import time
+from collections import Counter
+
+try:
+    import fcntl  # 仅 POSIX；没有 fcntl (Windows 单进程开发) 时不加锁，直接重放所有旧日志
+except ImportError:
+    fcntl = None
+
+# --- 阅读数写缓冲 ---
+# /read-article 不再每次 views += 1 再 commit (读-改-写会丢计数，还要抢 SQLite 写锁)，
+# 而是在内存里累加，每隔 VIEW_FLUSH_INTERVAL 秒用一条批量
+#   UPDATE article SET views = views + :n WHERE id = :id
+# 写回数据库。
+#
+# 崩溃保护：每次计数同时追加一行 "<id> <n>" 到本进程的日志 views-<pid>.log (持有 flock)。
+# flush 时先把日志改名为 .flushing 再写库，写库成功后删除；
+# 进程启动时，把其他已经不在的进程留下的日志 (能拿到锁的) 重放进数据库。
+
+LOG_DIRNAME = 'view_logs'
+DEFAULT_FLUSH_INTERVAL = 5
+
+_app = None
+_lock = threading.Lock()
+_pending = Counter()
+_log = None          # 当前日志文件对象
+_log_path = None
+_started = False
+
+
+def _lock_file(f, blocking=True):
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return True
+    except OSError:
+        return False
+
+
+def _log_dir():
+    return os.path.join(_app.instance_path, LOG_DIRNAME)
+
+
+def _open_log():
+    global _log, _log_path
+    _log_path = os.path.join(_log_dir(), f"views-{os.getpid()}.log")
+    _log = open(_log_path, 'a', encoding='utf-8')
+    _lock_file(_log)
+
+
+def init_app(app):
+    global _app, _started
+    _app = app
+    if _started:
+        return
+    _started = True
+
+    os.makedirs(_log_dir(), exist_ok=True)
+    # 先重放再开自己的日志：容器里重启后 pid 可能和上次一样，同名旧日志也要重放
+    recover()
+    _open_log()
+
+    interval = app.config.get('VIEW_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    threading.Thread(target=_flush_loop, args=(interval,), name='view-counter-flush', daemon=True).start()
+    atexit.register(flush)
+
+
+def record(article_id, n=1):
+    """记一次阅读 (只写内存和追加日志，不碰数据库)"""
+    with _lock:
+        _pending[article_id] += n
+        if _log is not None:
+            _log.write(f"{article_id} {n}\n")
+            _log.flush()
+
+
+def pending(article_id):
+    """还没写回数据库的增量，给 to_dict 拼实时总数"""
+    return _pending.get(article_id, 0)
+
+
+def _apply(counts):
+    """把 {article_id: n} 一次性原子加到数据库"""
+    from sqlalchemy import bindparam, func
+    from models import db, Article
+
+    if not counts:
+        return
+    table = Article.__table__
+    stmt = table.update()\
+        .where(table.c.id == bindparam('aid'))\
+        .values(views=func.coalesce(table.c.views, 0) + bindparam('n'))
+    with _app.app_context():
+        try:
+            db.session.execute(stmt, [{'aid': aid, 'n': n} for aid, n in counts.items()])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def flush():
+    """把内存里的增量写回数据库"""
+    global _log
+    with _lock:
+        if not _pending:
+            return
+        batch = dict(_pending)
+        _pending.clear()
+
+        # 轮换日志：旧日志改名后继续持有 (锁不放)，直到写库成功
+        old_log = _log
+        flushing_path = f"{_log_path}.{int(time.time() * 1000)}.flushing"
+        if old_log is not None:
+            os.replace(_log_path, flushing_path)
+            _open_log()
+
+    try:
+        _apply(batch)
+    except Exception as e:
+        print(f"[VIEWS] flush failed, will retry: {e}")
+        with _lock:
+            # 计数放回内存，同时写进新日志，旧日志作废
+            _pending.update(batch)
+            if _log is not None:
+                _log.write(''.join(f"{aid} {n}\n" for aid, n in batch.items()))
+                _log.flush()
+    finally:
+        if old_log is not None:
+            os.remove(flushing_path)
+            old_log.close()
+
+
+def _flush_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception as e:
+            print(f"[VIEWS] flush loop error: {e}")
+
+
+def _read_counts(path):
+    counts = Counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+                counts[int(parts[0])] += int(parts[1])
+    return counts
+
+
+def recover():
+    """重放已退出进程留下的日志"""
+    for path in glob.glob(os.path.join(_log_dir(), 'views-*')):
+        if path == _log_path:
+            continue
+        try:
+            with open(path, 'r+', encoding='utf-8') as f:
+                if not _lock_file(f, blocking=False):
+                    continue  # 对应进程还活着
+                if not os.path.exists(path):
+                    continue  # 拿锁期间被原进程处理掉了
+                counts = _read_counts(path)
+                _apply(counts)
+                os.remove(path)
+                print(f"[VIEWS] recovered {sum(counts.values())} views from {os.path.basename(path)}")
+        except Exception as e:
+            print(f"[VIEWS] recover {path} failed: {e}")
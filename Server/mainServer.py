@@ -8,6 +8,8 @@ from blueprint.admin import admin_bp
 from blueprint.manage_bp import manage_bp
 from blueprint.photo_bp import photo_bp
 from blueprint.search_bp import search_bp
+from blueprint.upload_bp import upload_bp
+from blueprint import admin_jobs, dabopration, db_engine, media, migrations, password_hasher, photo_jobs, view_counter
 from models import db
 
 app = Flask(__name__)
@@ -24,17 +26,64 @@ app.register_blueprint(mdfile_bp)
 app.register_blueprint(admin_bp)
 app.register_blueprint(photo_bp)
 app.register_blueprint(search_bp)
+app.register_blueprint(upload_bp)
 app.config['PERMANENT_SESSION_LIFETIME'] = 360000
 app.config['SESSION_PERMANENT'] = True
 
-# 数据库配置 (使用 SQLite)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///blog.db'
+# 数据库配置 (默认 SQLite，开 WAL，读写分两个连接池；详见 blueprint/db_engine.py)
+# 换成 MySQL / PostgreSQL 时改 DATABASE_URL，有只读副本再填 DATABASE_READ_URL
+app.config['DATABASE_URL'] = 'sqlite:///blog.db'
+app.config['DATABASE_READ_URL'] = None
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# 用户扩展资料存储: 'file' (每人一个 extended_profile.json) 或 'db' (user_profile 表)
+app.config['PROFILE_BACKEND'] = 'file'
+
+# 公共列表接口的响应缓存: 'memory' (进程内) / 'redis' (多进程共享，需 pip install redis) / 'none'
+app.config['RESPONSE_CACHE_BACKEND'] = 'memory'
+app.config['RESPONSE_CACHE_URL'] = 'redis://127.0.0.1:6379/0'
+app.config['RESPONSE_CACHE_TTL'] = 30
+
+# 图片交给前端代理发送: None (Python 直接发) / 'x-accel' (nginx) / 'x-sendfile' (apache)
+# x-accel 需要把本地目录映射到 nginx 的 internal location，详见 blueprint/media.py
+app.config['MEDIA_OFFLOAD'] = None
+app.config['MEDIA_ACCEL_ROOTS'] = {}
+
+# 启动时自动执行未执行的结构迁移 (加列 / 加索引)，也可以关掉后手动: flask --app mainServer migrate upgrade
+app.config['AUTO_MIGRATE'] = True
+
+# 上传限制：单个请求体超过 MAX_CONTENT_LENGTH 直接 413；更大的文件走分片上传 (见 blueprint/chunked_upload.py)
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['UPLOAD_CHUNK_SIZE'] = 4 * 1024 * 1024
+app.config['UPLOAD_MAX_FILE_SIZE'] = 100 * 1024 * 1024
+app.config['UPLOAD_SESSION_TTL'] = 24 * 3600
+
+# 密码哈希 (bcrypt) 进程池，见 blueprint/password_hasher.py
+# PASSWORD_WORKERS: 进程数 (None 为 CPU 核数的一半，0 为在请求线程里算)
+# PASSWORD_MAX_PENDING: 同时排队 + 计算的上限 (None 为进程数 x 4)，满了等 PASSWORD_QUEUE_TIMEOUT 秒后返回 503
+# BCRYPT_ROUNDS: 改大后老密码在下次登录时自动升级
+app.config['PASSWORD_WORKERS'] = None
+app.config['PASSWORD_MAX_PENDING'] = None
+app.config['PASSWORD_QUEUE_TIMEOUT'] = 2
+app.config['BCRYPT_ROUNDS'] = 12
+
+# 阅读数每隔多少秒批量写回数据库
+app.config['VIEW_FLUSH_INTERVAL'] = 5
+
+db_engine.configure(app)
 db.init_app(app)
+db_engine.init_app(app, db)  # SQLite PRAGMA
+dabopration.init_app(app)  # 请求结束时归还 MySQL 连接
+photo_jobs.init_app(app)   # 照片衍生图后台进程池
+password_hasher.init_app(app)  # bcrypt 进程池
+media.init_app(app)        # 图片发送方式 (X-Sendfile / X-Accel-Redirect)
 
 with app.app_context():
     db.create_all()
+migrations.init_app(app)   # create_all 不会改已有的表，靠迁移补上
+
+admin_jobs.init_app(app)   # 后台批量任务，启动时恢复上次中断的任务
+view_counter.init_app(app) # 阅读数写缓冲，启动时重放上次没写回的计数
 
 if __name__ == '__main__':
     app.run(host='::', port=5000)
@@ -1,12 +1,18 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import defer, deferred, joinedload, selectinload
 from datetime import datetime
+import json
+from blueprint import db_engine, view_counter
 
-db = SQLAlchemy()
+# 普通查询走读库、写操作走写库，见 blueprint/db_engine.py
+db = SQLAlchemy(session_options={'class_': db_engine.RoutingSession})
 
 # 关联表：文章和标签的多对多关系
 article_tags = db.Table('article_tags',
     db.Column('article_id', db.Integer, db.ForeignKey('article.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    # 主键 (article_id, tag_id) 只能按文章查标签；按标签查文章走这个反向索引
+    db.Index('ix_article_tags_tag_article', 'tag_id', 'article_id')
 )
 
 
@@ -20,6 +26,14 @@ class BlogUser(db.Model):
     articles = db.relationship('Article', backref='author_info', lazy=True)
 
 class Article(db.Model):
+    # 列表接口的访问模式：按状态 / 作者过滤，按时间倒序 + id 做游标分页
+    __table_args__ = (
+        db.Index('ix_article_status_updated', 'status', 'updated_at', 'id'),    # 公开列表
+        db.Index('ix_article_status_created', 'status', 'created_at', 'id'),    # 标题搜索
+        db.Index('ix_article_user_status_created', 'user_id', 'status', 'created_at', 'id'),  # 作者主页
+        db.Index('ix_article_user_updated', 'user_id', 'updated_at'),           # 我的文章
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(50), db.ForeignKey('blog_user.username'), nullable=False)
     # user_id = db.Column(db.String(50), nullable=False) # 对应 session['user']
@@ -30,28 +44,41 @@ class Article(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.now)#, onupdate=datetime.now)
     views = db.Column(db.Integer, default=0)
     summary = db.Column(db.String(500), nullable=True)
+    # 以下都是保存时从 content_md 算出来的 (见 blueprint/md_render.py)，列表查询只读这些，不碰 content_md
     cover_image = db.Column(db.String(500), nullable=True)
+    content_preview = db.Column(db.String(200), nullable=True)   # 去掉 Markdown 语法的正文前 150 字
+    word_count = db.Column(db.Integer, nullable=True)
+    reading_minutes = db.Column(db.Integer, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)       # 判断保存时正文有没有变
+    render_version = db.Column(db.Integer, nullable=True)        # 与 md_render.RENDERER_VERSION 不同时需重渲染
+    # 大字段，只有 ?format=html 读详情时才加载
+    content_html = deferred(db.Column(db.Text, nullable=True), group='rendered')
+    toc = deferred(db.Column(db.Text, nullable=True), group='rendered')      # JSON
+    images = deferred(db.Column(db.Text, nullable=True), group='rendered')   # JSON
+    links = deferred(db.Column(db.Text, nullable=True), group='rendered')    # JSON
     # 关系
     tags = db.relationship('Tag', secondary=article_tags, backref=db.backref('articles', lazy='dynamic'))
 
-    def to_dict(self):
-        display_name = self.author_info.nickname if self.author_info and self.author_info.nickname else self.user_id
-        return {
-            'id': self.id,
-            'title': self.title,
-            'content': self.content_md,
-            'status': self.status,
-            'date': self.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'views': self.views,
-            'author': self.user_id,
-            'author_username': self.user_id,
-            'author_nickname': display_name,
-            'cover_image': self.cover_image,
-            'tags': [tag.name for tag in self.tags]
+    @classmethod
+    def list_query(cls):
+        """
+        列表接口统一用这个查询入口：作者用 JOIN 一起带出，标签用一条 IN 查询批量加载。
+        一页不管多少篇文章，序列化时都不会再逐行懒加载 author_info / tags (避免 N+1)。
+        """
+        return cls.query.options(joinedload(cls.author_info), selectinload(cls.tags))
+
+    @classmethod
+    def summary_query(cls):
+        """给 to_summary_dict 用的列表查询：在 list_query 基础上不取 content_md 大字段"""
+        return cls.list_query().options(defer(cls.content_md))
+
+    @property
+    def total_views(self):
+        """数据库里的阅读数 + 本进程还没写回的增量"""
+        return (self.views or 0) + view_counter.pending(self.id)
 
-        }
     def to_summary_dict(self):
-        preview_text = self.summary if self.summary else (self.content_md[:150] + '...' if self.content_md else '')
+        preview_text = self.summary if self.summary else (self.content_preview + '...' if self.content_preview else '')
         display_name = self.author_info.nickname if self.author_info and self.author_info.nickname else self.user_id
         return {
             'id': self.id,
@@ -60,36 +87,139 @@ class Article(db.Model):
             'preview': preview_text,
             'status': self.status,
             'date': self.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'views': self.views,
+            'views': self.total_views,
             'author': self.user_id,
             'author_nickname': display_name,
             'author_username': self.user_id, # 原始用户名，用于拼头像链接
             'cover_image': self.cover_image,
+            'word_count': self.word_count,
+            'reading_minutes': self.reading_minutes,
             'tags': [tag.name for tag in self.tags]
         }
+
+    def to_rendered_dict(self):
+        """详情的 HTML 版本：不带 content (Markdown)，带渲染好的 html / toc / 图片 / 链接 / 字数 / 阅读时长"""
+        from blueprint import md_render
+        data = self._detail_fields()
+        data.update(md_render.rendered_fields(self))
+        return data
+
     def to_dict(self):
+        data = self._detail_fields()
+        data['content'] = self.content_md
+        return data
+
+    def _detail_fields(self):
+        """详情里除正文之外的字段 (不碰 content_md，HTML 版本查询时把它 defer 掉了)"""
         display_name = self.author_info.nickname if self.author_info and self.author_info.nickname else self.user_id
         return {
             'id': self.id,
             'title': self.title,
-            'content': self.content_md,
             'excerpt': self.summary,
             'status': self.status,
             'date': self.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'views': self.views,
+            'views': self.total_views,
             'author': self.user_id,
             'author_username': self.user_id,
             'author_nickname': display_name,
             'tags': [tag.name for tag in self.tags]
         }
+class SchemaMigration(db.Model):
+    """已执行过的结构迁移 (见 blueprint/migrations.py)"""
+    __tablename__ = 'schema_migration'
+    id = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class UserProfile(db.Model):
+    """extended_profile 的数据库后端 (PROFILE_BACKEND = 'db' 时使用)，一人一行，资料整体存 JSON"""
+    __tablename__ = 'user_profile'
+    username = db.Column(db.String(50), primary_key=True)
+    data = db.Column(db.JSON, nullable=False, default=dict)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class AdminJob(db.Model):
+    """后台批量任务 (全员加列/删列)，进度落库，进程崩溃后可以从 cursor 处继续"""
+    __tablename__ = 'admin_job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)          # 'add_column' / 'delete_column'
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), default='queued')      # queued / running / done / failed
+    total = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    changed = db.Column(db.Integer, default=0)
+    cursor = db.Column(db.String(50), nullable=True)         # 已处理到的用户名 (按字典序)
+    failures = db.Column(db.JSON, nullable=False, default=dict)  # {username: 错误信息}
+    heartbeat = db.Column(db.DateTime, nullable=True)        # 执行者定期刷新，超时说明进程挂了
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'changed': self.changed,
+            'progress': round(self.processed / self.total * 100, 1) if self.total else (100.0 if self.status == 'done' else 0.0),
+            'failures': self.failures or {},
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+
+
+class ImageRef(db.Model):
+    """文章正文里引用了哪些上传图片 (路径相对 uploads/)，保存文章时同步；某张图的引用数 = 行数"""
+    __tablename__ = 'image_ref'
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id'), primary_key=True)
+    path = db.Column(db.String(255), primary_key=True, index=True)
+
+
+class ArticleRevision(db.Model):
+    """文章正文的修订历史 (见 blueprint/revisions.py)：定期存完整快照，其余存与上一个修订的差异"""
+    __tablename__ = 'article_revision'
+    __table_args__ = (
+        db.UniqueConstraint('article_id', 'seq', name='uq_article_revision_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)                   # 每篇文章内从 1 递增
+    is_snapshot = db.Column(db.Boolean, nullable=False, default=False)
+    data = db.Column(db.LargeBinary, nullable=False)              # zlib 压缩的 JSON：快照是全文，否则是差异
+    content_hash = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, nullable=False)                  # 全文字符数
+    saved_at = db.Column(db.DateTime, default=datetime.now)
+
+    def to_dict(self):
+        return {
+            'revision': self.seq,
+            'content_hash': self.content_hash,
+            'size': self.size,
+            'saved_at': self.saved_at.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
+    # 带这个标签的已发布文章数，保存 / 删除文章时增量维护 (校正: flask --app mainServer mdfile recount-tags)
+    article_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def to_dict(self):
+        return {'name': self.name, 'count': self.article_count}
 
 
 
 class Photo(db.Model):
     __tablename__ = 'photo'
+    __table_args__ = (
+        db.Index('ix_photo_uploaded', 'uploaded_at', 'id'),                 # 公共画廊
+        db.Index('ix_photo_user_uploaded', 'user_id', 'uploaded_at', 'id'), # 我的图片 / 作者主页
+    )
     id = db.Column(db.Integer, primary_key=True)
     # 关联用户：使用的是 username (对应 session['user'])
     user_id = db.Column(db.String(50), db.ForeignKey('blog_user.username'), nullable=False)
@@ -101,17 +231,35 @@ class Photo(db.Model):
     description = db.Column(db.String(500), default="Share beauty with you.")
     uploaded_at = db.Column(db.DateTime, default=datetime.now)
 
+    # 后台生成缩略图/多尺寸图的状态: 'pending' / 'ready' / 'failed' (老数据为 NULL)
+    status = db.Column(db.String(20), default='pending')
+    # 衍生图信息 JSON: {"width":..,"height":..,"sizes":[{"w":320,"jpeg":"2024/05/x_320.jpg","webp":"..."}]}
+    derivatives = db.Column(db.Text, nullable=True)
+
     # 关联关系
     author_info = db.relationship('BlogUser', backref=db.backref('photos', lazy=True))
 
+    @classmethod
+    def list_query(cls):
+        """图片列表同理：作者昵称随主查询 JOIN 带出"""
+        return cls.query.options(joinedload(cls.author_info))
+
     def to_dict(self):
         # 你的用户模型里 nickname 是可选的，所以做个 fallback
         display_name = self.author_info.nickname if self.author_info and self.author_info.nickname else self.user_id
 
+        # 响应式图片：<img srcset> 用 JPEG，<picture><source type="image/webp"> 用 WebP
+        sizes = json.loads(self.derivatives).get('sizes', []) if self.derivatives else []
+        srcset = ', '.join(f"/static/uploads/photos/{s['jpeg']} {s['w']}w" for s in sizes)
+        srcset_webp = ', '.join(f"/static/uploads/photos/{s['webp']} {s['w']}w" for s in sizes)
+
         return {
             'id': self.id,
             'src': f"/static/uploads/photos/{self.filename}",         # 原图 URL (前端直接用)
             'thumb': f"/static/uploads/photos/{self.thumb_filename}" if self.thumb_filename else f"/static/uploads/photos/{self.filename}",
+            'srcset': srcset,
+            'srcset_webp': srcset_webp,
+            'status': self.status or 'ready',
             'date': self.uploaded_at.strftime('%Y-%m-%d'),
             'full_date': self.uploaded_at.strftime('%Y-%m-%d %H:%M:%S'),
             'desc': self.description,
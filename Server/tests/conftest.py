@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+# 和 mainServer 一样以 Server 目录为根导入 (models、blueprint)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from blueprint import db_engine, migrations  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    只带数据库的最小 app：SQLite 库放在临时 instance 目录里，
+    按 mainServer 的顺序配置引擎 (WAL、读写分离)、建表、执行迁移，不注册蓝图、不碰正式数据
+    """
+    app = Flask('blog_test', instance_path=str(tmp_path))
+    app.config['TESTING'] = True
+    app.config['DATABASE_URL'] = 'sqlite:///blog.db'
+    db_engine.configure(app)
+    db.init_app(app)
+    db_engine.init_app(app, db)
+    with app.app_context():
+        db.create_all()
+    migrations.init_app(app)
+
+    with app.app_context():
+        yield app
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def count_queries(app):
+    """返回一个列表，之后在读写两个引擎上执行的每条 SQL 都追加进去"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', record)
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from blueprint import pagination
+from models import db, Article, BlogUser, Photo, Tag
+
+ROWS = 12
+PAGE = 10
+
+
+@pytest.fixture
+def seeded(app):
+    """两个作者、每篇文章两个标签、一批照片：懒加载的话查询数会随行数增长"""
+    authors = [BlogUser(username='alice', nickname='Alice'), BlogUser(username='bob')]
+    tags = [Tag(name=f'tag{i}') for i in range(3)]
+    db.session.add_all(authors + tags)
+    start = datetime(2025, 1, 1)
+    for i in range(ROWS):
+        db.session.add(Article(user_id=authors[i % 2].username, title=f'post {i}', content_md='body',
+                               status='published', updated_at=start + timedelta(minutes=i),
+                               tags=[tags[i % 3], tags[(i + 1) % 3]]))
+        db.session.add(Photo(user_id=authors[i % 2].username, filename=f'{i}.jpg',
+                             uploaded_at=start + timedelta(minutes=i)))
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def test_article_page_is_two_queries(seeded, count_queries):
+    """一页文章摘要：主查询 (JOIN 作者) + 一条 IN 查询取标签，和页大小无关"""
+    articles, next_cursor = pagination.fetch_page(
+        Article.summary_query().filter_by(status='published'), Article.updated_at, Article.id, PAGE)
+    payload = [a.to_summary_dict() for a in articles]
+
+    assert len(payload) == PAGE and next_cursor
+    assert {item['author_nickname'] for item in payload} == {'Alice', 'bob'}
+    assert all(len(item['tags']) == 2 for item in payload)
+    assert len(count_queries) == 2, count_queries
+
+
+def test_article_detail_dicts_are_two_queries(seeded, count_queries):
+    articles = Article.list_query().order_by(Article.id).limit(PAGE).all()
+    payload = [a.to_dict() for a in articles]
+
+    assert all(item['content'] == 'body' for item in payload)
+    assert len(count_queries) == 2, count_queries
+
+
+def test_photo_page_is_one_query(seeded, count_queries):
+    photos, next_cursor = pagination.fetch_page(Photo.list_query(), Photo.uploaded_at, Photo.id, PAGE)
+    payload = [p.to_dict() for p in photos]
+
+    assert len(payload) == PAGE and next_cursor
+    assert {item['author'] for item in payload} == {'Alice', 'bob'}
+    assert len(count_queries) == 1, count_queries
+
+
+def test_rendered_detail_skips_content_md(seeded, count_queries):
+    """?format=html 的详情：content_md 被 defer 掉，序列化时不能再懒加载回来"""
+    from sqlalchemy.orm import defer, undefer_group
+    from blueprint import md_render
+
+    for article in Article.query.all():
+        md_render.apply(article)
+    db.session.commit()
+    db.session.expunge_all()
+    count_queries.clear()
+
+    article = Article.list_query().options(defer(Article.content_md), undefer_group('rendered'))\
+        .filter_by(id=1).first()
+    payload = article.to_rendered_dict()
+
+    assert 'content' not in payload and payload['html']
+    assert len(count_queries) == 2, count_queries
@@ -0,0 +1,18 @@
+from blueprint import migrations
+
+
+def test_list_queries_use_indexes(app):
+    """迁移后的新库上，列表查询都不应该全表扫描或额外排序 (和 migrate check-plans 同一套检查)"""
+    problems = migrations.check_plans()
+    assert problems == [], '\n'.join(f'{name}: {problem}' for name, problem, _ in problems)
+
+
+def test_check_plans_catches_missing_index(app):
+    """删掉画廊的复合索引后应当报出来，确认检查本身有效"""
+    from sqlalchemy import text
+    from models import db
+
+    db.session.execute(text('DROP INDEX ix_photo_uploaded'))
+    db.session.commit()
+
+    assert 'gallery' in {name for name, _, _ in migrations.check_plans()}